@@ -1,43 +1,179 @@
+import logging
+
 from typer import Typer
 
-from commands.init_database.main import init_database
-from commands.init_database.sqlite_main import init_sqlite_database
-from commands.run_tests.main import run_tests
-from commands.import_data.main import import_data
-from commands.import_data.sqlite_main import import_books_from_csv_sqlite
+# Command implementations are imported inside each command so that running
+# one command does not import SQLAlchemy, the models and every other command.
 
 app = Typer()
+logger = logging.getLogger("cli")
+
+
+@app.callback()
+def configure():
+    from src.utils.structured_logging import configure_logging
+
+    configure_logging()
+
+
+@app.command("serve")
+def cmd_serve(reload: bool = False):
+    import uvicorn
+
+    from settings import APP_HOST, APP_PORT, APP_WORKERS, settings
+
+    logger.info("Serving on %s:%d with %d worker(s) (%s profile)",
+                APP_HOST, APP_PORT, APP_WORKERS, settings.APP_PROFILE or "no")
+    uvicorn.run("main:app", host=APP_HOST, port=APP_PORT, workers=1 if reload else APP_WORKERS, reload=reload)
+
+
+@app.command("show_settings")
+def cmd_show_settings():
+    from settings import settings
+
+    for name, value in settings.redacted().items():
+        logger.info("%s=%s", name, value, extra={"setting": name})
 
 
 @app.command("init_database")
 def cmd_init_database():
-    print("Initializing PostgreSQL database")
+    from commands.init_database.main import init_database
+
+    logger.info("Initializing PostgreSQL database")
     init_database()
 
 
 @app.command("init_sqlite")
 def cmd_init_sqlite():
-    print("Initializing SQLite database")
+    from commands.init_database.sqlite_main import init_sqlite_database
+
+    logger.info("Initializing SQLite database")
     init_sqlite_database()
 
 
+@app.command("migrate")
+def cmd_migrate(backend: str = "postgres", target: int = None, dry_run: bool = False):
+    from commands.migrate.main import migrate
+
+    logger.info("Migrating %s schema", backend)
+    migrate(backend=backend, target=target, dry_run=dry_run)
+
+
+@app.command("migrate_status")
+def cmd_migrate_status(backend: str = "postgres"):
+    from commands.migrate.main import show_migration_status
+
+    show_migration_status(backend=backend)
+
+
 @app.command("run_test")
 def cmd_run_test():
-    print("Running tests")
+    from commands.run_tests.main import run_tests
+
+    logger.info("Running tests")
     run_tests()
 
 
 @app.command("import_data")
 def cmd_import_data():
-    print("Importing data from CSV to PostgreSQL")
+    from commands.import_data.main import import_data
+
+    logger.info("Importing data from CSV to PostgreSQL")
     import_data()
 
 
 @app.command("import_sqlite")
 def cmd_import_sqlite():
-    print("Importing data from CSV to SQLite")
+    from commands.import_data.sqlite_main import import_books_from_csv_sqlite
+
+    logger.info("Importing data from CSV to SQLite")
     import_books_from_csv_sqlite()
 
 
+@app.command("export")
+def cmd_export(backend: str = "postgres", out: str = "exports", format: str = "auto", chunk_size: int = 5000):
+    from commands.export_data.main import export_data
+
+    logger.info("Exporting data for offline analytics")
+    export_data(backend=backend, out_dir=out, fmt=format, chunk_size=chunk_size)
+
+
+@app.command("backfill_rollups")
+def cmd_backfill_rollups(backend: str = "postgres"):
+    from commands.backfill_rollups.main import backfill_rollups
+
+    logger.info("Backfilling rental rollups")
+    backfill_rollups(backend=backend)
+
+
+@app.command("build_recommendations")
+def cmd_build_recommendations(backend: str = "postgres", refresh: bool = False):
+    from commands.build_recommendations.main import build_recommendations
+
+    logger.info("Building book recommendations")
+    build_recommendations(backend=backend, refresh=refresh)
+
+
+@app.command("purge_idempotency_keys")
+def cmd_purge_idempotency_keys(batch_size: int = 10000):
+    from commands.purge_idempotency_keys.main import purge_idempotency_keys
+
+    logger.info("Purging expired idempotency keys")
+    purge_idempotency_keys(batch_size=batch_size)
+
+
+@app.command("archive_rentals")
+def cmd_archive_rentals(backend: str = "postgres", months: int = None, batch_size: int = None):
+    from commands.archive_rentals.main import archive_rentals
+    from settings import ARCHIVE_AFTER_MONTHS, ARCHIVE_BATCH_SIZE
+
+    logger.info("Archiving returned rentals")
+    archive_rentals(
+        backend=backend,
+        months=ARCHIVE_AFTER_MONTHS if months is None else months,
+        batch_size=batch_size or ARCHIVE_BATCH_SIZE,
+    )
+
+
+@app.command("compact_tombstones")
+def cmd_compact_tombstones(backend: str = "postgres", retention_days: int = None, batch_size: int = None):
+    from commands.compact_tombstones.main import compact_tombstones
+    from settings import TOMBSTONE_BATCH_SIZE, TOMBSTONE_RETENTION_DAYS
+
+    logger.info("Compacting deleted books and users")
+    compact_tombstones(
+        backend=backend,
+        retention_days=TOMBSTONE_RETENTION_DAYS if retention_days is None else retention_days,
+        batch_size=batch_size or TOMBSTONE_BATCH_SIZE,
+    )
+
+
+@app.command("refresh_rental_snapshots")
+def cmd_refresh_rental_snapshots(backend: str = "postgres", batch_size: int = None):
+    from commands.refresh_rental_snapshots.main import refresh_rental_snapshots
+    from settings import SNAPSHOT_REFRESH_BATCH_SIZE
+
+    logger.info("Refreshing rental snapshots")
+    refresh_rental_snapshots(backend=backend, batch_size=batch_size or SNAPSHOT_REFRESH_BATCH_SIZE)
+
+
+@app.command("profile")
+def cmd_profile(url: str = "http://localhost:8000", seconds: float = 10, mode: str = "wall",
+                output: str = "profile.collapsed", summary: bool = False):
+    from commands.profile.main import profile
+    from settings import ADMIN_TOKEN
+
+    logger.info("Profiling a running worker")
+    profile(url=url, seconds=seconds, mode=mode, output=output, token=ADMIN_TOKEN, summary=summary)
+
+
+@app.command("check_import_time")
+def cmd_check_import_time(module: str = "main"):
+    from commands.check_import_time.main import check_import_time
+
+    logger.info("Profiling import time of '%s'", module)
+    check_import_time(module)
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,17 @@
+import logging
+
+from src.utils.archive import archive_cutoff, archive_rentals as move_to_archive
+
+logger = logging.getLogger(__name__)
+
+
+def archive_rentals(backend: str = "postgres", months: int = 12, batch_size: int = 5000):
+    """Move returned rentals older than `months` months to rentals_archive"""
+    logger.info("Archiving %s rentals returned before %s...", backend, archive_cutoff(months).date())
+
+    try:
+        result = move_to_archive(backend, months, batch_size)
+        logger.info("Archived %d rental(s), created %d partition(s)", result["archived"], result["partitions_created"])
+    except Exception as e:
+        logger.error("Error archiving rentals: %s", e)
+        raise
@@ -0,0 +1,17 @@
+import logging
+
+from src.utils.rollups import backfill_rollups as rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_rollups(backend: str = "postgres"):
+    """Rebuild the hourly/daily rental rollups from the rentals table"""
+    logger.info("Rebuilding %s rental rollups...", backend)
+
+    try:
+        rebuild_rollups(backend)
+        logger.info("Rental rollups rebuilt")
+    except Exception as e:
+        logger.error("Error rebuilding rollups: %s", e)
+        raise
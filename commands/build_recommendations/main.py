@@ -0,0 +1,25 @@
+import logging
+
+from settings import RECOMMENDATION_CHUNK_ROWS, RECOMMENDATION_TOP_K
+from src.utils.recommendations import build_similarities, refresh_similarities
+
+logger = logging.getLogger(__name__)
+
+
+def build_recommendations(backend: str = "postgres", refresh: bool = False):
+    """Build (or incrementally refresh) the similar-books index from rental history"""
+    try:
+        result = None
+        if refresh:
+            logger.info("Refreshing %s book similarities with new rentals...", backend)
+            result = refresh_similarities(backend, RECOMMENDATION_TOP_K)
+            if result is None:
+                logger.info("No previous build found, running a full build")
+        if result is None:
+            logger.info("Building %s book similarities (top %d)...", backend, RECOMMENDATION_TOP_K)
+            result = build_similarities(backend, RECOMMENDATION_TOP_K, RECOMMENDATION_CHUNK_ROWS)
+        logger.info("Book similarities up to rental %s: %d book(s), %d similarity row(s)",
+                    result["last_rental_id"], result["books"], result["similarities"])
+    except Exception as e:
+        logger.error("Error building recommendations: %s", e)
+        raise
@@ -0,0 +1,58 @@
+import logging
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+from settings import IMPORT_TIME_BUDGET_MS
+
+logger = logging.getLogger(__name__)
+
+
+def measure_import_time(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+    Returns the cumulative import time of the module in milliseconds and
+    the slowest imports as (cumulative_ms, name) pairs.
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=project_root
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing '{module}' failed:\n{result.stderr}")
+
+    total_ms = None
+    entries = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented name>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_ms = int(cumulative) / 1000
+        entries.append((cumulative_ms, name.strip()))
+        if name.strip() == module:
+            total_ms = cumulative_ms
+
+    if total_ms is None:
+        raise RuntimeError(f"No import time reported for '{module}'")
+
+    entries.sort(reverse=True)
+    return total_ms, entries[:15]
+
+
+def check_import_time(module: str = "main", budget_ms: int = IMPORT_TIME_BUDGET_MS):
+    """Fail if importing `module` takes longer than the budget"""
+    total_ms, slowest = measure_import_time(module)
+
+    for cumulative_ms, name in slowest:
+        logger.info("Slow import %s: %.1f ms cumulative", name, cumulative_ms,
+                    extra={"import_name": name, "cumulative_ms": cumulative_ms})
+
+    fields = {"import_name": module, "total_ms": round(total_ms, 1), "budget_ms": budget_ms}
+    if total_ms > budget_ms:
+        logger.error("Importing '%s' took %.1f ms (budget %d ms)", module, total_ms, budget_ms, extra=fields)
+        sys.exit(1)
+
+    logger.info("Importing '%s' took %.1f ms (budget %d ms)", module, total_ms, budget_ms, extra=fields)
@@ -0,0 +1,17 @@
+import logging
+
+from src.utils.tombstones import compact_tombstones as purge_tombstones
+
+logger = logging.getLogger(__name__)
+
+
+def compact_tombstones(backend: str = "postgres", retention_days: int = 30, batch_size: int = 1000):
+    """Purge soft-deleted books and users that nothing references any more"""
+    logger.info("Purging %s books and users deleted more than %d day(s) ago...", backend, retention_days)
+
+    try:
+        deleted = purge_tombstones(backend, retention_days, batch_size)
+        logger.info("Purged %d book(s) and %d user(s)", deleted["books"], deleted["users"])
+    except Exception as e:
+        logger.error("Error compacting tombstones: %s", e)
+        raise
@@ -0,0 +1,20 @@
+import logging
+
+from src.utils.export import EXPORT_TABLES, export_table, resolve_format
+
+logger = logging.getLogger(__name__)
+
+
+def export_data(backend: str = "postgres", out_dir: str = "exports", fmt: str = "auto",
+                chunk_size: int = 5000):
+    """Export books, users and rentals to Parquet (or gzipped CSV) files"""
+    fmt = resolve_format(fmt)
+    logger.info("Exporting %s tables to %s/ as %s...", backend, out_dir, fmt)
+
+    try:
+        for table in EXPORT_TABLES:
+            files = export_table(backend, table, out_dir, fmt=fmt, chunk_size=chunk_size)
+            logger.info("%s: %d file(s)", table, len(files))
+    except Exception as e:
+        logger.error("Error exporting data: %s", e)
+        raise
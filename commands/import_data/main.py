@@ -1,13 +1,16 @@
 import csv
+import logging
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from src.models.library_models import Book
 from commands.init_database.main import get_sync_database_url
 
+logger = logging.getLogger(__name__)
+
 
 def import_books_from_csv():
     """Import books from CSV file into database using sync approach"""
-    print("Starting CSV import...")
+    logger.info("Starting CSV import...")
     
     try:
         # Create sync database connection
@@ -32,13 +35,13 @@ def import_books_from_csv():
                     books_added += 1
                 
                 session.commit()
-                print(f"✅ Successfully imported {books_added} books from CSV")
+                logger.info("Successfully imported %d books from CSV", books_added)
                 
     except FileNotFoundError:
-        print("❌ Error: test_data/books.csv file not found")
+        logger.error("Error: test_data/books.csv file not found")
         raise
     except Exception as e:
-        print(f"❌ Error importing CSV: {e}")
+        logger.error("Error importing CSV: %s", e)
         raise
 
 
@@ -1,16 +1,21 @@
 import csv
+import logging
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from settings import SQLITE_PATH
 from src.models.library_models import Book
 
+logger = logging.getLogger(__name__)
+
 
 def get_sqlite_database_url() -> str:
-    return "sqlite:///./library.db"
+    return f"sqlite:///{os.path.abspath(SQLITE_PATH)}"
 
 
 def import_books_from_csv_sqlite():
     """Import books from CSV file into SQLite database"""
-    print("Starting CSV import to SQLite...")
+    logger.info("Starting CSV import to SQLite...")
 
     try:
         # Create SQLite database connection
@@ -35,11 +40,11 @@ def import_books_from_csv_sqlite():
                     books_added += 1
 
                 session.commit()
-                print(f"✅ Successfully imported {books_added} books from CSV to SQLite")
+                logger.info("Successfully imported %d books from CSV to SQLite", books_added)
 
     except FileNotFoundError:
-        print("❌ Error: test_data/books.csv file not found")
+        logger.error("Error: test_data/books.csv file not found")
         raise
     except Exception as e:
-        print(f"❌ Error importing CSV: {e}")
+        logger.error("Error importing CSV: %s", e)
         raise
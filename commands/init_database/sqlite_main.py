@@ -1,19 +1,19 @@
-from src.models.library_models import Book, User, Rental
-from src.utils.db_utils import Base
-from sqlalchemy import create_engine
+import logging
 
+from settings import SQLITE_PATH
+from src.migrations.runner import migrate
 
-def get_sqlite_database_url() -> str:
-    return "sqlite:///./library.db"
+logger = logging.getLogger(__name__)
 
 
 def init_sqlite_database():
     """Initialize SQLite database for testing"""
-    database_url = get_sqlite_database_url()
-    engine = create_engine(database_url, echo=True)
-
-    # Create all tables in the database
-    Base.metadata.create_all(engine)
-    print("SQLite database initialized successfully.")
-    print("Tables created: books, users, rentals")
-    print("Database file: library.db")
\ No newline at end of file
+    # The schema is the models' tables plus every migration; on an existing
+    # database only the migrations not applied yet run.
+    applied = migrate("sqlite")
+    logger.info("SQLite database initialized successfully.")
+    if applied:
+        logger.info("Applied migrations: %s", ", ".join(f"{version:04d}" for version in applied))
+    else:
+        logger.info("Schema is up to date")
+    logger.info("Database file: %s", SQLITE_PATH)
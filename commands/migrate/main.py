@@ -0,0 +1,28 @@
+import logging
+
+from src.migrations.runner import migrate as apply_migrations, migration_status
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(backend: str = "postgres", target: int = None, dry_run: bool = False):
+    """Apply pending schema migrations"""
+    try:
+        applied = apply_migrations(backend, target=target, dry_run=dry_run)
+        if dry_run:
+            return
+        if applied:
+            logger.info("Applied %d migration(s) to %s", len(applied), backend)
+        else:
+            logger.info("%s schema is up to date", backend)
+    except Exception as e:
+        logger.error("Error migrating %s: %s", backend, e)
+        raise
+
+
+def show_migration_status(backend: str = "postgres"):
+    """List migrations and when each was applied"""
+    for migration in migration_status(backend):
+        applied_at = migration["applied_at"] or "pending"
+        logger.info("%04d  %-26s  %s", migration["version"], applied_at, migration["description"],
+                    extra={"version": migration["version"]})
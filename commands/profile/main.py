@@ -0,0 +1,36 @@
+import json
+import logging
+import urllib.error
+import urllib.parse
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+
+def profile(url: str = "http://localhost:8000", seconds: float = 10, mode: str = "wall",
+            output: str = "profile.collapsed", token: str = "", summary: bool = False):
+    """Profile the worker serving `url` and save its collapsed stacks (or summary) to `output`"""
+    query = urllib.parse.urlencode({"seconds": seconds, "mode": mode, "format": "summary" if summary else "collapsed"})
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/metrics/profile?{query}", method="POST", headers={"X-Admin-Token": token},
+    )
+    logger.info("Sampling %s for %gs (%s)...", url, seconds, mode)
+
+    try:
+        with urllib.request.urlopen(request, timeout=seconds + 30) as response:
+            body = response.read()
+        with open(output, "wb") as f:
+            f.write(body)
+        if summary:
+            routes = json.loads(body)["routes"]
+            for route, seconds_by in routes.items():
+                logger.info("%9.3fs  %s  (db %.3fs, validation %.3fs, serialization %.3fs)",
+                            seconds_by["seconds"], route, seconds_by["db"], seconds_by["validation"],
+                            seconds_by["serialization"], extra={"route": route, **seconds_by})
+        logger.info("Profile saved to %s", output)
+    except urllib.error.HTTPError as e:
+        logger.error("Error profiling worker: %s %s", e.code, e.read().decode(errors="replace"))
+        raise
+    except Exception as e:
+        logger.error("Error profiling worker: %s", e)
+        raise
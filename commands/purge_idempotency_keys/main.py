@@ -0,0 +1,22 @@
+import logging
+
+from src.utils.idempotency import purge_expired_keys
+from src.utils.postgres_utils import replica_router
+
+logger = logging.getLogger(__name__)
+
+
+def purge_idempotency_keys(batch_size: int = 10000):
+    """Delete idempotency keys whose TTL has passed"""
+    logger.info("Purging expired idempotency keys...")
+
+    conn = replica_router.connect_primary()
+    try:
+        deleted = purge_expired_keys(conn.cursor(), batch_size)
+        logger.info("Deleted %d expired idempotency key(s)", deleted)
+    except Exception as e:
+        conn.rollback()
+        logger.error("Error purging idempotency keys: %s", e)
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,17 @@
+import logging
+
+from src.utils.snapshots import refresh_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_rental_snapshots(backend: str = "postgres", batch_size: int = 5000):
+    """Rewrite rental user/book snapshots that no longer match users and books"""
+    logger.info("Refreshing %s rental snapshots...", backend)
+
+    try:
+        updated = refresh_snapshots(backend, batch_size)
+        logger.info("Refreshed %d rental(s)", updated)
+    except Exception as e:
+        logger.error("Error refreshing rental snapshots: %s", e)
+        raise
@@ -1,7 +1,10 @@
+import logging
 import subprocess
 import sys
 import os
 
+logger = logging.getLogger(__name__)
+
 def run_tests():
     """Run all tests using pytest"""
     try:
@@ -9,7 +12,7 @@ def run_tests():
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         os.chdir(project_root)
         
-        print("Running tests with pytest...")
+        logger.info("Running tests with pytest...")
         result = subprocess.run([
             sys.executable, "-m", "pytest", 
             "tests/", 
@@ -17,19 +20,18 @@ def run_tests():
             "--tb=short"
         ], capture_output=True, text=True)
         
-        print("STDOUT:")
-        print(result.stdout)
+        logger.info("pytest output:\n%s", result.stdout)
         
         if result.stderr:
-            print("STDERR:")
-            print(result.stderr)
+            logger.warning("pytest stderr:\n%s", result.stderr)
         
         if result.returncode == 0:
-            print("✅ All tests passed!")
+            logger.info("All tests passed!")
         else:
-            print("❌ Some tests failed!")
+            logger.error("Some tests failed! (pytest exit code %d)", result.returncode,
+                         extra={"returncode": result.returncode})
             sys.exit(result.returncode)
             
     except Exception as e:
-        print(f"Error running tests: {e}")
+        logger.error("Error running tests: %s", e)
         sys.exit(1)
\ No newline at end of file
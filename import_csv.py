@@ -1,11 +1,12 @@
 import asyncio
 import csv
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.utils.db_utils import engine, Base
+from src.utils.db_utils import get_engine, Base
 from src.models.library_models import Book
 
 
 async def import_books_from_csv():
+    engine = get_engine()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
@@ -1,5 +1,91 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from src.api.main_router import router as main_router
 
-app = FastAPI()
+from settings import (
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_WAIT_MS,
+    ADMISSION_PRIORITY_RESERVED,
+    APP_DEBUG,
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MINIMUM_SIZE,
+    ENABLED_BACKENDS,
+    POSTGRES_PRIMARY_DSN,
+    QUERY_BUDGET_WARN,
+    RATE_LIMIT_DEFAULT_BURST,
+    RATE_LIMIT_DEFAULT_RATE,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_EXPENSIVE_BURST,
+    RATE_LIMIT_EXPENSIVE_RATE,
+    RATE_LIMIT_IDLE_SECONDS,
+    RATE_LIMIT_MAX_CLIENTS,
+    RATE_LIMIT_STORE,
+    RATE_LIMIT_STORE_POOL_SIZE,
+    REPORT_TIMEOUT_MS,
+    REQUEST_TIMEOUT_MS,
+    TRUSTED_PROXIES,
+)
+from src.api.main_router import router as main_router, shutdown_routers, startup_routers
+from src.middleware.admission import AdmissionController, AdmissionMiddleware
+from src.middleware.compression import CompressionMiddleware
+from src.middleware.deadline import DeadlineMiddleware
+from src.middleware.query_budget import QueryBudgetMiddleware
+from src.middleware.rate_limit import RateLimitMiddleware, create_bucket_store
+from src.middleware.request_context import RequestContextMiddleware
+from src.utils.structured_logging import configure_logging
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The ORM engine is only needed when the ORM routers are mounted,
+    # and is created here rather than when db_utils is imported.
+    orm_enabled = "orm" in ENABLED_BACKENDS
+    if orm_enabled:
+        from src.utils.db_utils import get_engine
+
+        get_engine()
+    await startup_routers()
+    yield
+    await shutdown_routers()
+    if orm_enabled:
+        from src.utils.db_utils import dispose_engine
+
+        await dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
+# Middleware added last runs first: compression, request context, query
+# counting, rate limiting, admission control, then the request's deadline
+# around the routed request.
+app.add_middleware(DeadlineMiddleware, timeout=REQUEST_TIMEOUT_MS / 1000, report_timeout=REPORT_TIMEOUT_MS / 1000)
+app.state.admission = AdmissionController(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    reserved_priority=ADMISSION_PRIORITY_RESERVED,
+    max_wait=ADMISSION_MAX_WAIT_MS / 1000,
+)
+app.add_middleware(AdmissionMiddleware, controller=app.state.admission)
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=create_bucket_store(
+            RATE_LIMIT_STORE, POSTGRES_PRIMARY_DSN,
+            max_clients=RATE_LIMIT_MAX_CLIENTS, max_connections=RATE_LIMIT_STORE_POOL_SIZE,
+            idle_seconds=RATE_LIMIT_IDLE_SECONDS,
+        ),
+        expensive_rate=RATE_LIMIT_EXPENSIVE_RATE,
+        expensive_burst=RATE_LIMIT_EXPENSIVE_BURST,
+        default_rate=RATE_LIMIT_DEFAULT_RATE,
+        default_burst=RATE_LIMIT_DEFAULT_BURST,
+    )
+app.add_middleware(QueryBudgetMiddleware, timing_header=APP_DEBUG, warn_queries=QUERY_BUDGET_WARN)
+app.add_middleware(RequestContextMiddleware, trusted_proxies=TRUSTED_PROXIES)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+)
 app.include_router(main_router)
@@ -1,23 +1,299 @@
 import os
-from typing import Optional
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional
 
 from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
 load_dotenv()
 
+# password=... in a libpq DSN, user:password@ in a URI
+_DSN_PASSWORD = re.compile(r"(password=|://[^:/@\s]+:)[^\s@]+")
 
-def get_config(key: str, default: Optional[str] = None) -> Optional[str]:
+
+class Settings(BaseModel):
     """
-    Get configuration value from environment variables.
-    If the key does not exist, return the default value.
+    Every setting of the app, typed and validated. Values come from the
+    environment (or .env), then the APP_PROFILE profile if one is set, then
+    the defaults below. Loaded once per process by `get_settings()`.
     """
-    return os.getenv(key, default)
 
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    # Named tuning profile, see PROFILES; none by default
+    APP_PROFILE: Optional[Literal["dev", "bench", "prod"]] = None
+
+    # `python cli.py serve`: address and number of uvicorn worker processes
+    # (APP_-prefixed, like every setting a shell or container may already set).
+    APP_HOST: str = "127.0.0.1"
+    APP_PORT: int = Field(default=8000, gt=0, lt=65536)
+    APP_WORKERS: int = Field(default=1, ge=1)
+
+    # SQLite database of the /simple-* routers, the ORM routers and the jobs,
+    # relative to the working directory.
+    SQLITE_PATH: str = "library.db"
+    # Connections the ORM engine keeps open, and extra ones opened under load.
+    ORM_POOL_SIZE: int = Field(default=5, ge=1)
+    ORM_MAX_OVERFLOW: int = Field(default=10, ge=0)
+
+    # PostgreSQL routers: writes go to the primary, reads are balanced over the
+    # replicas (";"-separated libpq DSNs or URIs).
+    POSTGRES_PRIMARY_DSN: str = "host=localhost port=5432 dbname=library_db user=user password=123"
+    POSTGRES_REPLICA_DSNS: List[str] = []
+    # Replicas lagging more than this are skipped until the next lag check.
+    REPLICA_MAX_LAG_SECONDS: float = Field(default=5, ge=0)
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = Field(default=2, gt=0)
+    # After a write, the same client reads from the primary for this long.
+    READ_YOUR_WRITES_SECONDS: float = Field(default=10, ge=0)
+
+    # Write-behind mode for POST /postgres-rentals/rent and /return: requests are
+    # validated against an in-memory availability view, journaled, acknowledged
+    # with a reservation token and persisted in batches by a background thread.
+    RENTAL_WRITE_BEHIND: bool = False
+    RENTAL_JOURNAL_PATH: str = "var/rental_journal.jsonl"
+    WRITE_BEHIND_BATCH_SIZE: int = Field(default=100, ge=1)
+    WRITE_BEHIND_FLUSH_MS: int = Field(default=50, ge=1)
+
+    # Rental listings (active rentals, all rentals, return lookups) read the
+    # user's name/email and the book's title/author copied onto each rental
+    # instead of joining users and books. The copies are always written, so this
+    # only switches the reads.
+    RENTAL_SNAPSHOTS_ENABLED: bool = False
+
+    # Comma-separated router groups to mount: core, orm, sqlite, postgres, analytics.
+    # "core" is always mounted; groups that are not listed are never imported.
+    ENABLED_BACKENDS: List[str] = ["sqlite", "postgres", "analytics"]
+
+    # Share one database call among concurrent identical reads on opted-in routes.
+    COALESCE_READS: bool = True
+
+    # /analytics/* reports: source backend, how long loaded data/results are
+    # reused and how many distinct reports are kept.
+    ANALYTICS_BACKEND: Literal["postgres", "sqlite"] = "postgres"
+    ANALYTICS_CACHE_TTL_SECONDS: float = Field(default=300, ge=0)
+    ANALYTICS_CACHE_MAX_REPORTS: int = Field(default=256, ge=1)
+
+    # Similar books kept per book by `build_recommendations`, and rows per chunk while building.
+    RECOMMENDATION_TOP_K: int = Field(default=10, ge=1)
+    RECOMMENDATION_CHUNK_ROWS: int = Field(default=50000, ge=1)
+
+    # Response compression: bodies below COMPRESSION_MINIMUM_SIZE bytes are sent as is.
+    # brotli is used when the client accepts it and the `brotli` package is installed.
+    COMPRESSION_MINIMUM_SIZE: int = Field(default=1024, ge=0)
+    COMPRESSION_GZIP_LEVEL: int = Field(default=6, ge=0, le=9)
+    COMPRESSION_BROTLI_QUALITY: int = Field(default=4, ge=0, le=11)
+
+    # Hold queue notifications: longest accepted long-poll, and idle interval
+    # after which server-sent event streams send a keep-alive comment.
+    HOLD_WAIT_MAX_SECONDS: float = Field(default=60, gt=0)
+    SSE_HEARTBEAT_SECONDS: float = Field(default=15, gt=0)
+    # /events/availability: events buffered per client before it is sent a fresh
+    # snapshot instead, and how many books one stream may watch.
+    SSE_QUEUE_SIZE: int = Field(default=256, ge=1)
+    AVAILABILITY_MAX_BOOK_IDS: int = Field(default=500, ge=1)
+
+    # Most items accepted by one bulk rent/return request (check-in stations).
+    BULK_RENTAL_MAX_ITEMS: int = Field(default=200, ge=1)
+
+    # Responses to POSTs sent with an Idempotency-Key are replayed to retries for this long.
+    IDEMPOTENCY_TTL_HOURS: float = Field(default=24, gt=0)
+
+    # Token-bucket rate limits per client address: requests per second and
+    # burst size. Behind TRUSTED_PROXIES (comma-separated addresses) the client
+    # is taken from X-Forwarded-For. Expensive list/stats/report routes get a
+    # bucket per client and route. RATE_LIMIT_STORE=postgres shares buckets
+    # between workers through POSTGRES_PRIMARY_DSN, over at most
+    # RATE_LIMIT_STORE_POOL_SIZE connections per worker; the memory store keeps
+    # the buckets of RATE_LIMIT_MAX_CLIENTS clients. Buckets unused for
+    # RATE_LIMIT_IDLE_SECONDS (by then refilled) are dropped.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORE: Literal["memory", "postgres"] = "memory"
+    RATE_LIMIT_DEFAULT_RATE: float = Field(default=50, gt=0)
+    RATE_LIMIT_DEFAULT_BURST: float = Field(default=100, ge=1)
+    RATE_LIMIT_EXPENSIVE_RATE: float = Field(default=2, gt=0)
+    RATE_LIMIT_EXPENSIVE_BURST: float = Field(default=10, ge=1)
+    RATE_LIMIT_STORE_POOL_SIZE: int = Field(default=4, ge=1)
+    RATE_LIMIT_MAX_CLIENTS: int = Field(default=100000, ge=1)
+    RATE_LIMIT_IDLE_SECONDS: float = Field(default=300, gt=0)
+    TRUSTED_PROXIES: List[str] = []
+
+    # Admission control: requests doing database work at once, slots only
+    # rent/return may use, and how long a request may wait for a slot before it
+    # is shed with 503.
+    ADMISSION_MAX_CONCURRENT: int = Field(default=32, ge=1)
+    ADMISSION_PRIORITY_RESERVED: int = Field(default=8, ge=0)
+    ADMISSION_MAX_WAIT_MS: int = Field(default=250, ge=0)
+
+    # Schema migrations (`python cli.py migrate`): how long DDL may wait for a
+    # table lock before it gives up and is retried, and batch size / pause
+    # between batches of data backfills.
+    MIGRATION_LOCK_TIMEOUT_MS: int = Field(default=5000, ge=0)
+    MIGRATION_LOCK_RETRIES: int = Field(default=5, ge=0)
+    MIGRATION_BATCH_SIZE: int = Field(default=5000, ge=1)
+    MIGRATION_BATCH_PAUSE_MS: int = Field(default=50, ge=0)
+
+    # `python cli.py refresh_rental_snapshots`: rentals checked per transaction
+    # and pause between batches.
+    SNAPSHOT_REFRESH_BATCH_SIZE: int = Field(default=5000, ge=1)
+    SNAPSHOT_REFRESH_PAUSE_MS: int = Field(default=50, ge=0)
+
+    # Rental archival (`python cli.py archive_rentals`): returned rentals from
+    # before the start of the month ARCHIVE_AFTER_MONTHS ago move to
+    # rentals_archive, one id range of ARCHIVE_BATCH_SIZE rows per transaction.
+    ARCHIVE_AFTER_MONTHS: int = Field(default=12, ge=1)
+    ARCHIVE_BATCH_SIZE: int = Field(default=5000, ge=1)
+    ARCHIVE_BATCH_PAUSE_MS: int = Field(default=50, ge=0)
+
+    # Soft delete (`python cli.py compact_tombstones`): deleted books and users
+    # are kept as tombstones for TOMBSTONE_RETENTION_DAYS, so a mistaken delete
+    # can still be undone by clearing deleted_at, then purged in batches.
+    TOMBSTONE_RETENTION_DAYS: int = Field(default=30, ge=0)
+    TOMBSTONE_BATCH_SIZE: int = Field(default=1000, ge=1)
+
+    # Request deadlines: a request's database work is cancelled once it has run
+    # REQUEST_TIMEOUT_MS (REPORT_TIMEOUT_MS for /stats/ and /analytics/
+    # reports) or its client disconnects, and it answers 504. PostgreSQL
+    # connections get the time left as statement_timeout; SQLite connections
+    # wait at most SQLITE_BUSY_TIMEOUT_MS (or the time left) for a lock. 0
+    # disables deadlines.
+    REQUEST_TIMEOUT_MS: int = Field(default=10000, ge=0)
+    REPORT_TIMEOUT_MS: int = Field(default=30000, ge=0)
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=5000, ge=0)
+
+    # Logging: JSON lines (LOG_FORMAT=text for reading locally) written to stderr
+    # by a background thread from a queue of LOG_QUEUE_SIZE records; records
+    # arriving while it is full are dropped rather than blocking the caller.
+    # LOG_LEVELS overrides LOG_LEVEL per logger ("sqlalchemy.engine=INFO,
+    # src.utils.write_behind=DEBUG"); only LOG_DEBUG_SAMPLE_RATE of DEBUG
+    # records are kept.
+    LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+    LOG_LEVELS: str = ""
+    LOG_FORMAT: Literal["json", "text"] = "json"
+    LOG_QUEUE_SIZE: int = Field(default=10000, ge=1)
+    LOG_DEBUG_SAMPLE_RATE: float = Field(default=0.1, ge=0, le=1)
+
+    # Queries and database time are counted per request. APP_DEBUG adds them to
+    # responses as a Server-Timing header; requests running more than
+    # QUERY_BUDGET_WARN queries are logged (0: never).
+    APP_DEBUG: bool = False
+    QUERY_BUDGET_WARN: int = Field(default=0, ge=0)
+
+    # Admin endpoints (POST /metrics/profile) require this token in X-Admin-Token;
+    # they are disabled while it is empty. Profiles last at most
+    # PROFILE_MAX_SECONDS and sample every PROFILE_INTERVAL_MS.
+    ADMIN_TOKEN: str = ""
+    PROFILE_MAX_SECONDS: float = Field(default=60, gt=0)
+    PROFILE_INTERVAL_MS: float = Field(default=10, gt=0)
+
+    # Upper bound (milliseconds) for `python -X importtime -c "import main"`.
+    IMPORT_TIME_BUDGET_MS: int = Field(default=1000, gt=0)
+
+    def redacted(self) -> Dict[str, Any]:
+        """The settings with passwords (in DSNs too) and tokens masked, for printing"""
+        values = self.model_dump()
+        for name, value in values.items():
+            if name.endswith("_TOKEN") and value:
+                values[name] = "***"
+            elif name.endswith("_DSN"):
+                values[name] = _DSN_PASSWORD.sub(r"\1***", value)
+            elif name.endswith("_DSNS"):
+                values[name] = [_DSN_PASSWORD.sub(r"\1***", dsn) for dsn in value]
+        return values
+
+    @field_validator("POSTGRES_REPLICA_DSNS", mode="before")
+    @classmethod
+    def _split_dsns(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return [dsn.strip() for dsn in value.split(";") if dsn.strip()]
+        return value
+
+    @field_validator("ENABLED_BACKENDS", "TRUSTED_PROXIES", mode="before")
+    @classmethod
+    def _split_commas(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return [backend.strip() for backend in value.split(",") if backend.strip()]
+        return value
+
+    @field_validator("LOG_LEVEL", mode="before")
+    @classmethod
+    def _upper_level(cls, value: Any) -> Any:
+        return value.upper() if isinstance(value, str) else value
+
+    @model_validator(mode="after")
+    def _check_workers(self) -> "Settings":
+        # Both keep state in process memory that other workers never see (a
+        # worker lock also stops `uvicorn --workers N`, see utils.worker_lock)
+        if self.APP_WORKERS > 1 and self.RENTAL_WRITE_BEHIND:
+            raise ValueError("RENTAL_WRITE_BEHIND needs APP_WORKERS=1: each worker would validate against its own view")
+        if self.APP_WORKERS > 1 and "sqlite" in self.ENABLED_BACKENDS:
+            raise ValueError("The sqlite router group needs APP_WORKERS=1: its availability events stay in one process")
+        return self
+
+    @model_validator(mode="after")
+    def _check_idle_buckets(self) -> "Settings":
+        # Only a full bucket may be dropped: a fresh one would hand out a new burst
+        refill = max(self.RATE_LIMIT_DEFAULT_BURST / self.RATE_LIMIT_DEFAULT_RATE,
+                     self.RATE_LIMIT_EXPENSIVE_BURST / self.RATE_LIMIT_EXPENSIVE_RATE)
+        if self.RATE_LIMIT_IDLE_SECONDS < refill:
+            raise ValueError(f"RATE_LIMIT_IDLE_SECONDS must be at least {refill:g}, the time a bucket takes to refill")
+        return self
+
+
+# Tuning profiles, selected with APP_PROFILE (without one, the defaults
+# above apply). A profile only changes defaults: anything set in the
+# environment still wins.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # Local development: readable logs, query counts on every response
+    "dev": {
+        "APP_DEBUG": True,
+        "LOG_FORMAT": "text",
+        "QUERY_BUDGET_WARN": 20,
+    },
+    # Load tests: nothing throttles the load generator, logging stays cheap
+    "bench": {
+        "APP_HOST": "0.0.0.0",
+        "APP_WORKERS": 4,
+        "ENABLED_BACKENDS": ["postgres", "analytics"],
+        "ORM_POOL_SIZE": 20,
+        "ORM_MAX_OVERFLOW": 0,
+        "RATE_LIMIT_ENABLED": False,
+        "ADMISSION_MAX_CONCURRENT": 64,
+        "ADMISSION_PRIORITY_RESERVED": 16,
+        "LOG_LEVEL": "WARNING",
+        "LOG_DEBUG_SAMPLE_RATE": 0.0,
+    },
+    # Several workers behind a proxy: rate limits shared between them
+    "prod": {
+        "APP_HOST": "0.0.0.0",
+        "APP_WORKERS": 4,
+        "ENABLED_BACKENDS": ["postgres", "analytics"],
+        "ORM_POOL_SIZE": 10,
+        "RATE_LIMIT_STORE": "postgres",
+        "ANALYTICS_CACHE_TTL_SECONDS": 600,
+        "REQUEST_TIMEOUT_MS": 5000,
+        "LOG_DEBUG_SAMPLE_RATE": 0.01,
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    The settings of this process, validated on first use: a wrong type,
+    value or profile name fails at startup rather than on the request that
+    reads it.
+    """
+    profile = os.getenv("APP_PROFILE") or None
+    if profile is not None and profile not in PROFILES:
+        raise ValueError(f"Unknown APP_PROFILE '{profile}', expected one of: {', '.join(PROFILES)}")
+    values = dict(PROFILES[profile]) if profile else {}
+    values.update((name, os.environ[name]) for name in Settings.model_fields if name in os.environ)
+    values["APP_PROFILE"] = profile
+    return Settings.model_validate(values)
 
-### DEFAULT SETTINGS
 
-POSTGRES_PASSWORD = get_config(key="POSTGRES_PASSWORD", default="password")
-POSTGRES_USER = get_config(key="POSTGRES_USER", default="user")
-POSTGRES_DB = get_config(key="POSTGRES_DB", default="database")
+settings = get_settings()
 
-###
+# Every setting is also a module-level name (`from settings import APP_DEBUG`)
+globals().update(settings.model_dump())
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Query
+
+from settings import ANALYTICS_BACKEND, ANALYTICS_CACHE_MAX_REPORTS, ANALYTICS_CACHE_TTL_SECONDS
+from src.utils import analytics
+from src.utils.cache import TTLCache
+from src.utils.single_flight import coalesced, single_flight
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# Loaded rental history and computed reports are reused for the TTL
+_snapshots = TTLCache(ttl=ANALYTICS_CACHE_TTL_SECONDS, maxsize=4)
+_reports = TTLCache(ttl=ANALYTICS_CACHE_TTL_SECONDS, maxsize=ANALYTICS_CACHE_MAX_REPORTS)
+
+
+def _snapshot():
+    """Columnar rentals and books of the analytics backend"""
+    def load():
+        return analytics.load_rentals(ANALYTICS_BACKEND), analytics.load_books(ANALYTICS_BACKEND)
+
+    return _snapshots.get_or_set(
+        ANALYTICS_BACKEND,
+        lambda: single_flight.do("analytics.load", ("analytics.load", ANALYTICS_BACKEND), load)
+    )
+
+
+def _report(name: str, params: tuple, compute):
+    report = _reports.get_or_set((name, params), compute)
+    return {"backend": ANALYTICS_BACKEND, **report}
+
+
+@router.get("/rental-rate")
+@coalesced("analytics.rental_rate")
+def get_rental_rate(
+    granularity: Literal["day", "week", "month"] = "day",
+    days: int = Query(90, ge=1, le=3660)
+):
+    """Rentals and returns per day/week/month over the last `days` days"""
+    def compute():
+        rentals, _ = _snapshot()
+        end = datetime.now()
+        start = end - timedelta(days=days)
+        return {
+            "generated_at": end.isoformat(),
+            "granularity": granularity,
+            "series": analytics.rental_rate(rentals, start, end, granularity),
+        }
+
+    return _report("rental_rate", (granularity, days), compute)
+
+
+@router.get("/utilization")
+@coalesced("analytics.utilization")
+def get_book_utilization(
+    days: int = Query(90, ge=1, le=3660),
+    limit: int = Query(20, ge=1, le=1000)
+):
+    """Most utilized books: rented days / (copies * days) over the last `days` days"""
+    def compute():
+        rentals, books = _snapshot()
+        end = datetime.now()
+        start = end - timedelta(days=days)
+        return {
+            "generated_at": end.isoformat(),
+            "days": days,
+            "books": analytics.book_utilization(rentals, books, start, end, limit),
+        }
+
+    return _report("utilization", (days, limit), compute)
+
+
+@router.get("/overdue")
+@coalesced("analytics.overdue")
+def get_overdue_trend(
+    granularity: Literal["day", "week", "month"] = "month",
+    days: int = Query(365, ge=1, le=3660)
+):
+    """Share of rentals returned late or still overdue, by due date bucket"""
+    def compute():
+        rentals, _ = _snapshot()
+        now = datetime.now()
+        start = now - timedelta(days=days)
+        return {
+            "generated_at": now.isoformat(),
+            "granularity": granularity,
+            **analytics.overdue_ratio(rentals, start, now, now, granularity),
+        }
+
+    return _report("overdue", (granularity, days), compute)
+
+
+@router.get("/cohorts")
+@coalesced("analytics.cohorts")
+def get_user_cohorts(months: int = Query(12, ge=1, le=120)):
+    """Users grouped by first-rental month, with how many rented in each later month"""
+    def compute():
+        rentals, _ = _snapshot()
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "cohorts": analytics.user_cohorts(rentals, months),
+        }
+
+    return _report("cohorts", (months,), compute)
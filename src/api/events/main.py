@@ -0,0 +1,69 @@
+from typing import Dict, List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from settings import AVAILABILITY_MAX_BOOK_IDS, ENABLED_BACKENDS, SSE_HEARTBEAT_SECONDS, SSE_QUEUE_SIZE
+from src.utils.availability_events import availability_stream
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+def _parse_book_ids(book_ids: Optional[str]) -> Optional[List[int]]:
+    if not book_ids:
+        return None
+    try:
+        parsed = sorted({int(book_id) for book_id in book_ids.split(",") if book_id.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="book_ids must be comma-separated integers")
+    if len(parsed) > AVAILABILITY_MAX_BOOK_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {AVAILABILITY_MAX_BOOK_IDS} book_ids per stream")
+    return parsed
+
+
+def _load_quantities(backend: str, book_ids: Optional[List[int]]) -> Dict[int, int]:
+    p = PLACEHOLDERS[backend]
+    conn = open_connection(backend)
+    try:
+        cursor = conn.cursor()
+        if book_ids:
+            cursor.execute(
+                f"SELECT id, quantity FROM books WHERE id IN ({', '.join(p for _ in book_ids)}) "
+                f"AND deleted_at IS NULL ORDER BY id",
+                book_ids
+            )
+        else:
+            cursor.execute("SELECT id, quantity FROM books WHERE deleted_at IS NULL ORDER BY id")
+        return {book_id: quantity for book_id, quantity in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+@router.get("/availability")
+async def stream_availability(
+    request: Request,
+    book_ids: Optional[str] = None,
+    backend: Literal["sqlite", "postgres"] = "postgres"
+):
+    """
+    Server-sent events with book quantities: a snapshot, then every change
+    made by rent, return, create, update and delete. `book_ids=1,2,3` limits
+    the stream to those books.
+    """
+    if backend not in ENABLED_BACKENDS:
+        raise HTTPException(status_code=404, detail=f"Backend '{backend}' is not enabled")
+    watched = _parse_book_ids(book_ids)
+
+    return StreamingResponse(
+        availability_stream(
+            backend,
+            watched,
+            lambda: _load_quantities(backend, watched),
+            SSE_HEARTBEAT_SECONDS,
+            request.is_disconnected,
+            SSE_QUEUE_SIZE,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
@@ -0,0 +1,25 @@
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from settings import ENABLED_BACKENDS
+from src.utils.export import stream_csv
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+
+@router.get("/{table}.csv")
+async def export_table_csv(
+    table: Literal["books", "users", "rentals"],
+    backend: Literal["sqlite", "postgres"] = "postgres"
+):
+    """Stream a whole table as CSV in constant memory"""
+    if backend not in ENABLED_BACKENDS:
+        raise HTTPException(status_code=404, detail=f"Backend '{backend}' is not enabled")
+
+    return StreamingResponse(
+        stream_csv(backend, table),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}.csv"'}
+    )
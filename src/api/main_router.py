@@ -1,20 +1,81 @@
+from importlib import import_module
+from types import ModuleType
+from typing import Dict, Iterable, List
+
 from fastapi import APIRouter
-from src.api.hello_world.main import router as hello_world_router
-from src.api.simple_books.main import router as simple_books_router
-from src.api.simple_users.main import router as simple_users_router
-from src.api.simple_rentals.main import router as simple_rentals_router
-from src.api.postgres_books.main import router as postgres_books_router
-from src.api.postgres_users.main import router as postgres_users_router
-from src.api.postgres_rentals.main import router as postgres_rentals_router
-
-router = APIRouter()
-
-router.include_router(hello_world_router)
-# SQLite versions
-router.include_router(simple_books_router)
-router.include_router(simple_users_router)
-router.include_router(simple_rentals_router)
-# PostgreSQL versions
-router.include_router(postgres_books_router)
-router.include_router(postgres_users_router)
-router.include_router(postgres_rentals_router)
+
+from settings import ENABLED_BACKENDS
+
+# Router modules grouped by the backend they talk to. Only the groups listed
+# in ENABLED_BACKENDS are imported, so a deployment that serves PostgreSQL
+# never pays for sqlite/ORM imports (and vice versa).
+ROUTER_MODULES: Dict[str, List[str]] = {
+    "core": [
+        "src.api.hello_world.main",
+        "src.api.metrics.main",
+        "src.api.exports.main",
+        "src.api.events.main",
+    ],
+    # SQLAlchemy ORM versions (not mounted unless "orm" is enabled)
+    "orm": [
+        "src.api.books.main",
+        "src.api.users.main",
+        "src.api.rentals.main",
+    ],
+    # SQLite versions
+    "sqlite": [
+        "src.api.simple_books.main",
+        "src.api.simple_users.main",
+        "src.api.simple_rentals.main",
+    ],
+    # PostgreSQL versions
+    "postgres": [
+        "src.api.postgres_books.main",
+        "src.api.postgres_users.main",
+        "src.api.postgres_rentals.main",
+    ],
+    # NumPy reports over rental history (/analytics/*)
+    "analytics": [
+        "src.api.analytics.main",
+    ],
+}
+
+loaded_modules: List[ModuleType] = []
+
+
+def build_router(backends: Iterable[str]) -> APIRouter:
+    """
+    Import the router modules of the enabled backends and include them.
+    The "core" group is always loaded.
+    """
+    groups = ["core"] + [backend for backend in backends if backend != "core"]
+    unknown = [group for group in groups if group not in ROUTER_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown backends in ENABLED_BACKENDS: {', '.join(unknown)}")
+
+    api_router = APIRouter()
+    for group in groups:
+        for module_path in ROUTER_MODULES[group]:
+            module = import_module(module_path)
+            loaded_modules.append(module)
+            api_router.include_router(module.router)
+    return api_router
+
+
+async def startup_routers():
+    """Run the optional `startup()` hook of every loaded router module."""
+    for module in loaded_modules:
+        hook = getattr(module, "startup", None)
+        if hook is not None:
+            await hook()
+
+
+async def shutdown_routers():
+    """Run the optional `shutdown()` hook of every loaded router module."""
+    for module in reversed(loaded_modules):
+        hook = getattr(module, "shutdown", None)
+        if hook is not None:
+            await hook()
+
+
+router = build_router(ENABLED_BACKENDS)
@@ -0,0 +1,68 @@
+import secrets
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from settings import ADMIN_TOKEN, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS
+from src.middleware import rate_limit
+from src.utils.profiler import RouteIndex, profile_lock, sample
+from src.utils.single_flight import single_flight
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+def require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/coalescing")
+async def get_coalescing_stats():
+    """Executed vs coalesced calls for every coalesced route"""
+    return {"routes": single_flight.stats()}
+
+
+@router.get("/admission")
+async def get_admission_stats(request: Request):
+    """Admission control slots and shed requests, and 429s per rate-limit rule"""
+    return {
+        "admission": request.app.state.admission.stats(),
+        "rate_limited": dict(rate_limit.rejected),
+    }
+
+
+@router.post("/profile")
+async def profile_worker(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    mode: Literal["wall", "cpu"] = "wall",
+    format: Literal["collapsed", "summary"] = "collapsed",
+    include_idle: bool = False,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Sample this worker for `seconds` and return the profile: collapsed stacks
+    (route;category;frames... microseconds) for flame graphs, or seconds per
+    route and category
+    """
+    require_admin(x_admin_token)
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    try:
+        profile = await run_in_threadpool(
+            sample, seconds, PROFILE_INTERVAL_MS / 1000, mode, RouteIndex(request.app.routes), include_idle
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        profile_lock.release()
+
+    if format == "summary":
+        return profile.summary()
+    return PlainTextResponse(profile.collapsed(), headers={
+        "Content-Disposition": f'attachment; filename="profile-{mode}.collapsed"',
+    })
@@ -1,34 +1,48 @@
 import psycopg2
 import psycopg2.extras
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from datetime import datetime
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Literal, Optional
+
+from settings import RECOMMENDATION_TOP_K
+from src.utils.availability_events import AvailabilityListener, availability_change
+from src.utils.holds import cancel_holds_of, publish_hold
+from src.utils.idempotency import IDEMPOTENCY_KEY_MAX_LENGTH, claim_key, fingerprint, remember_response
+from src.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, rental_history_page
+from src.utils.payload import shape_list
+from src.utils.postgres_utils import get_postgres_connection, prefers_primary, replica_router
+from src.utils.single_flight import coalesced
+from src.utils.snapshots import refresh_book_snapshots
 
 router = APIRouter(prefix="/postgres-books", tags=["postgres-books"])
 
+# Relays committed availability changes (from any worker) to /events/availability
+availability_listener: Optional[AvailabilityListener] = None
 
-def get_postgres_connection():
-    """Get PostgreSQL database connection"""
-    try:
-        conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database="library_db",
-            user="user",
-            password="123"
-        )
-        return conn
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+
+async def startup():
+    global availability_listener
+    availability_listener = AvailabilityListener(connect=replica_router.connect_primary)
+    availability_listener.start()
+
+
+async def shutdown():
+    global availability_listener
+    if availability_listener is not None:
+        await run_in_threadpool(availability_listener.stop)
+        availability_listener = None
 
 
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_books():
+@coalesced("postgres-books.get_all_books", vary=prefers_primary)
+def get_all_books(fields: Optional[str] = None):
     """Get all books from PostgreSQL"""
     try:
-        conn = get_postgres_connection()
+        conn = get_postgres_connection(read_only=True)
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        cursor.execute("SELECT id, title, author, year, quantity FROM books ORDER BY id")
+        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE deleted_at IS NULL ORDER BY id")
         books = cursor.fetchall()
         
         books_list = []
@@ -42,8 +56,10 @@ async def get_all_books():
             })
         
         conn.close()
-        return books_list
+        return shape_list(books_list, fields)
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.close()
@@ -51,13 +67,14 @@ async def get_all_books():
 
 
 @router.get("/{book_id}", response_model=Dict[str, Any])
-async def get_book_by_id(book_id: int):
+@coalesced("postgres-books.get_book_by_id", vary=prefers_primary)
+def get_book_by_id(book_id: int):
     """Get book by ID from PostgreSQL"""
     try:
-        conn = get_postgres_connection()
+        conn = get_postgres_connection(read_only=True)
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = %s", (book_id,))
+        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = %s AND deleted_at IS NULL", (book_id,))
         book = cursor.fetchone()
         
         if not book:
@@ -83,25 +100,97 @@ async def get_book_by_id(book_id: int):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@router.get("/{book_id}/rentals")
+def get_book_rentals(
+    book_id: int,
+    status: Optional[Literal["active", "returned", "overdue"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    include_history: bool = False
+):
+    """Get a book's rentals from PostgreSQL, newest first, with keyset pagination"""
+    try:
+        conn = get_postgres_connection(read_only=True)
+        try:
+            db_cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            return rental_history_page(db_cursor, "postgres", "book", book_id, status, cursor, limit, include_history)
+        finally:
+            conn.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.get("/{book_id}/similar")
+@coalesced("postgres-books.get_similar_books", vary=prefers_primary)
+def get_similar_books(book_id: int, limit: int = Query(RECOMMENDATION_TOP_K, ge=1, le=RECOMMENDATION_TOP_K)):
+    """Books most often rented by the same users, from the precomputed similarity index"""
+    try:
+        conn = get_postgres_connection(read_only=True)
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        
+        # Primary key lookup (book_id, rank): at most `limit` rows
+        cursor.execute("""
+            SELECT s.rank, s.similar_book_id, s.score, s.co_rentals, b.title, b.author
+            FROM book_similarities s
+            JOIN books b ON b.id = s.similar_book_id AND b.deleted_at IS NULL
+            WHERE s.book_id = %s
+            ORDER BY s.rank
+            LIMIT %s
+        """, (book_id, limit))
+        similar = cursor.fetchall()
+        
+        if not similar:
+            cursor.execute("SELECT id FROM books WHERE id = %s AND deleted_at IS NULL", (book_id,))
+            if not cursor.fetchone():
+                conn.close()
+                raise HTTPException(status_code=404, detail="Book not found")
+        
+        conn.close()
+        return {
+            "book_id": book_id,
+            "similar": [
+                {
+                    "book_id": book["similar_book_id"],
+                    "title": book["title"],
+                    "author": book["author"],
+                    "score": book["score"],
+                    "co_rentals": book["co_rentals"]
+                }
+                for book in similar
+            ]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
 @router.get("/stats/summary")
-async def get_books_stats():
+@coalesced("postgres-books.get_books_stats", vary=prefers_primary)
+def get_books_stats():
     """Get books statistics from PostgreSQL"""
     try:
-        conn = get_postgres_connection()
+        conn = get_postgres_connection(read_only=True)
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         # Get total books count
-        cursor.execute("SELECT COUNT(*) as total FROM books")
+        cursor.execute("SELECT COUNT(*) as total FROM books WHERE deleted_at IS NULL")
         total = cursor.fetchone()["total"]
         
         # Get total quantity
-        cursor.execute("SELECT SUM(quantity) as total_qty FROM books")
+        cursor.execute("SELECT SUM(quantity) as total_qty FROM books WHERE deleted_at IS NULL")
         total_qty = cursor.fetchone()["total_qty"]
         
         # Get books by decade
         cursor.execute("""
             SELECT (year/10)*10 as decade, COUNT(*) as count 
-            FROM books 
+            FROM books
+            WHERE deleted_at IS NULL
             GROUP BY decade 
             ORDER BY decade
         """)
@@ -114,7 +203,8 @@ async def get_books_stats():
         # Get most popular authors
         cursor.execute("""
             SELECT author, COUNT(*) as book_count
-            FROM books 
+            FROM books
+            WHERE deleted_at IS NULL
             GROUP BY author 
             ORDER BY book_count DESC 
             LIMIT 3
@@ -146,12 +236,23 @@ async def get_books_stats():
 
 
 @router.post("/", response_model=Dict[str, Any])
-async def create_book(book_data: dict):
-    """Create new book in PostgreSQL"""
+async def create_book(
+    book_data: dict,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    """Create new book in PostgreSQL; retries with the same Idempotency-Key get the first response"""
     try:
         conn = get_postgres_connection()
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
+        if idempotency_key is not None:
+            replay = claim_key(
+                cursor, idempotency_key, "postgres-books/create", fingerprint("postgres-books/create", book_data)
+            )
+            if replay is not None:
+                conn.close()
+                return replay
+        
         # Insert new book
         cursor.execute(
             """INSERT INTO books (title, author, year, quantity) 
@@ -160,10 +261,10 @@ async def create_book(book_data: dict):
         )
         
         book_id = cursor.fetchone()["id"]
-        conn.commit()
+        availability_change(cursor, "postgres", book_id, "create")
         
         # Get the created book
-        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = %s", (book_id,))
+        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = %s AND deleted_at IS NULL", (book_id,))
         book = cursor.fetchone()
         
         book_dict = {
@@ -174,9 +275,14 @@ async def create_book(book_data: dict):
             "quantity": book["quantity"]
         }
         
+        if idempotency_key is not None:
+            remember_response(cursor, idempotency_key, "postgres-books/create", book_dict)
+        conn.commit()
         conn.close()
         return book_dict
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.rollback()
@@ -192,7 +298,7 @@ async def update_book(book_id: int, book_data: dict):
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         # Check if book exists
-        cursor.execute("SELECT id FROM books WHERE id = %s", (book_id,))
+        cursor.execute("SELECT id FROM books WHERE id = %s AND deleted_at IS NULL", (book_id,))
         if not cursor.fetchone():
             conn.close()
             raise HTTPException(status_code=404, detail="Book not found")
@@ -205,10 +311,12 @@ async def update_book(book_id: int, book_data: dict):
             (book_data["title"], book_data["author"], book_data["year"], 
              book_data["quantity"], book_id)
         )
+        refresh_book_snapshots(cursor, "postgres", book_id, book_data["title"], book_data["author"])
+        availability_change(cursor, "postgres", book_id, "update")
         conn.commit()
         
         # Get updated book
-        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = %s", (book_id,))
+        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = %s AND deleted_at IS NULL", (book_id,))
         book = cursor.fetchone()
         
         book_dict = {
@@ -233,27 +341,32 @@ async def update_book(book_id: int, book_data: dict):
 
 @router.delete("/{book_id}")
 async def delete_book(book_id: int):
-    """Delete book from PostgreSQL"""
+    """Soft-delete a book in PostgreSQL (see src/utils/tombstones.py)"""
     try:
         conn = get_postgres_connection()
         cursor = conn.cursor()
         
-        # Check if book exists
-        cursor.execute("SELECT id FROM books WHERE id = %s", (book_id,))
-        if not cursor.fetchone():
-            conn.close()
-            raise HTTPException(status_code=404, detail="Book not found")
-        
-        # Check if book has active rentals
-        cursor.execute("SELECT id FROM rentals WHERE book_id = %s AND is_returned = false", (book_id,))
-        if cursor.fetchall():
+        # One statement: tombstone the book unless it is out on an active rental
+        # (a probe of the small idx_rentals_book_id_active partial index)
+        cursor.execute("""
+            UPDATE books SET deleted_at = %s
+            WHERE id = %s AND deleted_at IS NULL
+              AND NOT EXISTS (SELECT 1 FROM rentals WHERE book_id = %s AND is_returned = false)
+        """, (datetime.now(), book_id, book_id))
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT id FROM books WHERE id = %s AND deleted_at IS NULL", (book_id,))
+            found = cursor.fetchone()
             conn.close()
+            if not found:
+                raise HTTPException(status_code=404, detail="Book not found")
             raise HTTPException(status_code=400, detail="Cannot delete book with active rentals")
         
-        # Delete book
-        cursor.execute("DELETE FROM books WHERE id = %s", (book_id,))
+        cancelled_holds = cancel_holds_of(cursor, "postgres", "book_id", book_id)
+        availability_change(cursor, "postgres", book_id, "delete")
         conn.commit()
         conn.close()
+        for hold in cancelled_holds:
+            publish_hold(hold)
         
         return {"message": f"Book {book_id} deleted successfully"}
     
@@ -1,9 +1,48 @@
 import psycopg2
 import psycopg2.extras
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Callable, List, Dict, Any, Literal, Optional, Union
+from pydantic import BaseModel, Field
+
+from settings import (
+    BULK_RENTAL_MAX_ITEMS,
+    HOLD_WAIT_MAX_SECONDS,
+    RENTAL_JOURNAL_PATH,
+    RENTAL_WRITE_BEHIND,
+    SSE_HEARTBEAT_SECONDS,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_MS,
+)
+from src.utils.archive import rental_source
+from src.utils.availability import AvailabilityView, conditional_rent
+from src.utils.availability_events import availability_change, observe_availability, unobserve_availability
+from src.utils.bulk_rentals import bulk_rent, bulk_return
+from src.utils.holds import (
+    cancel_hold,
+    get_hold,
+    hand_off,
+    hold_event_stream,
+    place_hold,
+    publish_hold,
+    wait_for_hold,
+)
+from src.utils.idempotency import (
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    claim_key,
+    fingerprint,
+    remember_response,
+    run_idempotent,
+)
+from src.utils.payload import RENTAL_REFERENCES, shape_list
+from src.utils.postgres_utils import get_postgres_connection, prefers_primary, replica_router
+from src.utils.rollups import local_naive, query_rollups, record_rollup
+from src.utils.single_flight import coalesced
+from src.utils.snapshots import rental_details
+from src.utils.worker_lock import acquire_worker_lock, release_worker_lock
+from src.utils.write_behind import RentalJournal, RentalWriteBehind
 
 router = APIRouter(prefix="/postgres-rentals", tags=["postgres-rentals"])
 
@@ -19,41 +58,78 @@ class RentalReturn(BaseModel):
     book_id: Optional[int] = None
 
 
-def get_postgres_connection():
-    """Get PostgreSQL database connection"""
-    try:
-        conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database="library_db",
-            user="user",
-            password="123"
+class BulkRentalCreate(BaseModel):
+    items: List[RentalCreate] = Field(min_length=1, max_length=BULK_RENTAL_MAX_ITEMS)
+
+
+class BulkRentalReturn(BaseModel):
+    items: List[RentalReturn] = Field(min_length=1, max_length=BULK_RENTAL_MAX_ITEMS)
+
+
+class HoldCreate(BaseModel):
+    user_id: int
+    book_id: int
+    days_to_return: int = 14
+
+
+# Rentals are pre-checked against this view. It is loaded at startup and
+# follows committed availability events; in write-behind mode it is the
+# writer's own view instead.
+availability_view = AvailabilityView(
+    connect=replica_router.connect_primary, follow_events=not RENTAL_WRITE_BEHIND
+)
+
+# Set at startup when RENTAL_WRITE_BEHIND is enabled
+write_behind: Optional[RentalWriteBehind] = None
+# Held by the write-behind worker: a second one refuses to start
+WORKER_LOCK_PATH = f"{RENTAL_JOURNAL_PATH}.worker.lock"
+
+
+async def startup():
+    global write_behind
+    if RENTAL_WRITE_BEHIND:
+        acquire_worker_lock(WORKER_LOCK_PATH, "RENTAL_WRITE_BEHIND")
+        write_behind = RentalWriteBehind(
+            availability_view,
+            RentalJournal(RENTAL_JOURNAL_PATH),
+            connect=replica_router.connect_primary,
+            batch_size=WRITE_BEHIND_BATCH_SIZE,
+            flush_interval=WRITE_BEHIND_FLUSH_MS / 1000,
         )
-        return conn
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+        await run_in_threadpool(write_behind.start)
+    else:
+        await run_in_threadpool(availability_view.load)
+        observe_availability("postgres", availability_view.apply_event)
+
+
+async def shutdown():
+    global write_behind
+    if write_behind is not None:
+        await run_in_threadpool(write_behind.stop)
+        write_behind = None
+        release_worker_lock(WORKER_LOCK_PATH)
+    else:
+        unobserve_availability("postgres", availability_view.apply_event)
 
 
-@router.get("/active", response_model=List[Dict[str, Any]])
-async def get_active_rentals():
+@router.get("/active", response_model=Union[List[Dict[str, Any]], Dict[str, Any]])
+async def get_active_rentals(fields: Optional[str] = None, shape: Literal["nested", "normalized"] = "nested"):
     """Get all active rentals from PostgreSQL"""
     try:
-        conn = get_postgres_connection()
+        conn = get_postgres_connection(read_only=True)
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        cursor.execute("""
+        details, joins = rental_details()
+        cursor.execute(f"""
             SELECT 
                 r.id, r.user_id, r.book_id, 
                 r.rental_date, r.due_date, r.return_date, r.is_returned,
-                u.full_name, u.email,
-                b.title, b.author,
+                {details},
                 CASE 
                     WHEN r.due_date < NOW() THEN true 
                     ELSE false 
                 END as is_overdue
-            FROM rentals r
-            JOIN users u ON r.user_id = u.id
-            JOIN books b ON r.book_id = b.id
+            FROM rentals r {joins}
             WHERE r.is_returned = false
             ORDER BY r.due_date ASC
         """)
@@ -79,8 +155,10 @@ async def get_active_rentals():
             })
         
         conn.close()
-        return rentals_list
+        return shape_list(rentals_list, fields, shape, RENTAL_REFERENCES)
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.close()
@@ -88,57 +166,61 @@ async def get_active_rentals():
 
 
 @router.post("/rent", response_model=Dict[str, Any])
-async def rent_book(rental_data: RentalCreate):
-    """Rent a book in PostgreSQL"""
+def rent_book(
+    rental_data: RentalCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    """Rent a book in PostgreSQL; retries with the same Idempotency-Key get the first response"""
+    request_fingerprint = fingerprint("postgres-rentals/rent", rental_data.model_dump())
+    if write_behind is not None:
+        return run_idempotent(
+            get_postgres_connection, idempotency_key, "postgres-rentals/rent", request_fingerprint,
+            lambda: (202, write_behind.submit_rent(
+                rental_data.user_id, rental_data.book_id, rental_data.days_to_return
+            )),
+        )
+
+    conn = None
+    reserved = False
     try:
-        conn = get_postgres_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Check if user exists
-        cursor.execute("SELECT id, full_name FROM users WHERE id = %s", (rental_data.user_id,))
-        user = cursor.fetchone()
-        if not user:
-            conn.close()
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if book exists and has available quantity
-        cursor.execute("SELECT id, title, quantity FROM books WHERE id = %s", (rental_data.book_id,))
-        book = cursor.fetchone()
-        if not book:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Book not found")
-        
-        if book["quantity"] <= 0:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Book not available")
-        
-        # Check if user already has this book rented
-        cursor.execute("""
-            SELECT id FROM rentals 
-            WHERE user_id = %s AND book_id = %s AND is_returned = false
-        """, (rental_data.user_id, rental_data.book_id))
-        existing_rental = cursor.fetchone()
-        
-        if existing_rental:
-            conn.close()
-            raise HTTPException(status_code=400, detail="User already has this book rented")
+        if idempotency_key is not None:
+            # Before the view check, which would refuse a retry of a completed rental
+            conn = get_postgres_connection()
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            replay = claim_key(cursor, idempotency_key, "postgres-rentals/rent", request_fingerprint)
+            if replay is not None:
+                conn.close()
+                return replay
+        
+        # Unknown user/book, no copy left or already rented: refused from memory
+        user_name, book_title = availability_view.reserve_rent(rental_data.user_id, rental_data.book_id)
+        reserved = True
+        
+        if conn is None:
+            conn = get_postgres_connection()
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         # Calculate due date
         rental_date = datetime.now()
         due_date = rental_date + timedelta(days=rental_data.days_to_return)
         
-        # Create rental
-        cursor.execute("""
-            INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned)
-            VALUES (%s, %s, %s, %s, %s) RETURNING id
-        """, (rental_data.user_id, rental_data.book_id, rental_date, due_date, False))
-        
-        rental_id = cursor.fetchone()["id"]
-        
-        # Update book quantity
-        cursor.execute("UPDATE books SET quantity = quantity - 1 WHERE id = %s", (rental_data.book_id,))
-        
-        conn.commit()
+        # Take a copy and create the rental in one conditional write
+        rental_id, refused = conditional_rent(
+            cursor, "postgres", rental_data.user_id, rental_data.book_id, rental_date, due_date
+        )
+        if refused is not None:
+            # The view was stale
+            conn.rollback()
+            conn.close()
+            reserved = False
+            raise availability_view.rejected_rent(
+                rental_data.user_id, rental_data.book_id, duplicate=refused == "duplicate"
+            )
+        
+        record_rollup(cursor, "rent", rental_date, "postgres")
+        availability_change(
+            cursor, "postgres", rental_data.book_id, "rent", user_id=rental_data.user_id, rental_id=rental_id
+        )
         
         rental_dict = {
             "id": rental_id,
@@ -147,53 +229,76 @@ async def rent_book(rental_data: RentalCreate):
             "rental_date": rental_date.isoformat(),
             "due_date": due_date.isoformat(),
             "is_returned": False,
-            "user_name": user["full_name"],
-            "book_title": book["title"],
-            "message": f"Book '{book['title']}' rented to {user['full_name']} until {due_date.strftime('%Y-%m-%d')}"
+            "user_name": user_name,
+            "book_title": book_title,
+            "message": f"Book '{book_title}' rented to {user_name} until {due_date.strftime('%Y-%m-%d')}"
         }
         
+        if idempotency_key is not None:
+            remember_response(cursor, idempotency_key, "postgres-rentals/rent", rental_dict)
+        conn.commit()
+        availability_view.confirm_rent(rental_id, rental_data.user_id, rental_data.book_id)
         conn.close()
         return rental_dict
     
     except HTTPException:
+        if reserved:
+            availability_view.release_rent(rental_data.user_id, rental_data.book_id)
+        if conn is not None:
+            conn.close()
         raise
     except Exception as e:
-        if 'conn' in locals():
+        if reserved:
+            availability_view.release_rent(rental_data.user_id, rental_data.book_id)
+        if conn is not None:
             conn.rollback()
             conn.close()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
 @router.post("/return", response_model=Dict[str, Any])
-async def return_book(return_data: RentalReturn):
-    """Return a book in PostgreSQL"""
+def return_book(
+    return_data: RentalReturn,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    """Return a book in PostgreSQL; retries with the same Idempotency-Key get the first response"""
+    request_fingerprint = fingerprint("postgres-rentals/return", return_data.model_dump())
+    if write_behind is not None:
+        return run_idempotent(
+            get_postgres_connection, idempotency_key, "postgres-rentals/return", request_fingerprint,
+            lambda: (202, write_behind.submit_return(return_data.rental_id, return_data.book_id)),
+        )
+
     try:
         conn = get_postgres_connection()
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
+        if idempotency_key is not None:
+            replay = claim_key(cursor, idempotency_key, "postgres-rentals/return", request_fingerprint)
+            if replay is not None:
+                conn.close()
+                return replay
+        
+        details, joins = rental_details()
         rental = None
         
         if return_data.rental_id:
             # Find by rental ID
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
                     r.id, r.user_id, r.book_id, r.is_returned,
-                    u.full_name, b.title
-                FROM rentals r
-                JOIN users u ON r.user_id = u.id
-                JOIN books b ON r.book_id = b.id
+                    {details}
+                FROM rentals r {joins}
                 WHERE r.id = %s
             """, (return_data.rental_id,))
             rental = cursor.fetchone()
         elif return_data.book_id:
             # Find active rental by book ID
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
                     r.id, r.user_id, r.book_id, r.is_returned,
-                    u.full_name, b.title
-                FROM rentals r
-                JOIN users u ON r.user_id = u.id
-                JOIN books b ON r.book_id = b.id
+                    {details}
+                FROM rentals r {joins}
                 WHERE r.book_id = %s AND r.is_returned = false
                 ORDER BY r.rental_date DESC
                 LIMIT 1
@@ -216,10 +321,20 @@ async def return_book(return_data: RentalReturn):
             WHERE id = %s
         """, (return_date, rental["id"]))
         
-        # Update book quantity
-        cursor.execute("UPDATE books SET quantity = quantity + 1 WHERE id = %s", (rental["book_id"],))
+        # Hand the copy to the next hold, or put it back on the shelf
+        handed_to = hand_off(cursor, "postgres", rental["book_id"], return_date)
+        if handed_to is None:
+            cursor.execute("UPDATE books SET quantity = quantity + 1 WHERE id = %s", (rental["book_id"],))
         
-        conn.commit()
+        record_rollup(cursor, "return", return_date, "postgres")
+        availability_change(
+            cursor, "postgres", rental["book_id"], "return", user_id=rental["user_id"], rental_id=rental["id"]
+        )
+        if handed_to is not None:
+            availability_change(
+                cursor, "postgres", rental["book_id"], "rent",
+                user_id=handed_to["user_id"], rental_id=handed_to["rental_id"]
+            )
         
         return_dict = {
             "rental_id": rental["id"],
@@ -228,9 +343,17 @@ async def return_book(return_data: RentalReturn):
             "return_date": return_date.isoformat(),
             "user_name": rental["full_name"],
             "book_title": rental["title"],
-            "message": f"Book '{rental['title']}' returned by {rental['full_name']}"
+            "message": f"Book '{rental['title']}' returned by {rental['full_name']}",
+            "handed_to_hold": handed_to
         }
         
+        if idempotency_key is not None:
+            remember_response(cursor, idempotency_key, "postgres-rentals/return", return_dict)
+        conn.commit()
+        availability_view.confirm_return(rental["id"], rental["user_id"], rental["book_id"])
+        if handed_to is not None:
+            availability_view.hand_off(handed_to["rental_id"], handed_to["user_id"], handed_to["book_id"])
+            publish_hold(handed_to)
         conn.close()
         return return_dict
     
@@ -243,15 +366,298 @@ async def return_book(return_data: RentalReturn):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
-@router.get("/stats/summary")
-async def get_rentals_stats():
-    """Get rentals statistics from PostgreSQL"""
+def _item_outcome(submit: Callable[[], Dict[str, Any]], status_code: int) -> Dict[str, Any]:
+    """One bulk item run through a single-item path: its response, or the error it raised"""
+    try:
+        return dict(submit(), status_code=status_code)
+    except HTTPException as e:
+        return {"status_code": e.status_code, "detail": e.detail}
+
+
+def _bulk_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    items = [dict(result, index=index) for index, result in enumerate(results)]
+    succeeded = sum(1 for item in items if item["status_code"] < 300)
+    return {"succeeded": succeeded, "failed": len(items) - succeeded, "items": items}
+
+
+@router.post("/bulk/rent", response_model=Dict[str, Any])
+def bulk_rent_books(
+    bulk_data: BulkRentalCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    """
+    Rent many books in one transaction. Each item gets the response (or the
+    status_code and detail of the error) POST /rent would have given it.
+    """
+    request_fingerprint = fingerprint("postgres-rentals/bulk/rent", bulk_data.model_dump())
+    if write_behind is not None:
+        return run_idempotent(
+            get_postgres_connection, idempotency_key, "postgres-rentals/bulk/rent", request_fingerprint,
+            lambda: (202, _bulk_response([
+                _item_outcome(lambda: write_behind.submit_rent(item.user_id, item.book_id, item.days_to_return), 202)
+                for item in bulk_data.items
+            ])),
+        )
+
+    conn = None
+    reserved = []
+    try:
+        conn = get_postgres_connection()
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        if idempotency_key is not None:
+            replay = claim_key(cursor, idempotency_key, "postgres-rentals/bulk/rent", request_fingerprint)
+            if replay is not None:
+                conn.close()
+                return replay
+        
+        # Refused from memory item by item; a pair repeated in the batch is
+        # refused as already rented
+        results: List[Optional[Dict[str, Any]]] = []
+        pending = []
+        for position, item in enumerate(bulk_data.items):
+            try:
+                user_name, book_title = availability_view.reserve_rent(item.user_id, item.book_id)
+            except HTTPException as e:
+                results.append({"status_code": e.status_code, "detail": e.detail})
+                continue
+            reserved.append((item.user_id, item.book_id))
+            pending.append((position, item, user_name, book_title))
+            results.append(None)
+        
+        rental_date = datetime.now()
+        outcomes = bulk_rent(cursor, [
+            (item.user_id, item.book_id, rental_date + timedelta(days=item.days_to_return))
+            for _, item, _, _ in pending
+        ], rental_date)
+        
+        confirmed = []
+        for (position, item, user_name, book_title), (rental_id, refused) in zip(pending, outcomes):
+            if refused is not None:
+                # The view was stale
+                reserved.remove((item.user_id, item.book_id))
+                error = availability_view.rejected_rent(item.user_id, item.book_id, duplicate=refused == "duplicate")
+                results[position] = {"status_code": error.status_code, "detail": error.detail}
+                continue
+            due_date = rental_date + timedelta(days=item.days_to_return)
+            results[position] = {
+                "status_code": 200,
+                "id": rental_id,
+                "user_id": item.user_id,
+                "book_id": item.book_id,
+                "rental_date": rental_date.isoformat(),
+                "due_date": due_date.isoformat(),
+                "is_returned": False,
+                "user_name": user_name,
+                "book_title": book_title,
+                "message": f"Book '{book_title}' rented to {user_name} until {due_date.strftime('%Y-%m-%d')}"
+            }
+            confirmed.append((rental_id, item.user_id, item.book_id))
+        
+        response = _bulk_response(results)
+        if idempotency_key is not None:
+            remember_response(cursor, idempotency_key, "postgres-rentals/bulk/rent", response)
+        conn.commit()
+        for rental_id, user_id, book_id in confirmed:
+            availability_view.confirm_rent(rental_id, user_id, book_id)
+        conn.close()
+        return response
+    
+    except HTTPException:
+        for user_id, book_id in reserved:
+            availability_view.release_rent(user_id, book_id)
+        if conn is not None:
+            conn.close()
+        raise
+    except Exception as e:
+        for user_id, book_id in reserved:
+            availability_view.release_rent(user_id, book_id)
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.post("/bulk/return", response_model=Dict[str, Any])
+def bulk_return_books(
+    bulk_data: BulkRentalReturn,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    """
+    Return many books in one transaction. Each item gets the response (or the
+    status_code and detail of the error) POST /return would have given it.
+    """
+    request_fingerprint = fingerprint("postgres-rentals/bulk/return", bulk_data.model_dump())
+    if write_behind is not None:
+        return run_idempotent(
+            get_postgres_connection, idempotency_key, "postgres-rentals/bulk/return", request_fingerprint,
+            lambda: (202, _bulk_response([
+                _item_outcome(lambda: write_behind.submit_return(item.rental_id, item.book_id), 202)
+                for item in bulk_data.items
+            ])),
+        )
+
     try:
         conn = get_postgres_connection()
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
+        if idempotency_key is not None:
+            replay = claim_key(cursor, idempotency_key, "postgres-rentals/bulk/return", request_fingerprint)
+            if replay is not None:
+                conn.close()
+                return replay
+        
+        return_date = datetime.now()
+        outcomes = bulk_return(cursor, [(item.rental_id, item.book_id) for item in bulk_data.items], return_date)
+        
+        results = []
+        for outcome in outcomes:
+            if outcome["status_code"] != 200:
+                results.append(outcome)
+                continue
+            rental = outcome["rental"]
+            results.append({
+                "status_code": 200,
+                "rental_id": rental["id"],
+                "user_id": rental["user_id"],
+                "book_id": rental["book_id"],
+                "return_date": return_date.isoformat(),
+                "user_name": rental["full_name"],
+                "book_title": rental["title"],
+                "message": f"Book '{rental['title']}' returned by {rental['full_name']}",
+                "handed_to_hold": outcome["handed_to"]
+            })
+        
+        response = _bulk_response(results)
+        if idempotency_key is not None:
+            remember_response(cursor, idempotency_key, "postgres-rentals/bulk/return", response)
+        conn.commit()
+        for outcome in outcomes:
+            if outcome["status_code"] != 200:
+                continue
+            rental, handed_to = outcome["rental"], outcome["handed_to"]
+            availability_view.confirm_return(rental["id"], rental["user_id"], rental["book_id"])
+            if handed_to is not None:
+                availability_view.hand_off(handed_to["rental_id"], handed_to["user_id"], handed_to["book_id"])
+                publish_hold(handed_to)
+        conn.close()
+        return response
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.post("/holds", response_model=Dict[str, Any])
+def create_hold(hold_data: HoldCreate):
+    """Queue a user for the next returned copy of an unavailable book"""
+    try:
+        conn = get_postgres_connection()
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        hold = place_hold(cursor, "postgres", hold_data.user_id, hold_data.book_id, hold_data.days_to_return)
+        conn.commit()
+        conn.close()
+        return hold
+    
+    except HTTPException:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+def _load_hold(hold_id: int) -> Dict[str, Any]:
+    conn = get_postgres_connection()
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return get_hold(cursor, "postgres", hold_id)
+    finally:
+        conn.close()
+
+
+@router.get("/holds/{hold_id}", response_model=Dict[str, Any])
+def get_hold_status(hold_id: int):
+    """Hold status and queue position"""
+    try:
+        return _load_hold(hold_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.delete("/holds/{hold_id}", response_model=Dict[str, Any])
+def delete_hold(hold_id: int):
+    """Cancel a waiting hold"""
+    try:
+        conn = get_postgres_connection()
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        hold = cancel_hold(cursor, "postgres", hold_id)
+        conn.commit()
+        conn.close()
+        publish_hold(hold)
+        return hold
+    
+    except HTTPException:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.get("/holds/{hold_id}/wait", response_model=Dict[str, Any])
+async def wait_hold(hold_id: int, timeout: float = Query(30, gt=0, le=HOLD_WAIT_MAX_SECONDS)):
+    """Long-poll: answers when the hold is fulfilled or cancelled, or after `timeout` seconds"""
+    return await wait_for_hold(lambda: _load_hold(hold_id), hold_id, timeout, SSE_HEARTBEAT_SECONDS)
+
+
+@router.get("/holds/{hold_id}/events")
+async def stream_hold_events(hold_id: int, request: Request):
+    """Server-sent events with the hold's state, until it is fulfilled or cancelled"""
+    await run_in_threadpool(_load_hold, hold_id)
+    return StreamingResponse(
+        hold_event_stream(lambda: _load_hold(hold_id), hold_id, SSE_HEARTBEAT_SECONDS, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/reservations/{token}")
+async def get_reservation_status(token: str):
+    """Persistence status of a write-behind rent/return"""
+    if write_behind is None:
+        raise HTTPException(status_code=404, detail="Write-behind mode is disabled")
+
+    status = write_behind.status(token)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return dict(status, reservation_token=token)
+
+
+@router.get("/stats/summary")
+@coalesced("postgres-rentals.get_rentals_stats", vary=prefers_primary)
+def get_rentals_stats(include_history: bool = False):
+    """Get rentals statistics from PostgreSQL; archived rentals count only with `include_history`"""
+    try:
+        conn = get_postgres_connection(read_only=True)
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        
         # Total rentals
-        cursor.execute("SELECT COUNT(*) as total FROM rentals")
+        source = rental_source(include_history)
+        cursor.execute(f"SELECT COUNT(*) as total FROM {source} r")
         total = cursor.fetchone()["total"]
         
         # Active rentals
@@ -267,9 +673,9 @@ async def get_rentals_stats():
         overdue = cursor.fetchone()["overdue"]
         
         # Most popular books
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT b.title, b.author, COUNT(*) as rental_count
-            FROM rentals r
+            FROM {source} r
             JOIN books b ON r.book_id = b.id
             GROUP BY r.book_id, b.title, b.author
             ORDER BY rental_count DESC
@@ -300,4 +706,37 @@ async def get_rentals_stats():
     except Exception as e:
         if 'conn' in locals():
             conn.close()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.get("/stats/timeseries")
+@coalesced("postgres-rentals.get_rentals_timeseries", vary=prefers_primary)
+def get_rentals_timeseries(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: Literal["hour", "day"] = "day"
+):
+    """Rentals and returns per hour/day in [from, to), read from the rollup table"""
+    end = local_naive(end) or datetime.now()
+    start = local_naive(start) or end - timedelta(days=30)
+    try:
+        conn = get_postgres_connection(read_only=True)
+        cursor = conn.cursor()
+        series = query_rollups(cursor, "postgres", granularity, start, end)
+        conn.close()
+        return {
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "series": series,
+            "database": "PostgreSQL"
+        }
+
+    except HTTPException:
+        if 'conn' in locals():
+            conn.close()
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
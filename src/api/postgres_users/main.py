@@ -1,9 +1,14 @@
 import psycopg2
 import psycopg2.extras
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from fastapi import APIRouter, Header, HTTPException, Query
+from typing import List, Dict, Any, Literal, Optional
 from pydantic import BaseModel
 
+from src.utils.idempotency import IDEMPOTENCY_KEY_MAX_LENGTH, claim_key, fingerprint, remember_response
+from src.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, rental_history_page
+from src.utils.payload import shape_list
+from src.utils.postgres_utils import get_postgres_connection
+
 router = APIRouter(prefix="/postgres-users", tags=["postgres-users"])
 
 
@@ -13,29 +18,14 @@ class UserCreate(BaseModel):
     phone: str = None
 
 
-def get_postgres_connection():
-    """Get PostgreSQL database connection"""
-    try:
-        conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database="library_db",
-            user="user",
-            password="123"
-        )
-        return conn
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-
-
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_users():
+async def get_all_users(fields: Optional[str] = None):
     """Get all users from PostgreSQL"""
     try:
-        conn = get_postgres_connection()
+        conn = get_postgres_connection(read_only=True)
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        cursor.execute("SELECT id, full_name, email, phone FROM users ORDER BY id")
+        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE deleted_at IS NULL ORDER BY id")
         users = cursor.fetchall()
         
         users_list = []
@@ -48,8 +38,10 @@ async def get_all_users():
             })
         
         conn.close()
-        return users_list
+        return shape_list(users_list, fields)
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.close()
@@ -57,14 +49,26 @@ async def get_all_users():
 
 
 @router.post("/", response_model=Dict[str, Any])
-async def create_user(user_data: UserCreate):
-    """Create new user in PostgreSQL"""
+async def create_user(
+    user_data: UserCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    """Create new user in PostgreSQL; retries with the same Idempotency-Key get the first response"""
     try:
         conn = get_postgres_connection()
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
+        if idempotency_key is not None:
+            replay = claim_key(
+                cursor, idempotency_key, "postgres-users/create",
+                fingerprint("postgres-users/create", user_data.model_dump()),
+            )
+            if replay is not None:
+                conn.close()
+                return replay
+        
         # Check if email already exists
-        cursor.execute("SELECT id FROM users WHERE email = %s", (user_data.email,))
+        cursor.execute("SELECT id FROM users WHERE email = %s AND deleted_at IS NULL", (user_data.email,))
         existing_user = cursor.fetchone()
         
         if existing_user:
@@ -79,10 +83,9 @@ async def create_user(user_data: UserCreate):
         )
         
         user_id = cursor.fetchone()["id"]
-        conn.commit()
         
         # Get the created user
-        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE id = %s", (user_id,))
+        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE id = %s AND deleted_at IS NULL", (user_id,))
         user = cursor.fetchone()
         
         user_dict = {
@@ -92,6 +95,9 @@ async def create_user(user_data: UserCreate):
             "phone": user["phone"]
         }
         
+        if idempotency_key is not None:
+            remember_response(cursor, idempotency_key, "postgres-users/create", user_dict)
+        conn.commit()
         conn.close()
         return user_dict
     
@@ -104,15 +110,37 @@ async def create_user(user_data: UserCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@router.get("/{user_id}/rentals")
+def get_user_rentals(
+    user_id: int,
+    status: Optional[Literal["active", "returned", "overdue"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    include_history: bool = False
+):
+    """Get a user's rentals from PostgreSQL, newest first, with keyset pagination"""
+    try:
+        conn = get_postgres_connection(read_only=True)
+        try:
+            db_cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            return rental_history_page(db_cursor, "postgres", "user", user_id, status, cursor, limit, include_history)
+        finally:
+            conn.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
 @router.get("/stats/summary")
 async def get_users_stats():
     """Get users statistics from PostgreSQL"""
     try:
-        conn = get_postgres_connection()
+        conn = get_postgres_connection(read_only=True)
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         # Get total users count
-        cursor.execute("SELECT COUNT(*) as total FROM users")
+        cursor.execute("SELECT COUNT(*) as total FROM users WHERE deleted_at IS NULL")
         total = cursor.fetchone()["total"]
         
         # Get users with active rentals
@@ -1,27 +1,22 @@
-import sqlite3
-import os
-from fastapi import APIRouter
-from typing import List, Dict, Any
-
-router = APIRouter(prefix="/simple-books", tags=["simple-books"])
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Dict, Any, Literal, Optional
 
+from settings import RECOMMENDATION_TOP_K
+from src.utils.db_backends import get_db_connection
+from src.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, rental_history_page
+from src.utils.payload import shape_list
 
-def get_db_connection():
-    """Get SQLite database connection"""
-    db_path = os.path.abspath("library.db")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+router = APIRouter(prefix="/simple-books", tags=["simple-books"])
 
 
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_books():
+async def get_all_books(fields: Optional[str] = None):
     """Get all books using direct SQLite connection"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, title, author, year, quantity FROM books")
+        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE deleted_at IS NULL")
         books = cursor.fetchall()
         
         books_list = []
@@ -35,8 +30,10 @@ async def get_all_books():
             })
         
         conn.close()
-        return books_list
+        return shape_list(books_list, fields)
     
+    except HTTPException:
+        raise
     except Exception as e:
         conn.close()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -51,7 +48,7 @@ async def get_book_by_id(book_id: int):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = ?", (book_id,))
+        cursor.execute("SELECT id, title, author, year, quantity FROM books WHERE id = ? AND deleted_at IS NULL", (book_id,))
         book = cursor.fetchone()
         
         if not book:
@@ -77,6 +74,75 @@ async def get_book_by_id(book_id: int):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@router.get("/{book_id}/rentals")
+async def get_book_rentals(
+    book_id: int,
+    status: Optional[Literal["active", "returned", "overdue"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    include_history: bool = False
+):
+    """Get a book's rentals from SQLite, newest first, with keyset pagination"""
+    try:
+        conn = get_db_connection()
+        try:
+            db_cursor = conn.cursor()
+            return rental_history_page(db_cursor, "sqlite", "book", book_id, status, cursor, limit, include_history)
+        finally:
+            conn.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.get("/{book_id}/similar")
+async def get_similar_books(book_id: int, limit: int = Query(RECOMMENDATION_TOP_K, ge=1, le=RECOMMENDATION_TOP_K)):
+    """Books most often rented by the same users, from the precomputed similarity index"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Primary key lookup (book_id, rank): at most `limit` rows
+        cursor.execute("""
+            SELECT s.rank, s.similar_book_id, s.score, s.co_rentals, b.title, b.author
+            FROM book_similarities s
+            JOIN books b ON b.id = s.similar_book_id AND b.deleted_at IS NULL
+            WHERE s.book_id = ?
+            ORDER BY s.rank
+            LIMIT ?
+        """, (book_id, limit))
+        similar = cursor.fetchall()
+        
+        if not similar:
+            cursor.execute("SELECT id FROM books WHERE id = ? AND deleted_at IS NULL", (book_id,))
+            if not cursor.fetchone():
+                conn.close()
+                raise HTTPException(status_code=404, detail="Book not found")
+        
+        conn.close()
+        return {
+            "book_id": book_id,
+            "similar": [
+                {
+                    "book_id": book["similar_book_id"],
+                    "title": book["title"],
+                    "author": book["author"],
+                    "score": book["score"],
+                    "co_rentals": book["co_rentals"]
+                }
+                for book in similar
+            ]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
 @router.get("/stats/summary")
 async def get_books_stats():
     """Get books statistics"""
@@ -85,17 +151,18 @@ async def get_books_stats():
         cursor = conn.cursor()
         
         # Get total books count
-        cursor.execute("SELECT COUNT(*) as total FROM books")
+        cursor.execute("SELECT COUNT(*) as total FROM books WHERE deleted_at IS NULL")
         total = cursor.fetchone()["total"]
         
         # Get total quantity
-        cursor.execute("SELECT SUM(quantity) as total_qty FROM books")
+        cursor.execute("SELECT SUM(quantity) as total_qty FROM books WHERE deleted_at IS NULL")
         total_qty = cursor.fetchone()["total_qty"]
         
         # Get books by decade
         cursor.execute("""
             SELECT (year/10)*10 as decade, COUNT(*) as count 
-            FROM books 
+            FROM books
+            WHERE deleted_at IS NULL
             GROUP BY decade 
             ORDER BY decade
         """)
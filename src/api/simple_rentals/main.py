@@ -1,10 +1,34 @@
-import sqlite3
-import os
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Literal, Optional, Union
 from pydantic import BaseModel
 
+from settings import HOLD_WAIT_MAX_SECONDS, RENTAL_SNAPSHOTS_ENABLED, SQLITE_PATH, SSE_HEARTBEAT_SECONDS
+from src.utils.archive import rental_source
+from src.utils.availability import AvailabilityView, conditional_rent
+from src.utils.availability_events import (
+    availability_change,
+    observe_availability,
+    publish_availability,
+    unobserve_availability,
+)
+from src.utils.db_backends import get_db_connection
+from src.utils.holds import (
+    cancel_hold,
+    get_hold,
+    hand_off,
+    hold_event_stream,
+    place_hold,
+    publish_hold,
+    wait_for_hold,
+)
+from src.utils.payload import RENTAL_REFERENCES, shape_list
+from src.utils.rollups import local_naive, query_rollups, record_rollup
+from src.utils.snapshots import rental_details
+from src.utils.worker_lock import acquire_worker_lock, release_worker_lock
+
 router = APIRouter(prefix="/simple-rentals", tags=["simple-rentals"])
 
 
@@ -19,30 +43,52 @@ class RentalReturn(BaseModel):
     book_id: Optional[int] = None
 
 
-def get_db_connection():
-    """Get SQLite database connection"""
-    db_path = os.path.abspath("library.db")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+class HoldCreate(BaseModel):
+    user_id: int
+    book_id: int
+    days_to_return: int = 14
+
+
+# Rentals are pre-checked against this view, loaded at startup and kept
+# current by this process's availability events. Rentals made by other
+# workers (and the ORM routers) never reach it, so only the conditional
+# write may refuse a rental for want of a copy or as a duplicate.
+availability_view = AvailabilityView(
+    connect=get_db_connection, placeholder="?", follow_events=True, trust_refusals=False
+)
+# Held while serving: a second worker on the same database refuses to start
+WORKER_LOCK_PATH = f"{SQLITE_PATH}.worker.lock"
+
+
+async def startup():
+    acquire_worker_lock(WORKER_LOCK_PATH, "The sqlite router group")
+    await run_in_threadpool(availability_view.load)
+    observe_availability("sqlite", availability_view.apply_event)
 
 
-@router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_rentals():
-    """Get all rentals with book and user details"""
+async def shutdown():
+    unobserve_availability("sqlite", availability_view.apply_event)
+    release_worker_lock(WORKER_LOCK_PATH)
+
+@router.get("/", response_model=Union[List[Dict[str, Any]], Dict[str, Any]])
+async def get_all_rentals(
+    fields: Optional[str] = None,
+    shape: Literal["nested", "normalized"] = "nested",
+    include_history: bool = False
+):
+    """Get all rentals with book and user details; archived rentals only with `include_history`"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
+        # Archived rentals carry no snapshots
+        details, joins = rental_details(RENTAL_SNAPSHOTS_ENABLED and not include_history)
+        cursor.execute(f"""
             SELECT 
                 r.id, r.user_id, r.book_id, 
                 r.rental_date, r.due_date, r.return_date, r.is_returned,
-                u.full_name, u.email,
-                b.title, b.author
-            FROM rentals r
-            JOIN users u ON r.user_id = u.id
-            JOIN books b ON r.book_id = b.id
+                {details}
+            FROM {rental_source(include_history)} r {joins}
             ORDER BY r.rental_date DESC
         """)
         rentals = cursor.fetchall()
@@ -68,34 +114,34 @@ async def get_all_rentals():
             })
         
         conn.close()
-        return rentals_list
+        return shape_list(rentals_list, fields, shape, RENTAL_REFERENCES)
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.close()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
-@router.get("/active", response_model=List[Dict[str, Any]])
-async def get_active_rentals():
+@router.get("/active", response_model=Union[List[Dict[str, Any]], Dict[str, Any]])
+async def get_active_rentals(fields: Optional[str] = None, shape: Literal["nested", "normalized"] = "nested"):
     """Get all active (not returned) rentals"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
+        details, joins = rental_details()
+        cursor.execute(f"""
             SELECT 
                 r.id, r.user_id, r.book_id, 
                 r.rental_date, r.due_date, r.return_date, r.is_returned,
-                u.full_name, u.email,
-                b.title, b.author,
+                {details},
                 CASE 
                     WHEN date(r.due_date) < date('now') THEN 1 
                     ELSE 0 
                 END as is_overdue
-            FROM rentals r
-            JOIN users u ON r.user_id = u.id
-            JOIN books b ON r.book_id = b.id
+            FROM rentals r {joins}
             WHERE r.is_returned = 0
             ORDER BY r.due_date ASC
         """)
@@ -121,8 +167,10 @@ async def get_active_rentals():
             })
         
         conn.close()
-        return rentals_list
+        return shape_list(rentals_list, fields, shape, RENTAL_REFERENCES)
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.close()
@@ -132,88 +180,66 @@ async def get_active_rentals():
 @router.post("/rent", response_model=Dict[str, Any])
 async def rent_book(rental_data: RentalCreate):
     """Rent a book to a user"""
+    conn = None
+    reserved = False
     try:
+        # Unknown user/book: refused from memory
+        user_name, book_title = availability_view.reserve_rent(rental_data.user_id, rental_data.book_id)
+        reserved = True
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if user exists
-        cursor.execute("SELECT id, full_name FROM users WHERE id = ?", (rental_data.user_id,))
-        user = cursor.fetchone()
-        if not user:
-            conn.close()
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if book exists and has available quantity
-        cursor.execute("SELECT id, title, quantity FROM books WHERE id = ?", (rental_data.book_id,))
-        book = cursor.fetchone()
-        if not book:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Book not found")
-        
-        if book["quantity"] <= 0:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Book not available")
-        
-        # Check if user already has this book rented
-        cursor.execute("""
-            SELECT id FROM rentals 
-            WHERE user_id = ? AND book_id = ? AND is_returned = 0
-        """, (rental_data.user_id, rental_data.book_id))
-        existing_rental = cursor.fetchone()
-        
-        if existing_rental:
-            conn.close()
-            raise HTTPException(status_code=400, detail="User already has this book rented")
-        
         # Calculate due date
         rental_date = datetime.now()
         due_date = rental_date + timedelta(days=rental_data.days_to_return)
         
-        # Create rental
-        cursor.execute("""
-            INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned)
-            VALUES (?, ?, ?, ?, 0)
-        """, (rental_data.user_id, rental_data.book_id, rental_date.isoformat(), due_date.isoformat()))
-        
-        rental_id = cursor.lastrowid
-        
-        # Update book quantity
-        cursor.execute("UPDATE books SET quantity = quantity - 1 WHERE id = ?", (rental_data.book_id,))
-        
+        # Take a copy and create the rental in one conditional write
+        rental_id, refused = conditional_rent(
+            cursor, "sqlite", rental_data.user_id, rental_data.book_id, rental_date, due_date
+        )
+        if refused is not None:
+            # The view was stale
+            conn.rollback()
+            conn.close()
+            reserved = False
+            raise availability_view.rejected_rent(
+                rental_data.user_id, rental_data.book_id, duplicate=refused == "duplicate"
+            )
+        
+        record_rollup(cursor, "rent", rental_date, "sqlite")
+        availability = availability_change(
+            cursor, "sqlite", rental_data.book_id, "rent", user_id=rental_data.user_id, rental_id=rental_id
+        )
         conn.commit()
-        
-        # Get the created rental
-        cursor.execute("""
-            SELECT 
-                r.id, r.user_id, r.book_id, 
-                r.rental_date, r.due_date, r.return_date, r.is_returned,
-                u.full_name, b.title
-            FROM rentals r
-            JOIN users u ON r.user_id = u.id
-            JOIN books b ON r.book_id = b.id
-            WHERE r.id = ?
-        """, (rental_id,))
-        rental = cursor.fetchone()
+        availability_view.confirm_rent(rental_id, rental_data.user_id, rental_data.book_id)
+        publish_availability(availability)
         
         rental_dict = {
-            "id": rental["id"],
-            "user_id": rental["user_id"],
-            "book_id": rental["book_id"],
-            "rental_date": rental["rental_date"],
-            "due_date": rental["due_date"],
-            "is_returned": bool(rental["is_returned"]),
-            "user_name": rental["full_name"],
-            "book_title": rental["title"],
-            "message": f"Book '{rental['title']}' rented to {rental['full_name']} until {due_date.strftime('%Y-%m-%d')}"
+            "id": rental_id,
+            "user_id": rental_data.user_id,
+            "book_id": rental_data.book_id,
+            "rental_date": rental_date.isoformat(),
+            "due_date": due_date.isoformat(),
+            "is_returned": False,
+            "user_name": user_name,
+            "book_title": book_title,
+            "message": f"Book '{book_title}' rented to {user_name} until {due_date.strftime('%Y-%m-%d')}"
         }
         
         conn.close()
         return rental_dict
     
     except HTTPException:
+        if reserved:
+            availability_view.release_rent(rental_data.user_id, rental_data.book_id)
+        if conn is not None:
+            conn.close()
         raise
     except Exception as e:
-        if 'conn' in locals():
+        if reserved:
+            availability_view.release_rent(rental_data.user_id, rental_data.book_id)
+        if conn is not None:
             conn.close()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
@@ -225,29 +251,26 @@ async def return_book(return_data: RentalReturn):
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        details, joins = rental_details()
         rental = None
         
         if return_data.rental_id:
             # Find by rental ID
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
                     r.id, r.user_id, r.book_id, r.is_returned,
-                    u.full_name, b.title
-                FROM rentals r
-                JOIN users u ON r.user_id = u.id
-                JOIN books b ON r.book_id = b.id
+                    {details}
+                FROM rentals r {joins}
                 WHERE r.id = ?
             """, (return_data.rental_id,))
             rental = cursor.fetchone()
         elif return_data.book_id:
             # Find active rental by book ID
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
                     r.id, r.user_id, r.book_id, r.is_returned,
-                    u.full_name, b.title
-                FROM rentals r
-                JOIN users u ON r.user_id = u.id
-                JOIN books b ON r.book_id = b.id
+                    {details}
+                FROM rentals r {joins}
                 WHERE r.book_id = ? AND r.is_returned = 0
                 ORDER BY r.rental_date DESC
                 LIMIT 1
@@ -270,10 +293,28 @@ async def return_book(return_data: RentalReturn):
             WHERE id = ?
         """, (return_date.isoformat(), rental["id"]))
         
-        # Update book quantity
-        cursor.execute("UPDATE books SET quantity = quantity + 1 WHERE id = ?", (rental["book_id"],))
-        
+        # Hand the copy to the next hold, or put it back on the shelf
+        handed_to = hand_off(cursor, "sqlite", rental["book_id"], return_date)
+        if handed_to is None:
+            cursor.execute("UPDATE books SET quantity = quantity + 1 WHERE id = ?", (rental["book_id"],))
+        
+        record_rollup(cursor, "return", return_date, "sqlite")
+        availability = availability_change(
+            cursor, "sqlite", rental["book_id"], "return", user_id=rental["user_id"], rental_id=rental["id"]
+        )
+        handed_availability = None
+        if handed_to is not None:
+            handed_availability = availability_change(
+                cursor, "sqlite", rental["book_id"], "rent",
+                user_id=handed_to["user_id"], rental_id=handed_to["rental_id"]
+            )
         conn.commit()
+        availability_view.confirm_return(rental["id"], rental["user_id"], rental["book_id"])
+        publish_availability(availability)
+        if handed_to is not None:
+            availability_view.hand_off(handed_to["rental_id"], handed_to["user_id"], handed_to["book_id"])
+            publish_availability(handed_availability)
+            publish_hold(handed_to)
         
         return_dict = {
             "rental_id": rental["id"],
@@ -282,7 +323,8 @@ async def return_book(return_data: RentalReturn):
             "return_date": return_date.isoformat(),
             "user_name": rental["full_name"],
             "book_title": rental["title"],
-            "message": f"Book '{rental['title']}' returned by {rental['full_name']}"
+            "message": f"Book '{rental['title']}' returned by {rental['full_name']}",
+            "handed_to_hold": handed_to
         }
         
         conn.close()
@@ -296,15 +338,95 @@ async def return_book(return_data: RentalReturn):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@router.post("/holds", response_model=Dict[str, Any])
+async def create_hold(hold_data: HoldCreate):
+    """Queue a user for the next returned copy of an unavailable book"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        hold = place_hold(cursor, "sqlite", hold_data.user_id, hold_data.book_id, hold_data.days_to_return)
+        conn.commit()
+        conn.close()
+        return hold
+    
+    except HTTPException:
+        if 'conn' in locals():
+            conn.close()
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+def _load_hold(hold_id: int) -> Dict[str, Any]:
+    conn = get_db_connection()
+    try:
+        return get_hold(conn.cursor(), "sqlite", hold_id)
+    finally:
+        conn.close()
+
+
+@router.get("/holds/{hold_id}", response_model=Dict[str, Any])
+async def get_hold_status(hold_id: int):
+    """Hold status and queue position"""
+    try:
+        return _load_hold(hold_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.delete("/holds/{hold_id}", response_model=Dict[str, Any])
+async def delete_hold(hold_id: int):
+    """Cancel a waiting hold"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        hold = cancel_hold(cursor, "sqlite", hold_id)
+        conn.commit()
+        conn.close()
+        publish_hold(hold)
+        return hold
+    
+    except HTTPException:
+        if 'conn' in locals():
+            conn.close()
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.get("/holds/{hold_id}/wait", response_model=Dict[str, Any])
+async def wait_hold(hold_id: int, timeout: float = Query(30, gt=0, le=HOLD_WAIT_MAX_SECONDS)):
+    """Long-poll: answers when the hold is fulfilled or cancelled, or after `timeout` seconds"""
+    return await wait_for_hold(lambda: _load_hold(hold_id), hold_id, timeout, SSE_HEARTBEAT_SECONDS)
+
+
+@router.get("/holds/{hold_id}/events")
+async def stream_hold_events(hold_id: int, request: Request):
+    """Server-sent events with the hold's state, until it is fulfilled or cancelled"""
+    _load_hold(hold_id)
+    return StreamingResponse(
+        hold_event_stream(lambda: _load_hold(hold_id), hold_id, SSE_HEARTBEAT_SECONDS, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @router.get("/stats/summary")
-async def get_rentals_stats():
-    """Get rentals statistics"""
+async def get_rentals_stats(include_history: bool = False):
+    """Get rentals statistics; archived rentals count only with `include_history`"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # Total rentals
-        cursor.execute("SELECT COUNT(*) as total FROM rentals")
+        source = rental_source(include_history)
+        cursor.execute(f"SELECT COUNT(*) as total FROM {source} r")
         total = cursor.fetchone()["total"]
         
         # Active rentals
@@ -320,9 +442,9 @@ async def get_rentals_stats():
         overdue = cursor.fetchone()["overdue"]
         
         # Most popular books
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT b.title, b.author, COUNT(*) as rental_count
-            FROM rentals r
+            FROM {source} r
             JOIN books b ON r.book_id = b.id
             GROUP BY r.book_id
             ORDER BY rental_count DESC
@@ -353,4 +475,36 @@ async def get_rentals_stats():
     except Exception as e:
         if 'conn' in locals():
             conn.close()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@router.get("/stats/timeseries")
+async def get_rentals_timeseries(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: Literal["hour", "day"] = "day"
+):
+    """Rentals and returns per hour/day in [from, to), read from the rollup table"""
+    end = local_naive(end) or datetime.now()
+    start = local_naive(start) or end - timedelta(days=30)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        series = query_rollups(cursor, "sqlite", granularity, start, end)
+        conn.close()
+        return {
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "series": series,
+            "database": "SQLite"
+        }
+
+    except HTTPException:
+        if 'conn' in locals():
+            conn.close()
+        raise
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
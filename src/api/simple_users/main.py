@@ -1,9 +1,13 @@
-import sqlite3
-import os
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Dict, Any, Literal, Optional
 from pydantic import BaseModel
 
+from src.utils.db_backends import get_db_connection
+from src.utils.holds import cancel_holds_of, publish_hold
+from src.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, rental_history_page
+from src.utils.payload import shape_list
+
 router = APIRouter(prefix="/simple-users", tags=["simple-users"])
 
 
@@ -13,22 +17,14 @@ class UserCreate(BaseModel):
     phone: str = None
 
 
-def get_db_connection():
-    """Get SQLite database connection"""
-    db_path = os.path.abspath("library.db")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_users():
+async def get_all_users(fields: Optional[str] = None):
     """Get all users using direct SQLite connection"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, full_name, email, phone FROM users")
+        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE deleted_at IS NULL")
         users = cursor.fetchall()
         
         users_list = []
@@ -41,8 +37,10 @@ async def get_all_users():
             })
         
         conn.close()
-        return users_list
+        return shape_list(users_list, fields)
     
+    except HTTPException:
+        raise
     except Exception as e:
         if 'conn' in locals():
             conn.close()
@@ -56,7 +54,7 @@ async def get_user_by_id(user_id: int):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE id = ?", (user_id,))
+        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE id = ? AND deleted_at IS NULL", (user_id,))
         user = cursor.fetchone()
         
         if not user:
@@ -89,7 +87,7 @@ async def create_user(user_data: UserCreate):
         cursor = conn.cursor()
         
         # Check if email already exists
-        cursor.execute("SELECT id FROM users WHERE email = ?", (user_data.email,))
+        cursor.execute("SELECT id FROM users WHERE email = ? AND deleted_at IS NULL", (user_data.email,))
         existing_user = cursor.fetchone()
         
         if existing_user:
@@ -106,7 +104,7 @@ async def create_user(user_data: UserCreate):
         conn.commit()
         
         # Get the created user
-        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE id = ?", (user_id,))
+        cursor.execute("SELECT id, full_name, email, phone FROM users WHERE id = ? AND deleted_at IS NULL", (user_id,))
         user = cursor.fetchone()
         
         user_dict = {
@@ -129,34 +127,37 @@ async def create_user(user_data: UserCreate):
 
 @router.delete("/{user_id}")
 async def delete_user(user_id: int):
-    """Delete user by ID"""
+    """Soft-delete user by ID (see src/utils/tombstones.py)"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if user exists
-        cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
-        
-        if not user:
-            conn.close()
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if user has active rentals
-        cursor.execute("SELECT id FROM rentals WHERE user_id = ? AND is_returned = 0", (user_id,))
-        active_rentals = cursor.fetchall()
-        
-        if active_rentals:
+        # One statement: tombstone the user unless they have active rentals
+        # (a probe of the idx_rentals_user_id_book_id_active partial index)
+        cursor.execute("""
+            UPDATE users SET deleted_at = ?
+            WHERE id = ? AND deleted_at IS NULL
+              AND NOT EXISTS (SELECT 1 FROM rentals WHERE user_id = ? AND is_returned = 0)
+        """, (datetime.now().isoformat(), user_id, user_id))
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT id FROM users WHERE id = ? AND deleted_at IS NULL", (user_id,))
+            found = cursor.fetchone()
+            if not found:
+                conn.close()
+                raise HTTPException(status_code=404, detail="User not found")
+            cursor.execute("SELECT COUNT(*) FROM rentals WHERE user_id = ? AND is_returned = 0", (user_id,))
+            active_rentals = cursor.fetchone()[0]
             conn.close()
             raise HTTPException(
                 status_code=400, 
-                detail=f"Cannot delete user with {len(active_rentals)} active rentals"
+                detail=f"Cannot delete user with {active_rentals} active rentals"
             )
         
-        # Delete user
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        cancelled_holds = cancel_holds_of(cursor, "sqlite", "user_id", user_id)
         conn.commit()
         conn.close()
+        for hold in cancelled_holds:
+            publish_hold(hold)
         
         return {"message": f"User {user_id} deleted successfully"}
     
@@ -168,6 +169,28 @@ async def delete_user(user_id: int):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@router.get("/{user_id}/rentals")
+async def get_user_rentals(
+    user_id: int,
+    status: Optional[Literal["active", "returned", "overdue"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    include_history: bool = False
+):
+    """Get a user's rentals from SQLite, newest first, with keyset pagination"""
+    try:
+        conn = get_db_connection()
+        try:
+            db_cursor = conn.cursor()
+            return rental_history_page(db_cursor, "sqlite", "user", user_id, status, cursor, limit, include_history)
+        finally:
+            conn.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
 @router.get("/stats/summary")
 async def get_users_stats():
     """Get users statistics"""
@@ -176,7 +199,7 @@ async def get_users_stats():
         cursor = conn.cursor()
         
         # Get total users count
-        cursor.execute("SELECT COUNT(*) as total FROM users")
+        cursor.execute("SELECT COUNT(*) as total FROM users WHERE deleted_at IS NULL")
         total = cursor.fetchone()["total"]
         
         # Get users with active rentals
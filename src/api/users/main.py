@@ -18,7 +18,7 @@ async def get_all_users(session: AsyncSession = Depends(create_database_session)
 
 @router.post("/", response_model=UserResponse)
 async def create_user(user_data: UserCreate, session: AsyncSession = Depends(create_database_session)):
-    result = await session.execute(select(User).where(User.email == user_data.email))
+    result = await session.execute(select(User).where(User.email == user_data.email, User.deleted_at.is_(None)))
     existing_user = result.scalar_one_or_none()
     
     if existing_user:
@@ -0,0 +1,93 @@
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Pattern, Tuple
+
+from src.middleware.rate_limit import is_unlimited, matches, send_error
+
+# Rent/return may use the slots reserved for them, so a burst of reads can
+# never starve the requests that move books.
+PRIORITY_ROUTES: List[Tuple[str, Pattern]] = [
+    ("POST", re.compile(r"^/(simple-|postgres-)?rentals/(rent|return)$")),
+    ("POST", re.compile(r"^/postgres-rentals/bulk/(rent|return)$")),
+]
+
+
+class AdmissionController:
+    """
+    Global limit on requests doing database work at the same time. A request
+    waits up to `max_wait` seconds for a slot and is shed (503) after that:
+    a long wait means the database is saturated and queueing more work only
+    raises everyone's latency.
+    """
+
+    def __init__(self, max_concurrent: int, reserved_priority: int, max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.reserved_priority = min(reserved_priority, max_concurrent - 1)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.max_wait_seen = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, priority: bool) -> bool:
+        limit = self.max_concurrent if priority else self.max_concurrent - self.reserved_priority
+        started = time.monotonic()
+        async with self._condition:
+            if self.in_flight >= limit:
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.in_flight < limit), self.max_wait
+                    )
+                except asyncio.TimeoutError:
+                    self.shed += 1
+                    return False
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+        self.max_wait_seen = max(self.max_wait_seen, time.monotonic() - started)
+        return True
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "reserved_priority": self.reserved_priority,
+            "max_wait_seconds": self.max_wait,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "max_wait_seen_seconds": round(self.max_wait_seen, 4),
+        }
+
+
+class AdmissionMiddleware:
+    """Run each request under an AdmissionController slot; 503 + Retry-After when shed"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or is_unlimited(path):
+            await self.app(scope, receive, send)
+            return
+
+        priority = matches(scope["method"], path, PRIORITY_ROUTES)
+        if not await self.controller.acquire(priority):
+            await send_error(send, 503, "Server is overloaded, retry later", self.controller.max_wait)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await self.controller.release()
@@ -0,0 +1,150 @@
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+# Media types worth compressing. text/event-stream is excluded: events must
+# reach the client as soon as they are sent, not when a compressor flushes.
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "text/")
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def parse_accept_encoding(header: str) -> List[str]:
+    """Accepted codings, most preferred first (q=0 entries dropped)"""
+    codings = []
+    for position, part in enumerate(header.split(",")):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            codings.append((-quality, position, name.strip().lower()))
+    return [name for _, _, name in sorted(codings)]
+
+
+class _Compressor:
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        self.coding = coding
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.coding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish() if self.coding == "br" else self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies with brotli (when installed) or gzip, as
+    negotiated by Accept-Encoding.
+
+    Bodies smaller than `minimum_size` are sent as is. The first chunk is
+    held back until the threshold is reached or the response ends, so small
+    responses are never compressed and streamed ones are compressed chunk by
+    chunk without being buffered in full.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_coding(self, scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                for coding in parse_accept_encoding(value.decode("latin-1")):
+                    if coding == "br" and brotli is not None:
+                        return "br"
+                    if coding in ("gzip", "*"):
+                        return "gzip"
+                return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = self._choose_coding(scope)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        pending: List[bytes] = []
+        pending_size = 0
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_start(headers: List[Tuple[bytes, bytes]], compressed: bool,
+                             content_length: Optional[int] = None):
+            if compressed:
+                headers = [(name, value) for name, value in headers if name != b"content-length"]
+                headers.append((b"content-encoding", coding.encode()))
+                if content_length is not None:
+                    headers.append((b"content-length", str(content_length).encode()))
+            headers.append((b"vary", b"Accept-Encoding"))
+            await send(dict(start_message, headers=headers))
+
+        async def send_compressed(message):
+            nonlocal pending, pending_size, compressor, passthrough, start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+                passthrough = (
+                    b"content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(EXCLUDED_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = list(start_message.get("headers", []))
+
+            if compressor is None:
+                pending.append(body)
+                pending_size += len(body)
+                if pending_size < self.minimum_size:
+                    if more_body:
+                        return
+                    # Whole response is below the threshold
+                    await send_start(headers, compressed=False)
+                    await send({"type": "http.response.body", "body": b"".join(pending), "more_body": False})
+                    return
+                compressor = _Compressor(coding, self.gzip_level, self.brotli_quality)
+                body = b"".join(pending)
+                pending = []
+                if not more_body:
+                    data = compressor.compress(body) + compressor.finish()
+                    await send_start(headers, compressed=True, content_length=len(data))
+                    await send({"type": "http.response.body", "body": data, "more_body": False})
+                    return
+                await send_start(headers, compressed=True)
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
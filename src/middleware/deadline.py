@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import re
+from typing import List, Pattern, Tuple
+
+from src.middleware.rate_limit import is_unlimited, matches
+from src.utils.deadlines import Deadline, current_deadline
+
+logger = logging.getLogger(__name__)
+
+# Reports scan whole tables and get the longer report timeout
+REPORT_ROUTES: List[Tuple[str, Pattern]] = [
+    ("GET", re.compile(r"/stats/")),
+    ("GET", re.compile(r"^/analytics/")),
+]
+# Exports stream for as long as the table takes; streams and long-polls are
+# exempt as for rate limiting (see rate_limit.UNLIMITED_ROUTES)
+NO_DEADLINE_ROUTES: List[Pattern] = [
+    re.compile(r"^/exports/"),
+]
+
+
+class _DisconnectWatcher:
+    """
+    Reads the request's messages ahead of the app so a disconnect is seen
+    while the handler is still running, and hands them to the app in order.
+    """
+
+    def __init__(self, receive, on_disconnect):
+        self._receive = receive
+        self._on_disconnect = on_disconnect
+        self._messages: "asyncio.Queue" = asyncio.Queue()
+        self._disconnect = None
+
+    async def pump(self):
+        while True:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                self._disconnect = message
+                self._on_disconnect()
+            await self._messages.put(message)
+            if self._disconnect is not None:
+                return
+
+    async def receive(self):
+        if self._disconnect is not None and self._messages.empty():
+            return self._disconnect
+        return await self._messages.get()
+
+
+class DeadlineMiddleware:
+    """
+    Give every request `timeout` seconds (`report_timeout` for reports, 0:
+    no deadline) of database work. When they run out, or the client
+    disconnects first, the statements the request is running are cancelled
+    (see utils.deadlines) and the 500 the handler answers with becomes a 504.
+    """
+
+    def __init__(self, app, timeout: float, report_timeout: float):
+        self.app = app
+        self.timeout = timeout
+        self.report_timeout = report_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        if is_unlimited(path) or any(pattern.search(path) for pattern in NO_DEADLINE_ROUTES):
+            seconds = 0
+        else:
+            seconds = self.report_timeout if matches(method, path, REPORT_ROUTES) else self.timeout
+        if not seconds:
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = Deadline(seconds)
+        state = {"started": False, "finished": False, "replaced": False}
+
+        def cancel(reason: str):
+            if not state["finished"] and deadline.reason is None:
+                # Cancelling a PostgreSQL statement opens a connection: off the loop
+                loop.run_in_executor(None, deadline.cancel, reason)
+
+        async def send_checked(message):
+            if message["type"] == "http.response.start":
+                state["started"] = True
+                if message["status"] == 500 and deadline.expired():
+                    state["replaced"] = True
+                    await self._send_timeout(send, method, path, deadline)
+                    return
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["finished"] = True
+            if not state["replaced"]:
+                await send(message)
+
+        watcher = _DisconnectWatcher(receive, lambda: cancel("disconnect"))
+        pump = asyncio.create_task(watcher.pump())
+        timer = loop.call_later(seconds, cancel, "deadline")
+        token = current_deadline.set(deadline)
+        try:
+            await self.app(scope, watcher.receive, send_checked)
+        except Exception:
+            if state["started"] or not deadline.expired():
+                raise
+            logger.exception("%s %s failed after its deadline", method, path)
+            await self._send_timeout(send, method, path, deadline)
+        finally:
+            state["finished"] = True
+            current_deadline.reset(token)
+            timer.cancel()
+            pump.cancel()
+
+    async def _send_timeout(self, send, method: str, path: str, deadline: Deadline):
+        reason = deadline.reason or "deadline"
+        logger.warning("%s %s cancelled (%s)", method, path, reason)
+        body = json.dumps({"detail": "Request deadline exceeded" if reason == "deadline" else "Client disconnected"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,46 @@
+import logging
+
+from src.utils.query_stats import QueryStats, current_stats, request_finished
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries and database time of every request (see
+    utils.query_stats). With `timing_header`, responses carry them as
+    `Server-Timing: db;dur=<ms>;desc="<n> queries"` (as of the response
+    start, so statements run while streaming a body are not included).
+    Requests running more than `warn_queries` statements are logged.
+    """
+
+    def __init__(self, app, timing_header: bool = False, warn_queries: int = 0):
+        self.app = app
+        self.timing_header = timing_header
+        self.warn_queries = warn_queries
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.timing_header:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", stats.server_timing().encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            if self.warn_queries and stats.count > self.warn_queries:
+                logger.warning(
+                    "%s %s ran %d queries (%.1f ms), over QUERY_BUDGET_WARN=%d",
+                    scope["method"], scope["path"], stats.count, stats.seconds * 1000, self.warn_queries,
+                )
+            request_finished(scope["method"], scope["path"], stats)
@@ -0,0 +1,222 @@
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import List, Optional, Pattern, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from src.middleware.request_context import get_client_address
+
+logger = logging.getLogger(__name__)
+
+# Unbounded list/stats/report endpoints: limited per client and per route
+EXPENSIVE_ROUTES: List[Tuple[str, Pattern]] = [
+    ("GET", re.compile(r"^/(simple-|postgres-)?(books|users|rentals)/(active)?$")),
+    ("GET", re.compile(r"/stats/")),
+    ("GET", re.compile(r"^/analytics/")),
+    ("GET", re.compile(r"^/exports/")),
+]
+# Long-lived streams and long-polls: they wait on the broker, not the database
+UNLIMITED_ROUTES: List[Pattern] = [
+    re.compile(r"^/events/"),
+    re.compile(r"/holds/\d+/(events|wait)$"),
+    re.compile(r"^/metrics/"),
+]
+# 429s sent per rule ("expensive", "default"), for /metrics/admission
+rejected: Counter = Counter()
+
+
+def matches(method: str, path: str, routes: List[Tuple[str, Pattern]]) -> bool:
+    return any(method == route_method and pattern.search(path) for route_method, pattern in routes)
+
+
+def is_unlimited(path: str) -> bool:
+    return any(pattern.search(path) for pattern in UNLIMITED_ROUTES)
+
+
+async def send_error(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class MemoryBucketStore:
+    """
+    Token buckets of this process, least recently used evicted past `maxsize`
+    or once unused for `idle_seconds`.
+    """
+
+    blocking = False
+
+    def __init__(self, maxsize: int = 100000, idle_seconds: float = 300):
+        self.maxsize = maxsize
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            # Least recently used first: stop at the first bucket still in use
+            while True:
+                _, (_, oldest) = next(iter(self._buckets.items()))
+                if now - oldest < self.idle_seconds:
+                    break
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class PostgresBucketStore:
+    """
+    Token buckets shared by every worker, in the UNLOGGED rate_limit_buckets
+    table (migration 6). One upsert per request refills, takes and reports in
+    a single round trip; the refill is computed from the row it locks, so
+    concurrent requests of a client never overwrite each other's take.
+
+    At most `max_connections` requests per worker talk to PostgreSQL at a
+    time. When the database is down or every connection stays busy for
+    `acquire_timeout` seconds the request is let through (fail open): rate
+    limiting is not worth an outage. Every `idle_seconds` each worker deletes
+    the buckets unused for that long.
+    """
+
+    blocking = True
+
+    def __init__(self, dsn: str, max_connections: int = 4, acquire_timeout: float = 1.0,
+                 idle_seconds: float = 300):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self._pool = ThreadedConnectionPool(0, max_connections, dsn)
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self.acquire_timeout = acquire_timeout
+        self.idle_seconds = idle_seconds
+        self._next_sweep = time.monotonic() + idle_seconds
+        self._failing = False
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._fail_open("every connection is busy")
+            return True, 0.0
+        try:
+            allowed, tokens = self._take(key, rate, burst)
+        except Exception as e:
+            self._fail_open(str(e).strip())
+            return True, 0.0
+        finally:
+            self._slots.release()
+        if self._failing:
+            self._failing = False
+            logger.info("Rate limit store is back, limiting again")
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        refill = """LEAST(%(burst)s, rate_limit_buckets.tokens
+            + EXTRACT(EPOCH FROM excluded.updated_at - rate_limit_buckets.updated_at) * %(rate)s)"""
+        conn = self._pool.getconn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                INSERT INTO rate_limit_buckets (key, tokens, allowed, updated_at)
+                VALUES (%(key)s, %(burst)s - 1, true, clock_timestamp())
+                ON CONFLICT (key) DO UPDATE
+                SET tokens = CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END,
+                    allowed = {refill} >= 1,
+                    updated_at = excluded.updated_at
+                RETURNING allowed, tokens
+            """, {"key": key, "rate": rate, "burst": burst})
+            allowed, tokens = cursor.fetchone()
+            if time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + self.idle_seconds
+                # No index on updated_at: it would make every take a non-HOT update
+                cursor.execute("""
+                    DELETE FROM rate_limit_buckets
+                    WHERE updated_at < clock_timestamp() - make_interval(secs => %s)
+                """, (self.idle_seconds,))
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            # A connection broken by a database restart is replaced next time
+            self._pool.putconn(conn, close=bool(conn.closed))
+        return allowed, tokens
+
+    def _fail_open(self, reason: str):
+        # Once per outage, not once per request
+        if not self._failing:
+            self._failing = True
+            logger.warning("Rate limit store unavailable (%s): requests are not limited", reason)
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limiting per client address (see RequestContextMiddleware;
+    X-Client-Id is chosen by the client and would let it pick a fresh bucket).
+    Expensive routes get a bucket per client and route, everything else one
+    bucket per client. Over the limit: 429 with Retry-After.
+    """
+
+    def __init__(self, app, store, expensive_rate: float, expensive_burst: float,
+                 default_rate: float, default_burst: float):
+        self.app = app
+        self.store = store
+        self.expensive_rate = expensive_rate
+        self.expensive_burst = expensive_burst
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or is_unlimited(path):
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        client = get_client_address() or "anonymous"
+        if matches(method, path, EXPENSIVE_ROUTES):
+            rule, key, rate, burst = "expensive", f"{client}|{method} {path}", self.expensive_rate, self.expensive_burst
+        else:
+            rule, key, rate, burst = "default", f"{client}|*", self.default_rate, self.default_burst
+
+        allowed, retry_after = await self._take(key, rate, burst)
+        if not allowed:
+            rejected[rule] += 1
+            await send_error(send, 429, "Too many requests", retry_after)
+            return
+        await self.app(scope, receive, send)
+
+    async def _take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        if self.store.blocking:
+            return await run_in_threadpool(self.store.take, key, rate, burst)
+        return self.store.take(key, rate, burst)
+
+
+def create_bucket_store(kind: str, dsn: Optional[str] = None, max_clients: int = 100000,
+                        max_connections: int = 4, idle_seconds: float = 300):
+    if kind == "memory":
+        return MemoryBucketStore(maxsize=max_clients, idle_seconds=idle_seconds)
+    if kind == "postgres":
+        return PostgresBucketStore(dsn, max_connections=max_connections, idle_seconds=idle_seconds)
+    raise ValueError(f"Unknown RATE_LIMIT_STORE: {kind}")
@@ -0,0 +1,93 @@
+import re
+import uuid
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+# Identifies the calling client for per-client behaviour (e.g. read-your-writes).
+# Clients may send a stable X-Client-Id; otherwise the peer address is used.
+client_key_var: ContextVar[Optional[str]] = ContextVar("client_key", default=None)
+
+# The client's address, for what must not trust the client (rate limiting): the
+# peer address, or behind a trusted proxy the last untrusted X-Forwarded-For hop.
+client_address_var: ContextVar[Optional[str]] = ContextVar("client_address", default=None)
+
+
+# Correlates a request's log records: the caller's X-Request-Id when it sends
+# a usable one, otherwise a new id. Echoed in the response's X-Request-Id.
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+REQUEST_ID_PATTERN = re.compile(rb"[A-Za-z0-9._:-]{1,128}")
+
+
+def get_client_key() -> Optional[str]:
+    return client_key_var.get()
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def get_client_address() -> Optional[str]:
+    return client_address_var.get()
+
+
+def resolve_client_address(peer: Optional[str], forwarded_for: Optional[str],
+                           trusted_proxies: frozenset) -> Optional[str]:
+    """
+    Walk X-Forwarded-For from the right while the hop is a trusted proxy; the
+    first other address is the client. A peer that is not a trusted proxy is
+    the client itself, whatever it forwards.
+    """
+    if peer not in trusted_proxies or not forwarded_for:
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return hops[0] if hops else peer
+
+
+class RequestContextMiddleware:
+    """Bind per-request context variables before the request is routed."""
+
+    def __init__(self, app, trusted_proxies: Iterable[str] = ()):
+        self.app = app
+        self.trusted_proxies = frozenset(trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client_key = None
+        request_id = None
+        forwarded_for = None
+        for name, value in scope["headers"]:
+            if name == b"x-client-id":
+                client_key = value.decode("latin-1")
+            elif name == b"x-request-id" and REQUEST_ID_PATTERN.fullmatch(value):
+                request_id = value.decode("ascii")
+            elif name == b"x-forwarded-for":
+                # Repeated headers are one list, in order
+                hops = value.decode("latin-1")
+                forwarded_for = hops if forwarded_for is None else f"{forwarded_for}, {hops}"
+        peer = scope["client"][0] if scope.get("client") else None
+        client_address = resolve_client_address(peer, forwarded_for, self.trusted_proxies)
+        if client_key is None:
+            client_key = client_address
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("ascii"))]
+            await send(message)
+
+        token = client_key_var.set(client_key)
+        address_token = client_address_var.set(client_address)
+        request_token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(request_token)
+            client_address_var.reset(address_token)
+            client_key_var.reset(token)
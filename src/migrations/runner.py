@@ -0,0 +1,241 @@
+import importlib
+import logging
+import pkgutil
+import time
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Sequence
+
+from settings import (
+    MIGRATION_BATCH_PAUSE_MS,
+    MIGRATION_BATCH_SIZE,
+    MIGRATION_LOCK_RETRIES,
+    MIGRATION_LOCK_TIMEOUT_MS,
+)
+from src.migrations import versions
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema changes, applied in order and recorded in schema_migrations.
+#
+# Each module in src/migrations/versions defines VERSION, DESCRIPTION and
+# upgrade(ctx). Statements run in autocommit so a migration never holds locks
+# longer than one statement, which also means a migration that fails halfway
+# is simply run again: write upgrades with IF NOT EXISTS-style steps.
+
+# pg_advisory_lock key: one migrate run at a time per database
+MIGRATION_LOCK_KEY = 4102026
+
+# Column types that differ between the backends, for `create_table`
+COLUMN_TYPES = {
+    "postgres": {"serial": "SERIAL", "timestamp": "TIMESTAMP"},
+    "sqlite": {"serial": "INTEGER", "timestamp": "DATETIME"},
+}
+
+
+class MigrationContext:
+    """What a migration's upgrade() works with, on either backend"""
+
+    def __init__(self, conn, backend: str, batch_size: int = MIGRATION_BATCH_SIZE,
+                 batch_pause: float = MIGRATION_BATCH_PAUSE_MS / 1000):
+        self.conn = conn
+        self.backend = backend
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.p = PLACEHOLDERS[backend]
+
+    def execute(self, sql: str, params: Sequence[Any] = (), retries: int = MIGRATION_LOCK_RETRIES):
+        """
+        Run one statement. On PostgreSQL, DDL waits at most
+        MIGRATION_LOCK_TIMEOUT_MS for its lock, so it never queues live
+        traffic behind it for long, and is retried `retries` times.
+        """
+        for attempt in range(retries + 1):
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(sql, params)
+                return cursor
+            except Exception as e:
+                self._wait_for_lock(e, attempt, retries)
+
+    def _wait_for_lock(self, error: Exception, attempt: int, retries: int):
+        """Back off before retrying a statement that timed out on its lock; re-raise anything else"""
+        if getattr(error, "pgcode", None) != "55P03" or attempt == retries:
+            raise error
+        logger.warning("Lock not available, retrying (%d/%d)", attempt + 1, retries)
+        time.sleep(min(2 ** attempt, 30))
+
+    def create_table(self, name: str, columns: str, suffix: str = ""):
+        """
+        CREATE TABLE IF NOT EXISTS `name` (`columns`)`suffix`. The columns are
+        spelled out in the migration, never taken from the current models, so
+        a migration creates the same table whenever it runs; {serial} and
+        {timestamp} stand for the backend's column types.
+        """
+        self.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns.format(**COLUMN_TYPES[self.backend])}){suffix}")
+
+    def create_index(self, name: str, table: str, columns: Sequence[str], unique: bool = False,
+                     where: Optional[str] = None, include: Sequence[str] = ()):
+        """
+        Build an index without blocking writes. PostgreSQL uses CREATE INDEX
+        CONCURRENTLY, dropping first an invalid index left by a failed build.
+        INCLUDE columns only apply on PostgreSQL.
+        """
+        unique_sql = "UNIQUE " if unique else ""
+        where_sql = f" WHERE {where}" if where else ""
+        if self.backend == "postgres":
+            include_sql = f" INCLUDE ({', '.join(include)})" if include else ""
+            for attempt in range(MIGRATION_LOCK_RETRIES + 1):
+                # A build that timed out on its lock leaves an invalid index,
+                # which IF NOT EXISTS would keep: check before every attempt
+                cursor = self.execute("""
+                    SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = %s
+                """, (name,))
+                row = cursor.fetchone()
+                if row is not None and row[0]:
+                    return
+                if row is not None:
+                    logger.warning("Dropping invalid index %s left by a failed build", name)
+                    self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                try:
+                    self.execute(
+                        f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                        f"ON {table} ({', '.join(columns)}){include_sql}{where_sql}",
+                        retries=0,
+                    )
+                    return
+                except Exception as e:
+                    self._wait_for_lock(e, attempt, MIGRATION_LOCK_RETRIES)
+        else:
+            self.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)}){where_sql}")
+
+    def has_column(self, table: str, column: str) -> bool:
+        if self.backend == "postgres":
+            cursor = self.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+            """, (table, column))
+            return cursor.fetchone() is not None
+        cursor = self.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+
+    def add_column(self, table: str, column: str, definition: str):
+        """Add a nullable (or constant-default) column; cheap on both backends"""
+        if not self.has_column(table, column):
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def backfill(self, table: str, assignments: str, where: str = "TRUE",
+                 params: Sequence[Any] = (), key: str = "id") -> int:
+        """
+        UPDATE `table` SET `assignments` WHERE `where`, one `key` range of
+        `batch_size` rows per transaction with a pause in between, so a large
+        backfill never holds many row locks or saturates the database.
+        Returns the number of rows updated.
+        """
+        cursor = self.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}")
+        low, high = cursor.fetchone()
+        if low is None:
+            return 0
+        updated = 0
+        p = self.p
+        for start in range(low, high + 1, self.batch_size):
+            cursor = self.execute(
+                f"UPDATE {table} SET {assignments} WHERE {key} >= {p} AND {key} < {p} AND ({where})",
+                (start, start + self.batch_size, *params),
+            )
+            updated += max(cursor.rowcount, 0)
+            if self.batch_pause:
+                time.sleep(self.batch_pause)
+        return updated
+
+
+def load_migrations() -> List[ModuleType]:
+    modules = [
+        importlib.import_module(f"{versions.__name__}.{info.name}")
+        for info in pkgutil.iter_modules(versions.__path__)
+    ]
+    modules.sort(key=lambda module: module.VERSION)
+    seen = set()
+    for module in modules:
+        if module.VERSION in seen:
+            raise RuntimeError(f"Duplicate migration version {module.VERSION}")
+        seen.add(module.VERSION)
+    return modules
+
+
+def _connect(backend: str):
+    conn = open_connection(backend, read_only=False)
+    if backend == "postgres":
+        conn.autocommit = True
+        conn.cursor().execute("SET lock_timeout = %s", (f"{MIGRATION_LOCK_TIMEOUT_MS}ms",))
+    else:
+        conn.isolation_level = None
+    return conn
+
+
+def _applied_versions(ctx: MigrationContext) -> Dict[int, Any]:
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR NOT NULL,
+            applied_at TIMESTAMP NOT NULL,
+            duration_ms INTEGER NOT NULL
+        )
+    """)
+    cursor = ctx.execute("SELECT version, applied_at FROM schema_migrations")
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def migrate(backend: str = "postgres", target: Optional[int] = None, dry_run: bool = False) -> List[int]:
+    """Apply pending migrations up to `target` (default: all); returns the versions applied"""
+    conn = _connect(backend)
+    ctx = MigrationContext(conn, backend)
+    try:
+        if backend == "postgres":
+            ctx.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        applied = _applied_versions(ctx)
+        pending = [
+            module for module in load_migrations()
+            if module.VERSION not in applied and (target is None or module.VERSION <= target)
+        ]
+        done = []
+        for module in pending:
+            logger.info("%s %04d %s", "Would apply" if dry_run else "Applying", module.VERSION, module.DESCRIPTION,
+                        extra={"backend": backend, "version": module.VERSION})
+            if dry_run:
+                continue
+            started = time.monotonic()
+            module.upgrade(ctx)
+            duration_ms = int((time.monotonic() - started) * 1000)
+            ctx.execute(
+                f"INSERT INTO schema_migrations (version, description, applied_at, duration_ms) "
+                f"VALUES ({ctx.p}, {ctx.p}, {ctx.p}, {ctx.p})",
+                (module.VERSION, module.DESCRIPTION, _timestamp(datetime.now(), backend), duration_ms),
+            )
+            logger.info("Applied %04d in %d ms", module.VERSION, duration_ms,
+                        extra={"backend": backend, "version": module.VERSION, "duration_ms": duration_ms})
+            done.append(module.VERSION)
+        return done
+    finally:
+        if backend == "postgres":
+            ctx.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.close()
+
+
+def migration_status(backend: str = "postgres") -> List[Dict[str, Any]]:
+    """Every known migration with when it was applied (None while pending)"""
+    conn = _connect(backend)
+    try:
+        applied = _applied_versions(MigrationContext(conn, backend))
+    finally:
+        conn.close()
+    return [
+        {"version": module.VERSION, "description": module.DESCRIPTION, "applied_at": applied.get(module.VERSION)}
+        for module in load_migrations()
+    ]
+
+
+def _timestamp(value: datetime, backend: str):
+    return value.isoformat() if backend == "sqlite" else value
@@ -0,0 +1,107 @@
+"""Tables of the library models, as created by init.sql / create_all before migrations existed"""
+
+VERSION = 1
+DESCRIPTION = "baseline tables"
+
+# Frozen as of this migration: later columns and indexes belong to later
+# migrations, whatever the models say now. The rental history indexes are
+# built by migration 2.
+
+
+def upgrade(ctx):
+    ctx.create_table("books", """
+        id {serial} NOT NULL,
+        title VARCHAR NOT NULL,
+        author VARCHAR NOT NULL,
+        year INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (id)
+    """)
+    ctx.create_index("ix_books_id", "books", ["id"])
+    ctx.create_index("ix_books_title", "books", ["title"])
+
+    ctx.create_table("users", """
+        id {serial} NOT NULL,
+        full_name VARCHAR NOT NULL,
+        email VARCHAR NOT NULL,
+        phone VARCHAR,
+        PRIMARY KEY (id)
+    """)
+    ctx.create_index("ix_users_id", "users", ["id"])
+    ctx.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    ctx.create_table("rentals", """
+        id {serial} NOT NULL,
+        user_id INTEGER NOT NULL,
+        book_id INTEGER NOT NULL,
+        rental_date {timestamp} NOT NULL,
+        due_date {timestamp} NOT NULL,
+        return_date {timestamp},
+        is_returned BOOLEAN NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (book_id) REFERENCES books (id)
+    """)
+    ctx.create_index("ix_rentals_id", "rentals", ["id"])
+
+    ctx.create_table("rental_rollups", """
+        granularity VARCHAR(8) NOT NULL,
+        bucket_start {timestamp} NOT NULL,
+        rentals INTEGER NOT NULL,
+        returns INTEGER NOT NULL,
+        PRIMARY KEY (granularity, bucket_start)
+    """)
+
+    ctx.create_table("book_cooccurrences", """
+        book_id INTEGER NOT NULL,
+        other_book_id INTEGER NOT NULL,
+        co_rentals INTEGER NOT NULL,
+        PRIMARY KEY (book_id, other_book_id)
+    """)
+    ctx.create_table("book_similarities", """
+        book_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        similar_book_id INTEGER NOT NULL,
+        score FLOAT NOT NULL,
+        co_rentals INTEGER NOT NULL,
+        PRIMARY KEY (book_id, rank)
+    """)
+    ctx.create_table("recommendation_builds", """
+        id {serial} NOT NULL,
+        last_rental_id INTEGER NOT NULL,
+        built_at {timestamp} NOT NULL,
+        mode VARCHAR(8) NOT NULL,
+        PRIMARY KEY (id)
+    """)
+
+    ctx.create_table("holds", """
+        id {serial} NOT NULL,
+        user_id INTEGER NOT NULL,
+        book_id INTEGER NOT NULL,
+        days_to_return INTEGER NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        created_at {timestamp} NOT NULL,
+        fulfilled_at {timestamp},
+        rental_id INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (book_id) REFERENCES books (id),
+        FOREIGN KEY (rental_id) REFERENCES rentals (id)
+    """)
+    ctx.create_index("ix_holds_id", "holds", ["id"])
+    ctx.create_index("idx_holds_book_id_waiting", "holds", ["book_id", "created_at", "id"],
+                     where="status = 'waiting'")
+    ctx.create_index("idx_holds_user_id_book_id_waiting", "holds", ["user_id", "book_id"], unique=True,
+                     where="status = 'waiting'")
+
+    ctx.create_table("idempotency_keys", """
+        "key" VARCHAR(255) NOT NULL,
+        route VARCHAR(64) NOT NULL,
+        fingerprint VARCHAR(64) NOT NULL,
+        status_code INTEGER,
+        response TEXT,
+        created_at {timestamp} NOT NULL,
+        expires_at {timestamp} NOT NULL,
+        PRIMARY KEY ("key", route)
+    """)
+    ctx.create_index("idx_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
@@ -0,0 +1,21 @@
+"""Rental indexes added after the rentals table existed on live databases"""
+
+VERSION = 2
+DESCRIPTION = "rental history covering indexes and one active rental per user and book"
+
+
+def upgrade(ctx):
+    ctx.create_index(
+        "idx_rentals_user_id_rental_date", "rentals", ["user_id", "rental_date", "id"],
+        include=["book_id", "due_date", "return_date", "is_returned"],
+    )
+    ctx.create_index(
+        "idx_rentals_book_id_rental_date", "rentals", ["book_id", "rental_date", "id"],
+        include=["user_id", "due_date", "return_date", "is_returned"],
+    )
+    # Fails while a user has two active rentals of the same book; close the
+    # duplicates and run `migrate` again
+    active = "is_returned = false" if ctx.backend == "postgres" else "is_returned = 0"
+    ctx.create_index(
+        "idx_rentals_user_id_book_id_active", "rentals", ["user_id", "book_id"], unique=True, where=active,
+    )
@@ -0,0 +1,25 @@
+"""Cold storage for returned rentals, filled by `python cli.py archive_rentals`"""
+
+VERSION = 3
+DESCRIPTION = "rentals_archive table, partitioned by month on PostgreSQL"
+
+
+def upgrade(ctx):
+    # Partition key must be part of the primary key; the archiver creates each
+    # month's partition before moving rows into it. No foreign keys: archived
+    # rows are read-only history.
+    partitioned = " PARTITION BY RANGE (rental_date)" if ctx.backend == "postgres" else ""
+    ctx.create_table("rentals_archive", """
+        id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        book_id INTEGER NOT NULL,
+        rental_date {timestamp} NOT NULL,
+        due_date {timestamp} NOT NULL,
+        return_date {timestamp},
+        is_returned BOOLEAN NOT NULL,
+        PRIMARY KEY (id, rental_date)
+    """, suffix=partitioned)
+    # CONCURRENTLY does not apply to partitioned tables; the table is new and empty
+    for name, columns in (("idx_rentals_archive_user_id_rental_date", "user_id, rental_date, id"),
+                          ("idx_rentals_archive_book_id_rental_date", "book_id, rental_date, id")):
+        ctx.execute(f"CREATE INDEX IF NOT EXISTS {name} ON rentals_archive ({columns})")
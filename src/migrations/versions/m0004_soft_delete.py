@@ -0,0 +1,23 @@
+"""Soft delete of books and users: deleted_at tombstones and the partial indexes around them"""
+
+VERSION = 4
+DESCRIPTION = "books/users deleted_at and live/tombstone partial indexes"
+
+
+def upgrade(ctx):
+    for table in ("books", "users"):
+        ctx.add_column(table, "deleted_at", "TIMESTAMP")
+        ctx.create_index(f"idx_{table}_live", table, ["id"], where="deleted_at IS NULL")
+        ctx.create_index(f"idx_{table}_deleted_at", table, ["deleted_at"], where="deleted_at IS NOT NULL")
+    active = "is_returned = false" if ctx.backend == "postgres" else "is_returned = 0"
+    ctx.create_index("idx_rentals_book_id_active", "rentals", ["book_id"], where=active)
+
+    # Emails are unique among live users only, so a deleted user's email can
+    # be registered again. The new index is built before the global one goes.
+    ctx.create_index("idx_users_email_live", "users", ["email"], unique=True, where="deleted_at IS NULL")
+    if ctx.backend == "postgres":
+        # init.sql declared the column UNIQUE, create_all an ix_users_email index
+        ctx.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key")
+        ctx.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_email")
+    else:
+        ctx.execute("DROP INDEX IF EXISTS ix_users_email")
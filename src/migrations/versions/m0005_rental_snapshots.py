@@ -0,0 +1,24 @@
+"""Copies of user/book display fields on rentals, for join-free listings"""
+
+VERSION = 5
+DESCRIPTION = "rentals user/book snapshot columns and listing indexes"
+
+
+# Spelled out rather than imported from src.utils.snapshots, so the backfill
+# stays what it was when this migration was written
+SNAPSHOT_ASSIGNMENTS = (
+    "user_full_name = (SELECT full_name FROM users WHERE users.id = rentals.user_id), "
+    "user_email = (SELECT email FROM users WHERE users.id = rentals.user_id), "
+    "book_title = (SELECT title FROM books WHERE books.id = rentals.book_id), "
+    "book_author = (SELECT author FROM books WHERE books.id = rentals.book_id)"
+)
+
+
+def upgrade(ctx):
+    for column in ("user_full_name", "user_email", "book_title", "book_author"):
+        ctx.add_column("rentals", column, "VARCHAR")
+    ctx.backfill("rentals", SNAPSHOT_ASSIGNMENTS, where="book_title IS NULL")
+
+    active = "is_returned = false" if ctx.backend == "postgres" else "is_returned = 0"
+    ctx.create_index("idx_rentals_active_due_date", "rentals", ["due_date"], where=active)
+    ctx.create_index("idx_rentals_rental_date", "rentals", ["rental_date"])
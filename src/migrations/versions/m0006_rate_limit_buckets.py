@@ -0,0 +1,18 @@
+"""Token buckets shared between workers by RATE_LIMIT_STORE=postgres"""
+
+VERSION = 6
+DESCRIPTION = "rate_limit_buckets UNLOGGED table (PostgreSQL only)"
+
+
+def upgrade(ctx):
+    if ctx.backend != "postgres":
+        return
+    # UNLOGGED: buckets are throwaway state, not worth WAL (emptied by a crash)
+    ctx.execute("""
+        CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+            key VARCHAR PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            allowed BOOLEAN NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+    """)
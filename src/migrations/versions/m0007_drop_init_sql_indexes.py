@@ -0,0 +1,16 @@
+"""Indexes created by older init.sql files that duplicate the ix_* indexes of migration 1"""
+
+VERSION = 7
+DESCRIPTION = "drop idx_* id/title/email indexes duplicated by init.sql databases"
+
+# init.sql used to create the whole schema under its own index names; running
+# the migrations over such a database added the baseline ix_* indexes next to
+# them. idx_users_email is covered by idx_users_email_live (migration 4).
+DUPLICATES = ("idx_books_id", "idx_books_title", "idx_users_id", "idx_users_email", "idx_rentals_id", "idx_holds_id")
+
+
+def upgrade(ctx):
+    if ctx.backend != "postgres":
+        return
+    for name in DUPLICATES:
+        ctx.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,17 @@
+"""Write-behind events already committed, so a replayed journal does not apply them twice"""
+
+VERSION = 8
+DESCRIPTION = "rental_write_behind_events table (PostgreSQL only)"
+
+
+def upgrade(ctx):
+    if ctx.backend != "postgres":
+        return
+    ctx.create_table("rental_write_behind_events", """
+        token VARCHAR(32) NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        rental_id INTEGER,
+        detail VARCHAR,
+        processed_at {timestamp} NOT NULL,
+        PRIMARY KEY (token)
+    """)
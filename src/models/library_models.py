@@ -1,17 +1,27 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, Index, PrimaryKeyConstraint, Text, text
 from sqlalchemy.orm import relationship
 from src.utils.db_utils import Base
 
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # Lists and lookups read live rows only; compaction reads only
+        # tombstones (see src/utils/tombstones.py)
+        Index("idx_books_live", "id", postgresql_where=text("deleted_at IS NULL"),
+              sqlite_where=text("deleted_at IS NULL")),
+        Index("idx_books_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL"),
+              sqlite_where=text("deleted_at IS NOT NULL")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False, index=True)
     author = Column(String, nullable=False)
     year = Column(Integer, nullable=False)
     quantity = Column(Integer, nullable=False, default=0)
+    # Set by DELETE; the row is purged later by `python cli.py compact_tombstones`
+    deleted_at = Column(DateTime, nullable=True)
     
     rentals = relationship("Rental", back_populates="book")
     
@@ -21,11 +31,22 @@ class Book(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("idx_users_live", "id", postgresql_where=text("deleted_at IS NULL"),
+              sqlite_where=text("deleted_at IS NULL")),
+        Index("idx_users_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL"),
+              sqlite_where=text("deleted_at IS NOT NULL")),
+        # Unique among live users: a deleted user's email can be registered again
+        Index("idx_users_email_live", "email", unique=True, postgresql_where=text("deleted_at IS NULL"),
+              sqlite_where=text("deleted_at IS NULL")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String, nullable=False)
-    email = Column(String, nullable=False, unique=True, index=True)
+    email = Column(String, nullable=False)
     phone = Column(String, nullable=True)
+    # Set by DELETE; the row is purged later by `python cli.py compact_tombstones`
+    deleted_at = Column(DateTime, nullable=True)
     
     rentals = relationship("Rental", back_populates="user")
     
@@ -35,6 +56,36 @@ class User(Base):
 
 class Rental(Base):
     __tablename__ = "rentals"
+    __table_args__ = (
+        # Per-user / per-book history pages (newest first, keyset on rental_date, id).
+        # On PostgreSQL the remaining listed columns are included so the rentals
+        # side of the page is an index-only scan.
+        Index(
+            "idx_rentals_user_id_rental_date", "user_id", "rental_date", "id",
+            postgresql_include=["book_id", "due_date", "return_date", "is_returned"],
+        ),
+        Index(
+            "idx_rentals_book_id_rental_date", "book_id", "rental_date", "id",
+            postgresql_include=["user_id", "due_date", "return_date", "is_returned"],
+        ),
+        # At most one active rental per user and book, enforced for the
+        # single-statement conditional rent (see availability.conditional_rent)
+        Index(
+            "idx_rentals_user_id_book_id_active", "user_id", "book_id", unique=True,
+            postgresql_where=text("is_returned = false"), sqlite_where=text("is_returned = 0"),
+        ),
+        # "Does this book have an active rental?" without walking its history
+        Index(
+            "idx_rentals_book_id_active", "book_id",
+            postgresql_where=text("is_returned = false"), sqlite_where=text("is_returned = 0"),
+        ),
+        # Join-free rental listings in their display order
+        Index(
+            "idx_rentals_active_due_date", "due_date",
+            postgresql_where=text("is_returned = false"), sqlite_where=text("is_returned = 0"),
+        ),
+        Index("idx_rentals_rental_date", "rental_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -43,9 +94,147 @@ class Rental(Base):
     due_date = Column(DateTime, nullable=False)
     return_date = Column(DateTime, nullable=True)
     is_returned = Column(Boolean, nullable=False, default=False)
+    # Copies of the user's and book's display fields, read instead of joins
+    # when RENTAL_SNAPSHOTS_ENABLED (see src/utils/snapshots.py)
+    user_full_name = Column(String, nullable=True)
+    user_email = Column(String, nullable=True)
+    book_title = Column(String, nullable=True)
+    book_author = Column(String, nullable=True)
     
     user = relationship("User", back_populates="rentals")
     book = relationship("Book", back_populates="rentals")
     
     def __repr__(self):
-        return f"<Rental(id={self.id}, user_id={self.user_id}, book_id={self.book_id}, is_returned={self.is_returned})>"
\ No newline at end of file
+        return f"<Rental(id={self.id}, user_id={self.user_id}, book_id={self.book_id}, is_returned={self.is_returned})>"
+
+
+class RentalArchive(Base):
+    """
+    Returned rentals moved out of `rentals` by `python cli.py archive_rentals`.
+    On PostgreSQL the table is partitioned by month of rental_date; the
+    archiver creates each month's partition before moving rows into it.
+    """
+    __tablename__ = "rentals_archive"
+    __table_args__ = (
+        # Partition key must be part of the primary key
+        PrimaryKeyConstraint("id", "rental_date"),
+        Index("idx_rentals_archive_user_id_rental_date", "user_id", "rental_date", "id"),
+        Index("idx_rentals_archive_book_id_rental_date", "book_id", "rental_date", "id"),
+        {"postgresql_partition_by": "RANGE (rental_date)"},
+    )
+
+    # No foreign keys: archived rows are read-only history and must not make
+    # every insert check users and books
+    id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    book_id = Column(Integer, nullable=False)
+    rental_date = Column(DateTime, nullable=False)
+    due_date = Column(DateTime, nullable=False)
+    return_date = Column(DateTime, nullable=True)
+    is_returned = Column(Boolean, nullable=False, default=True)
+
+    def __repr__(self):
+        return f"<RentalArchive(id={self.id}, user_id={self.user_id}, book_id={self.book_id})>"
+
+
+class RentalRollup(Base):
+    """Rentals and returns counted per hour/day bucket, kept current on every rent/return"""
+    __tablename__ = "rental_rollups"
+    __table_args__ = (
+        PrimaryKeyConstraint("granularity", "bucket_start"),
+    )
+
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    rentals = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RentalRollup(granularity={self.granularity}, bucket_start={self.bucket_start}, rentals={self.rentals})>"
+
+
+class BookCooccurrence(Base):
+    """Sparse book x book matrix: users who rented both (diagonal: distinct renters of the book)"""
+    __tablename__ = "book_cooccurrences"
+    __table_args__ = (
+        PrimaryKeyConstraint("book_id", "other_book_id"),
+    )
+
+    book_id = Column(Integer, nullable=False)
+    other_book_id = Column(Integer, nullable=False)
+    co_rentals = Column(Integer, nullable=False)
+
+
+class BookSimilarity(Base):
+    """Precomputed top-K most similar books of each book"""
+    __tablename__ = "book_similarities"
+    __table_args__ = (
+        PrimaryKeyConstraint("book_id", "rank"),
+    )
+
+    book_id = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+    similar_book_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    co_rentals = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<BookSimilarity(book_id={self.book_id}, rank={self.rank}, similar_book_id={self.similar_book_id})>"
+
+
+class RecommendationBuild(Base):
+    """One row per similarity build/refresh; last_rental_id is the refresh watermark"""
+    __tablename__ = "recommendation_builds"
+
+    id = Column(Integer, primary_key=True)
+    last_rental_id = Column(Integer, nullable=False)
+    built_at = Column(DateTime, nullable=False)
+    mode = Column(String(8), nullable=False)
+
+
+class Hold(Base):
+    """A user waiting for a copy of an unavailable book; served FIFO when copies are returned"""
+    __tablename__ = "holds"
+    __table_args__ = (
+        # Queue head lookup on return: only waiting holds are indexed
+        Index(
+            "idx_holds_book_id_waiting", "book_id", "created_at", "id",
+            postgresql_where=text("status = 'waiting'"), sqlite_where=text("status = 'waiting'"),
+        ),
+        Index(
+            "idx_holds_user_id_book_id_waiting", "user_id", "book_id", unique=True,
+            postgresql_where=text("status = 'waiting'"), sqlite_where=text("status = 'waiting'"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    days_to_return = Column(Integer, nullable=False, default=14)
+    # waiting | fulfilled | cancelled
+    status = Column(String(16), nullable=False, default="waiting")
+    # Local time, like the raw-SQL hold inserts: FIFO order compares them
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    fulfilled_at = Column(DateTime, nullable=True)
+    rental_id = Column(Integer, ForeignKey("rentals.id"), nullable=True)
+
+    def __repr__(self):
+        return f"<Hold(id={self.id}, user_id={self.user_id}, book_id={self.book_id}, status={self.status})>"
+
+
+class IdempotencyKey(Base):
+    """Stored response of a POST sent with an Idempotency-Key, replayed to retries until expires_at"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        PrimaryKeyConstraint("key", "route"),
+        Index("idx_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    key = Column(String(255), nullable=False)
+    route = Column(String(64), nullable=False)
+    # sha256 hex digest of the route and request body
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,235 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+from src.utils.export import iter_row_chunks
+
+DAY = np.timedelta64(1, "D")
+
+
+class RentalColumns:
+    """
+    Rental history held as parallel NumPy arrays (one entry per rental).
+    Timestamps are datetime64[us]; an open rental has return_date = NaT.
+    """
+
+    def __init__(self, rental_id, user_id, book_id, rental_date, due_date, return_date, is_returned):
+        self.rental_id = rental_id
+        self.user_id = user_id
+        self.book_id = book_id
+        self.rental_date = rental_date
+        self.due_date = due_date
+        self.return_date = return_date
+        self.is_returned = is_returned
+
+    def __len__(self):
+        return len(self.rental_id)
+
+
+class BookColumns:
+    """Books as parallel NumPy arrays, sorted by book_id"""
+
+    def __init__(self, book_id, title, author, quantity):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.quantity = quantity
+
+
+def load_rentals(backend: str, chunk_size: int = 50000) -> RentalColumns:
+    """Read all rentals, archived ones included, chunk by chunk into columnar arrays"""
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in (
+        "rental_id", "user_id", "book_id", "rental_date", "due_date", "return_date", "is_returned"
+    )}
+    for chunk in iter_row_chunks(backend, "rentals", chunk_size):
+        ids, user_ids, book_ids, rental_dates, due_dates, return_dates, returned = zip(*chunk)
+        parts["rental_id"].append(np.array(ids, dtype=np.int64))
+        parts["user_id"].append(np.array(user_ids, dtype=np.int64))
+        parts["book_id"].append(np.array(book_ids, dtype=np.int64))
+        parts["rental_date"].append(np.array(rental_dates, dtype="datetime64[us]"))
+        parts["due_date"].append(np.array(due_dates, dtype="datetime64[us]"))
+        parts["return_date"].append(np.array(return_dates, dtype="datetime64[us]"))
+        parts["is_returned"].append(np.array(returned, dtype=bool))
+
+    empty = {
+        "rental_id": np.int64, "user_id": np.int64, "book_id": np.int64, "rental_date": "datetime64[us]",
+        "due_date": "datetime64[us]", "return_date": "datetime64[us]", "is_returned": bool,
+    }
+    columns = {
+        name: np.concatenate(arrays) if arrays else np.array([], dtype=empty[name])
+        for name, arrays in parts.items()
+    }
+    return RentalColumns(**columns)
+
+
+def load_books(backend: str) -> BookColumns:
+    rows = [row for chunk in iter_row_chunks(backend, "books") for row in chunk]
+    if not rows:
+        return BookColumns(np.array([], dtype=np.int64), np.array([], dtype=object),
+                           np.array([], dtype=object), np.array([], dtype=np.int64))
+    book_ids, titles, authors, _, quantities = zip(*rows)
+    return BookColumns(
+        np.array(book_ids, dtype=np.int64),
+        np.array(titles, dtype=object),
+        np.array(authors, dtype=object),
+        np.array(quantities, dtype=np.int64),
+    )
+
+
+def _bucket(values: np.ndarray, granularity: str) -> np.ndarray:
+    """Truncate datetime64 values to the start of their day, ISO week or month"""
+    days = values.astype("datetime64[D]")
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday
+        weekday = (days.astype(np.int64) + 3) % 7
+        return days - weekday.astype("timedelta64[D]")
+    if granularity == "month":
+        return values.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _bucket_range(start: np.datetime64, end: np.datetime64, granularity: str) -> np.ndarray:
+    """Every bucket start between start and end (inclusive)"""
+    first, last = _bucket(np.array([start, end]), granularity)
+    if granularity == "month":
+        months = np.arange(first.astype("datetime64[M]"), last.astype("datetime64[M]") + 1)
+        return months.astype("datetime64[D]")
+    step = 7 if granularity == "week" else 1
+    return np.arange(first, last + DAY, step * DAY)
+
+
+def _count_by_bucket(values: np.ndarray, buckets: np.ndarray, granularity: str) -> np.ndarray:
+    """Number of values falling in each of `buckets` (values outside are ignored)"""
+    counts = np.zeros(len(buckets), dtype=np.int64)
+    if len(values) == 0:
+        return counts
+    keys, key_counts = np.unique(_bucket(values, granularity), return_counts=True)
+    positions = np.searchsorted(buckets, keys)
+    inside = (positions < len(buckets)) & (buckets[np.minimum(positions, len(buckets) - 1)] == keys)
+    counts[positions[inside]] = key_counts[inside]
+    return counts
+
+
+def rental_rate(rentals: RentalColumns, start: datetime, end: datetime, granularity: str) -> List[Dict[str, Any]]:
+    """Rentals started and returned per time bucket"""
+    start64, end64 = np.datetime64(start, "us"), np.datetime64(end, "us")
+    buckets = _bucket_range(start64, end64, granularity)
+
+    rented = rentals.rental_date[(rentals.rental_date >= start64) & (rentals.rental_date < end64)]
+    returned_dates = rentals.return_date[~np.isnat(rentals.return_date)]
+    returned = returned_dates[(returned_dates >= start64) & (returned_dates < end64)]
+
+    rental_counts = _count_by_bucket(rented, buckets, granularity)
+    return_counts = _count_by_bucket(returned, buckets, granularity)
+    return [
+        {"bucket": str(bucket), "rentals": int(rental_count), "returns": int(return_count)}
+        for bucket, rental_count, return_count in zip(buckets, rental_counts, return_counts)
+    ]
+
+
+def book_utilization(rentals: RentalColumns, books: BookColumns, start: datetime, end: datetime,
+                     limit: int) -> List[Dict[str, Any]]:
+    """
+    Share of the window each book's copies spent rented out:
+    rented days / (copies * window days), where copies = available + rented.
+    """
+    start64, end64 = np.datetime64(start, "us"), np.datetime64(end, "us")
+    window_days = (end64 - start64) / DAY
+    if len(books.book_id) == 0 or window_days <= 0:
+        return []
+
+    known = np.isin(rentals.book_id, books.book_id)
+    book_index = np.searchsorted(books.book_id, rentals.book_id[known])
+    rented_from = np.maximum(rentals.rental_date[known], start64)
+    return_dates = rentals.return_date[known]
+    # Still out: counts until the end of the window. Returned without a
+    # recorded return_date: assume it came back on its due date.
+    open_until = np.where(rentals.is_returned[known], rentals.due_date[known], end64)
+    rented_until = np.minimum(np.where(np.isnat(return_dates), open_until, return_dates), end64)
+    rented_days = np.clip((rented_until - rented_from) / DAY, 0, None)
+
+    n_books = len(books.book_id)
+    days_per_book = np.bincount(book_index, weights=rented_days, minlength=n_books)
+    active_per_book = np.bincount(book_index, weights=~rentals.is_returned[known], minlength=n_books)
+    copies = books.quantity + active_per_book
+    utilization = np.divide(days_per_book, copies * window_days,
+                            out=np.zeros(n_books), where=copies > 0)
+
+    order = np.argsort(-utilization, kind="stable")[:limit]
+    return [
+        {
+            "book_id": int(books.book_id[i]),
+            "title": books.title[i],
+            "author": books.author[i],
+            "copies": int(copies[i]),
+            "rented_days": round(float(days_per_book[i]), 2),
+            "utilization": round(float(utilization[i]), 4),
+        }
+        for i in order
+    ]
+
+
+def overdue_ratio(rentals: RentalColumns, start: datetime, end: datetime, now: datetime,
+                  granularity: str) -> Dict[str, Any]:
+    """
+    Per bucket of due_date: how many rentals were returned late or are still
+    out past their due date, over all rentals due in that bucket.
+    """
+    start64, end64, now64 = (np.datetime64(value, "us") for value in (start, end, now))
+    in_window = (rentals.due_date >= start64) & (rentals.due_date < end64)
+    due = rentals.due_date[in_window]
+    return_dates = rentals.return_date[in_window]
+    still_out = ~rentals.is_returned[in_window]
+    late = np.where(np.isnat(return_dates), still_out & (due < now64), return_dates > due)
+
+    buckets = _bucket_range(start64, end64, granularity)
+    totals = _count_by_bucket(due, buckets, granularity)
+    overdue = _count_by_bucket(due[late], buckets, granularity)
+    ratios = np.divide(overdue, totals, out=np.zeros(len(buckets)), where=totals > 0)
+    return {
+        "total_due": int(len(due)),
+        "total_overdue": int(late.sum()),
+        "overdue_ratio": round(float(late.mean()), 4) if len(due) else 0.0,
+        "buckets": [
+            {"bucket": str(bucket), "due": int(total), "overdue": int(count), "ratio": round(float(ratio), 4)}
+            for bucket, total, count, ratio in zip(buckets, totals, overdue, ratios)
+        ],
+    }
+
+
+def user_cohorts(rentals: RentalColumns, months: int) -> List[Dict[str, Any]]:
+    """
+    Group users by the month of their first rental and count, for each
+    following month, how many of them rented again.
+    """
+    if len(rentals) == 0:
+        return []
+
+    rental_month = rentals.rental_date.astype("datetime64[M]").astype(np.int64)
+    users, user_index = np.unique(rentals.user_id, return_inverse=True)
+    first_month = np.full(len(users), np.iinfo(np.int64).max)
+    np.minimum.at(first_month, user_index, rental_month)
+    offset = rental_month - first_month[user_index]
+
+    # One entry per (user, month offset), then count users per (cohort, offset)
+    keep = offset < months
+    user_offsets = np.unique(user_index[keep] * months + offset[keep])
+    active_user, active_offset = np.divmod(user_offsets, months)
+    cohort_keys = first_month[active_user] * months + active_offset
+    keys, counts = np.unique(cohort_keys, return_counts=True)
+    cohort_of_key, offset_of_key = np.divmod(keys, months)
+
+    cohorts, cohort_sizes = np.unique(first_month, return_counts=True)
+    matrix = np.zeros((len(cohorts), months), dtype=np.int64)
+    matrix[np.searchsorted(cohorts, cohort_of_key), offset_of_key] = counts
+    return [
+        {
+            "cohort": str(np.datetime64(int(cohort), "M")),
+            "users": int(size),
+            "active_by_month": [int(value) for value in row],
+        }
+        for cohort, size, row in zip(cohorts, cohort_sizes, matrix)
+    ]
@@ -0,0 +1,122 @@
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from settings import ARCHIVE_BATCH_PAUSE_MS, ARCHIVE_BATCH_SIZE
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+# Returned rentals older than a cutoff live in rentals_archive, so the hot
+# rentals table (and its indexes) only grows with recent activity. Routers
+# read `rentals` unless a request asks for history; jobs that need every
+# rental ever made (rollup backfill, recommendations, analytics, exports)
+# always read both through `rental_source(include_history=True)`.
+RENTAL_COLUMNS = "id, user_id, book_id, rental_date, due_date, return_date, is_returned"
+
+
+def rental_source(include_history: bool) -> str:
+    """FROM clause source for rentals; always give it an alias (`FROM {source} r`)"""
+    if not include_history:
+        return "rentals"
+    return f"(SELECT {RENTAL_COLUMNS} FROM rentals UNION ALL SELECT {RENTAL_COLUMNS} FROM rentals_archive)"
+
+
+def archive_cutoff(months: int, now: Optional[datetime] = None) -> datetime:
+    """Start of the month `months` months before `now`: archival moves whole months"""
+    now = now or datetime.now()
+    month_index = now.year * 12 + now.month - 1 - months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def ensure_archive_partitions(cursor, start: datetime, end: datetime) -> int:
+    """
+    Create the monthly PostgreSQL partitions of rentals_archive covering
+    [start, end]; returns how many were created
+    """
+    created = 0
+    month = datetime(start.year, start.month, 1)
+    while month <= end:
+        name = f"rentals_archive_p{month:%Y%m}"
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF rentals_archive "
+                f"FOR VALUES FROM (%s) TO (%s)", (month, _next_month(month)),
+            )
+            cursor.connection.commit()
+            created += 1
+        month = _next_month(month)
+    return created
+
+
+def archive_rentals(backend: str, months: int, batch_size: int = ARCHIVE_BATCH_SIZE,
+                    batch_pause: float = ARCHIVE_BATCH_PAUSE_MS / 1000) -> Dict[str, int]:
+    """
+    Move returned rentals from before `archive_cutoff(months)` to
+    rentals_archive, one id range of `batch_size` per transaction. Rentals a
+    hold points to stay hot, and so does the newest rental: SQLite hands out
+    max(id) + 1, so archiving it would let a new rental reuse its id.
+    """
+    p = PLACEHOLDERS[backend]
+    returned = "true" if backend == "postgres" else "1"
+    cutoff = archive_cutoff(months)
+    cutoff_param = cutoff if backend == "postgres" else cutoff.isoformat()
+    candidates = f"""
+        is_returned = {returned} AND return_date < {p}
+        AND id >= {p} AND id < {p}
+        AND NOT EXISTS (SELECT 1 FROM holds h WHERE h.rental_id = rentals.id)
+    """
+
+    conn = open_connection(backend, read_only=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM rentals")
+        low, high = cursor.fetchone()
+        if low is None:
+            return {"archived": 0, "partitions_created": 0}
+
+        partitions_created = 0
+        if backend == "postgres":
+            cursor.execute(
+                "SELECT MIN(rental_date), MAX(rental_date) FROM rentals WHERE is_returned = true AND return_date < %s",
+                (cutoff,),
+            )
+            oldest, newest = cursor.fetchone()
+            conn.commit()
+            if oldest is not None:
+                partitions_created = ensure_archive_partitions(cursor, oldest, newest)
+
+        archived = 0
+        for start in range(low, high, batch_size):
+            params = (cutoff_param, start, min(start + batch_size, high))
+            if backend == "postgres":
+                cursor.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM rentals WHERE {candidates}
+                        RETURNING {RENTAL_COLUMNS}
+                    )
+                    INSERT INTO rentals_archive ({RENTAL_COLUMNS})
+                    SELECT {RENTAL_COLUMNS} FROM moved
+                """, params)
+            else:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(f"""
+                    INSERT INTO rentals_archive ({RENTAL_COLUMNS})
+                    SELECT {RENTAL_COLUMNS} FROM rentals WHERE {candidates}
+                """, params)
+            moved = max(cursor.rowcount, 0)
+            if backend == "sqlite":
+                cursor.execute(f"DELETE FROM rentals WHERE {candidates}", params)
+            conn.commit()
+            archived += moved
+            if moved and batch_pause:
+                time.sleep(batch_pause)
+        return {"archived": archived, "partitions_created": partitions_created}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,310 @@
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from src.utils.broker import RESYNC
+from src.utils.snapshots import SNAPSHOT_COLUMNS, SNAPSHOT_VALUES
+
+
+class AvailabilityView:
+    """
+    In-memory view of what can be rented: book quantities, known users and
+    active (user_id, book_id) pairs.
+
+    Rentals are validated against the view without touching the database.
+    Users and books missing from the view are read through from the database
+    once, so rows created by other workers are picked up lazily; the read
+    runs outside the view's lock, so it never holds up other rentals. The
+    database write stays authoritative; callers revert the view when it
+    fails.
+
+    With `follow_events`, committed quantities come from availability events
+    (`apply_event`) only: adjusting them again for this process's own commits
+    would count those twice whenever the event is applied first.
+
+    Without `trust_refusals` (events from other processes do not reach the
+    view), "no copy left" and "already rented" are not refused from memory:
+    the copy is taken in the view anyway, possibly below zero, and the
+    conditional database write decides (see `rejected_rent`).
+    """
+
+    def __init__(self, connect: Callable, placeholder: str = "%s", follow_events: bool = False,
+                 trust_refusals: bool = True):
+        self._connect = connect
+        self._placeholder = placeholder
+        self.follow_events = follow_events
+        self.trust_refusals = trust_refusals
+        self._lock = threading.RLock()
+        self.quantities: Dict[int, int] = {}
+        self.titles: Dict[int, str] = {}
+        self.users: Dict[int, str] = {}
+        self.active_pairs: Set[Tuple[int, int]] = set()
+        # Persisted active rentals: rental_id -> (user_id, book_id), and
+        # book_id -> rental ids for returns by book
+        self.rentals: Dict[int, Tuple[int, int]] = {}
+        self.book_rentals: Dict[int, Set[int]] = {}
+
+    def load(self):
+        """Load the full view from the database"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, title, quantity FROM books WHERE deleted_at IS NULL")
+            books = cursor.fetchall()
+            cursor.execute("SELECT id, full_name FROM users WHERE deleted_at IS NULL")
+            users = cursor.fetchall()
+            cursor.execute("SELECT id, user_id, book_id FROM rentals WHERE is_returned = false")
+            rentals = cursor.fetchall()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.quantities = {book[0]: book[2] for book in books}
+            self.titles = {book[0]: book[1] for book in books}
+            self.users = {user[0]: user[1] for user in users}
+            self.rentals = {}
+            self.book_rentals = {}
+            for rental in rentals:
+                self._add_rental(rental[0], rental[1], rental[2])
+            self.active_pairs = set(self.rentals.values())
+
+    def _add_rental(self, rental_id: int, user_id: int, book_id: int):
+        """Record an active rental; the caller holds the lock"""
+        self.rentals[rental_id] = (user_id, book_id)
+        self.book_rentals.setdefault(book_id, set()).add(rental_id)
+
+    def _drop_rental(self, rental_id: int) -> Optional[Tuple[int, int]]:
+        """Forget an active rental, returning its (user_id, book_id); the caller holds the lock"""
+        rental = self.rentals.pop(rental_id, None)
+        if rental is not None:
+            book_rentals = self.book_rentals.get(rental[1])
+            if book_rentals is not None:
+                book_rentals.discard(rental_id)
+                if not book_rentals:
+                    del self.book_rentals[rental[1]]
+        return rental
+
+    def _read_through(self, user_id: Optional[int], book_id: Optional[int]):
+        """
+        Read a user and/or book missing from the view from the database,
+        without the lock, then add them unless the view got them meanwhile
+        """
+        user = book = None
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            if user_id is not None:
+                cursor.execute(
+                    f"SELECT id, full_name FROM users WHERE id = {self._placeholder} AND deleted_at IS NULL", (user_id,)
+                )
+                user = cursor.fetchone()
+            if book_id is not None:
+                cursor.execute(
+                    f"SELECT id, title, quantity FROM books WHERE id = {self._placeholder} AND deleted_at IS NULL",
+                    (book_id,),
+                )
+                book = cursor.fetchone()
+        finally:
+            conn.close()
+
+        with self._lock:
+            if user and user[0] not in self.users:
+                self.users[user[0]] = user[1]
+            if book and book[0] not in self.quantities:
+                self.titles[book[0]] = book[1]
+                self.quantities[book[0]] = book[2]
+
+    def reserve_rent(self, user_id: int, book_id: int) -> Tuple[str, str]:
+        """
+        Validate a rental and take one copy in the view.
+        Returns (user full name, book title); raises the same HTTP errors as
+        the synchronous rent handlers.
+        """
+        with self._lock:
+            missing_user = user_id not in self.users
+            missing_book = book_id not in self.quantities
+        if missing_user or missing_book:
+            self._read_through(user_id if missing_user else None, book_id if missing_book else None)
+
+        with self._lock:
+            if user_id not in self.users:
+                raise HTTPException(status_code=404, detail="User not found")
+            if book_id not in self.quantities:
+                raise HTTPException(status_code=404, detail="Book not found")
+            if self.trust_refusals:
+                if self.quantities[book_id] <= 0:
+                    raise HTTPException(status_code=400, detail="Book not available")
+                if (user_id, book_id) in self.active_pairs:
+                    raise HTTPException(status_code=400, detail="User already has this book rented")
+
+            self.quantities[book_id] -= 1
+            self.active_pairs.add((user_id, book_id))
+            return self.users[user_id], self.titles[book_id]
+
+    def release_rent(self, user_id: int, book_id: int):
+        """Undo `reserve_rent` after the database write failed"""
+        with self._lock:
+            self.active_pairs.discard((user_id, book_id))
+            if book_id in self.quantities:
+                self.quantities[book_id] += 1
+
+    def confirm_rent(self, rental_id: int, user_id: int, book_id: int):
+        with self._lock:
+            self._add_rental(rental_id, user_id, book_id)
+            self.active_pairs.add((user_id, book_id))
+
+    def rejected_rent(self, user_id: int, book_id: int, duplicate: bool) -> HTTPException:
+        """
+        The database refused a rental the view allowed: undo the reservation,
+        re-read the user and book and return the error to raise.
+        """
+        with self._lock:
+            self.release_rent(user_id, book_id)
+            if duplicate:
+                self.active_pairs.add((user_id, book_id))
+                return HTTPException(status_code=400, detail="User already has this book rented")
+            self.users.pop(user_id, None)
+            self.quantities.pop(book_id, None)
+            self.titles.pop(book_id, None)
+        self._read_through(user_id, book_id)
+        with self._lock:
+            if user_id not in self.users:
+                return HTTPException(status_code=404, detail="User not found")
+            if book_id not in self.quantities:
+                return HTTPException(status_code=404, detail="Book not found")
+            return HTTPException(status_code=400, detail="Book not available")
+
+    def reserve_return(self, rental_id: Optional[int] = None, book_id: Optional[int] = None) -> Tuple[int, int, int]:
+        """
+        Validate a return and give the copy back in the view.
+        With only `book_id`, the most recent active rental of the book is used.
+        Returns (rental_id, user_id, book_id).
+        """
+        with self._lock:
+            if rental_id is None and book_id is not None:
+                rental_id = max(self.book_rentals.get(book_id, ()), default=None)
+
+            if rental_id is None or rental_id not in self.rentals:
+                raise HTTPException(status_code=404, detail="Active rental not found")
+
+            user_id, book_id = self._drop_rental(rental_id)
+            self.active_pairs.discard((user_id, book_id))
+            if book_id in self.quantities:
+                self.quantities[book_id] += 1
+            return rental_id, user_id, book_id
+
+    def release_return(self, rental_id: int, user_id: int, book_id: int):
+        """Undo `reserve_return` after the database write failed"""
+        with self._lock:
+            self._add_rental(rental_id, user_id, book_id)
+            self.active_pairs.add((user_id, book_id))
+            if book_id in self.quantities:
+                self.quantities[book_id] -= 1
+
+    def confirm_return(self, rental_id: int, user_id: int, book_id: int):
+        """A return committed by this process, whether or not the view knew the rental"""
+        with self._lock:
+            self._drop_rental(rental_id)
+            self.active_pairs.discard((user_id, book_id))
+            if book_id in self.quantities and not self.follow_events:
+                self.quantities[book_id] += 1
+
+    def apply_event(self, event: Dict[str, Any]):
+        """
+        Follow availability changes committed anywhere (see
+        availability_events.observe_availability). Quantities are taken as
+        reported, so the view converges on the database; changed or deleted
+        books are dropped and read through again when next rented.
+        """
+        if event is RESYNC:
+            self.load()
+            return
+        book_id = event["book_id"]
+        with self._lock:
+            if event["change"] in ("rent", "return") and book_id in self.quantities:
+                self.quantities[book_id] = event["quantity"]
+            elif event["change"] in ("create", "update", "delete"):
+                self.quantities.pop(book_id, None)
+                self.titles.pop(book_id, None)
+            if event.get("rental_id") is None:
+                return
+            if event["change"] == "rent":
+                self._add_rental(event["rental_id"], event["user_id"], book_id)
+                self.active_pairs.add((event["user_id"], book_id))
+            elif event["change"] == "return":
+                self._drop_rental(event["rental_id"])
+                self.active_pairs.discard((event["user_id"], book_id))
+
+    def hand_off(self, rental_id: int, user_id: int, book_id: int):
+        """A returned copy went straight to a hold instead of back on the shelf"""
+        with self._lock:
+            self._add_rental(rental_id, user_id, book_id)
+            self.active_pairs.add((user_id, book_id))
+            if book_id in self.quantities and not self.follow_events:
+                self.quantities[book_id] -= 1
+
+    def describe(self, user_id: int, book_id: int) -> Tuple[Optional[str], Optional[str]]:
+        with self._lock:
+            return self.users.get(user_id), self.titles.get(book_id)
+
+
+def conditional_rent(cursor, backend: str, user_id: int, book_id: int,
+                     rental_date: datetime, due_date: datetime) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Take a copy of `book_id` and insert the rental, only if a copy is left,
+    neither the user nor the book is deleted and the user has no active
+    rental of the book. Returns (rental_id, None), or
+    (None, "unavailable" | "duplicate"); the caller must then roll back.
+
+    PostgreSQL does it in one statement. The partial unique index on active
+    (user_id, book_id) pairs rejects a concurrent duplicate that the
+    statement's snapshot cannot see. SQLite runs the same two steps under the
+    write lock taken by the UPDATE.
+    """
+    try:
+        if backend == "postgres":
+            cursor.execute(f"""
+                WITH taken AS (
+                    UPDATE books SET quantity = quantity - 1
+                    WHERE id = %(book_id)s AND quantity > 0 AND deleted_at IS NULL
+                      AND EXISTS (SELECT 1 FROM users WHERE id = %(user_id)s AND deleted_at IS NULL)
+                    RETURNING id, title, author
+                ), rented AS (
+                    INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned, {SNAPSHOT_COLUMNS})
+                    SELECT u.id, b.id, %(rental_date)s, %(due_date)s, false, {SNAPSHOT_VALUES}
+                    FROM taken b JOIN users u ON u.id = %(user_id)s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM rentals
+                        WHERE user_id = %(user_id)s AND book_id = %(book_id)s AND is_returned = false
+                    )
+                    RETURNING id
+                )
+                SELECT (SELECT COUNT(*) FROM taken) AS taken, (SELECT id FROM rented) AS rental_id
+            """, {"user_id": user_id, "book_id": book_id, "rental_date": rental_date, "due_date": due_date})
+            row = cursor.fetchone()
+            taken, rental_id = (row["taken"], row["rental_id"]) if isinstance(row, dict) else tuple(row)
+            if not taken:
+                return None, "unavailable"
+            return (rental_id, None) if rental_id is not None else (None, "duplicate")
+
+        cursor.execute("""
+            UPDATE books SET quantity = quantity - 1
+            WHERE id = ? AND quantity > 0 AND deleted_at IS NULL
+              AND EXISTS (SELECT 1 FROM users WHERE id = ? AND deleted_at IS NULL)
+        """, (book_id, user_id))
+        if cursor.rowcount == 0:
+            return None, "unavailable"
+        cursor.execute(f"""
+            INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned, {SNAPSHOT_COLUMNS})
+            SELECT u.id, b.id, ?, ?, 0, {SNAPSHOT_VALUES}
+            FROM users u, books b
+            WHERE u.id = ? AND b.id = ?
+              AND NOT EXISTS (SELECT 1 FROM rentals WHERE user_id = ? AND book_id = ? AND is_returned = 0)
+        """, (rental_date.isoformat(), due_date.isoformat(), user_id, book_id, user_id, book_id))
+        if cursor.rowcount == 0:
+            return None, "duplicate"
+        return cursor.lastrowid, None
+    except cursor.connection.IntegrityError:
+        return None, "duplicate"
@@ -0,0 +1,222 @@
+import json
+import logging
+import select
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from src.utils.broker import RESYNC, broker
+from src.utils.db_backends import PLACEHOLDERS
+
+logger = logging.getLogger(__name__)
+
+# Book availability changes. PostgreSQL handlers NOTIFY this channel inside
+# their transaction, so every worker's listener sees the change once it
+# commits; SQLite handlers publish to the in-process broker after commit.
+AVAILABILITY_CHANNEL = "book_availability"
+ALL_BOOKS_TOPIC = "availability:*"
+# Subscribers of any availability topic also get resync requests here
+CONTROL_TOPIC = "availability:control"
+# Who rented/returned is for in-process observers only, never streamed
+PRIVATE_FIELDS = ("user_id", "rental_id")
+
+# Synchronous callbacks per backend, called with every event (or RESYNC)
+_observers: Dict[str, List[Callable]] = {}
+
+
+def observe_availability(backend: str, callback: Callable):
+    """Call `callback(event)` for every availability change of `backend`, and with RESYNC after missed events"""
+    _observers.setdefault(backend, []).append(callback)
+
+
+def unobserve_availability(backend: str, callback: Callable):
+    if callback in _observers.get(backend, ()):
+        _observers[backend].remove(callback)
+
+
+def _notify_observers(backend: str, event: Dict[str, Any]):
+    for callback in list(_observers.get(backend, ())):
+        try:
+            callback(event)
+        except Exception:
+            logger.exception("Availability observer failed")
+
+
+def availability_topic(book_id: int) -> str:
+    return f"availability:{book_id}"
+
+
+def availability_change(cursor, backend: str, book_id: int, change: str,
+                        user_id: Optional[int] = None, rental_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Record that `book_id` changed ("rent", "return", "create", "update",
+    "delete") with its quantity as seen by the caller's transaction. Rents
+    and returns also carry the user and rental, for AvailabilityView.
+
+    PostgreSQL: queues a NOTIFY that is delivered on commit and returns None.
+    SQLite: returns the event, to be passed to `publish_availability` after
+    commit.
+    """
+    p = PLACEHOLDERS[backend]
+    if backend == "postgres":
+        if change == "delete":
+            cursor.execute(
+                "SELECT pg_notify(%s, json_build_object('book_id', %s, 'quantity', NULL, 'change', %s)::text)",
+                (AVAILABILITY_CHANNEL, book_id, change)
+            )
+        else:
+            cursor.execute("""
+                SELECT pg_notify(%s, json_build_object(
+                    'book_id', id, 'quantity', quantity, 'change', %s, 'user_id', %s, 'rental_id', %s
+                )::text)
+                FROM books WHERE id = %s
+            """, (AVAILABILITY_CHANNEL, change, user_id, rental_id, book_id))
+        return None
+
+    quantity = None
+    if change != "delete":
+        cursor.execute(f"SELECT quantity FROM books WHERE id = {p}", (book_id,))
+        row = cursor.fetchone()
+        quantity = row[0] if row else None
+    return {
+        "book_id": book_id, "quantity": quantity, "change": change, "backend": backend,
+        "user_id": user_id, "rental_id": rental_id,
+    }
+
+
+def availability_changes(cursor, backend: str, changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    `availability_change` for many rents/returns at once: `changes` holds
+    book_id, change, user_id and rental_id. PostgreSQL queues all the
+    NOTIFYs with one statement, in order, and returns []; SQLite returns the
+    events to publish after commit.
+    """
+    if not changes:
+        return []
+    if backend == "postgres":
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(changes))
+        params: List[Any] = []
+        for position, change in enumerate(changes):
+            params.extend([position, change["book_id"], change["change"], change["user_id"], change["rental_id"]])
+        cursor.execute(f"""
+            SELECT pg_notify(%s, json_build_object(
+                'book_id', b.id, 'quantity', b.quantity, 'change', v.change,
+                'user_id', v.user_id, 'rental_id', v.rental_id
+            )::text)
+            FROM (VALUES {values}) v (position, book_id, change, user_id, rental_id)
+            JOIN books b ON b.id = v.book_id
+            ORDER BY v.position
+        """, [AVAILABILITY_CHANNEL, *params])
+        return []
+    return [
+        availability_change(
+            cursor, backend, change["book_id"], change["change"],
+            user_id=change["user_id"], rental_id=change["rental_id"],
+        )
+        for change in changes
+    ]
+
+
+def publish_availability(event: Optional[Dict[str, Any]]):
+    """Hand an availability event to this process's observers and subscribers"""
+    if event is None:
+        return
+    _notify_observers(event["backend"], event)
+    event = dict(event, type="availability")
+    # Serialized once here rather than once per subscriber
+    event["sse"] = _sse("availability", {
+        key: value for key, value in event.items() if key != "type" and key not in PRIVATE_FIELDS
+    })
+    broker.publish(availability_topic(event["book_id"]), event)
+    broker.publish(ALL_BOOKS_TOPIC, event)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class AvailabilityListener:
+    """
+    LISTEN on the availability channel from a background thread and publish
+    every notification to the in-process broker. Once listening (first
+    connect included), observers and subscribers are asked to resync since
+    notifications may have been missed.
+    """
+
+    def __init__(self, connect: Callable, poll_interval: float = 1.0):
+        self._connect = connect
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="availability-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        backoff = self.poll_interval
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {AVAILABILITY_CHANNEL}")
+                _notify_observers("postgres", RESYNC)
+                broker.publish(CONTROL_TOPIC, RESYNC)
+                backoff = self.poll_interval
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        publish_availability(dict(json.loads(notify.payload), backend="postgres"))
+            except Exception:
+                logger.exception("Availability listener failed; reconnecting in %.2fs", backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+async def availability_stream(
+    backend: str,
+    book_ids: Optional[List[int]],
+    load_quantities: Callable[[], Dict[int, int]],
+    heartbeat: float,
+    is_disconnected: Callable,
+    queue_size: int,
+) -> AsyncIterator[str]:
+    """
+    Server-sent events for kiosks: a "snapshot" of the watched books, then an
+    "availability" event per change. A client that cannot keep up gets a new
+    snapshot instead of the backlog (bounded queue, see Broker).
+    """
+    topics = [availability_topic(book_id) for book_id in book_ids] if book_ids else [ALL_BOOKS_TOPIC]
+    with broker.subscribe(topics + [CONTROL_TOPIC], maxsize=queue_size) as subscription:
+        async def snapshot() -> str:
+            quantities = await run_in_threadpool(load_quantities)
+            return _sse("snapshot", {
+                "backend": backend,
+                "books": [{"book_id": book_id, "quantity": quantity} for book_id, quantity in quantities.items()],
+            })
+
+        yield await snapshot()
+        while True:
+            event = await subscription.get(heartbeat)
+            if await is_disconnected():
+                return
+            if event is None:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            elif event is RESYNC:
+                yield await snapshot()
+            elif event["backend"] == backend:
+                yield event["sse"]
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Delivered instead of the dropped events when a subscriber fell too far
+# behind; the subscriber should re-read current state.
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """Bounded queue of events for one consumer, bound to its event loop"""
+
+    def __init__(self, broker: "Broker", topics: Set[str], maxsize: int, loop: asyncio.AbstractEventLoop):
+        self.broker = broker
+        self.topics = topics
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=maxsize)
+
+    def _deliver(self, event: Dict[str, Any]):
+        # Runs on the subscriber's loop. A full queue means the consumer is
+        # slow: drop what it has not read yet and tell it to resync.
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None after `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _deliver_all(subscriptions: List[Subscription], event: Dict[str, Any]):
+    for subscription in subscriptions:
+        subscription._deliver(event)
+
+
+class Broker:
+    """
+    In-process publish/subscribe. `publish` may be called from any thread
+    (the threadpool handlers); events are handed to each subscriber's event
+    loop, so a slow subscriber never blocks the publisher.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, topics: Iterable[str], maxsize: int = 100) -> Subscription:
+        """Subscribe from a coroutine; events are delivered on the running loop"""
+        subscription = Subscription(self, set(topics), maxsize, asyncio.get_running_loop())
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, topic: str, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        # One wake-up per event loop, however many subscribers it serves
+        by_loop: Dict[asyncio.AbstractEventLoop, List[Subscription]] = {}
+        for subscription in subscribers:
+            by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, loop_subscribers in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, loop_subscribers, event)
+            except RuntimeError:
+                # The subscribers' loop is closed
+                for subscription in loop_subscribers:
+                    self.unsubscribe(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len({subscription for subscribers in self._subscribers.values() for subscription in subscribers})
+
+
+broker = Broker()
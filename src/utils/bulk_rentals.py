@@ -0,0 +1,218 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.availability_events import availability_changes
+from src.utils.holds import hand_off
+from src.utils.rollups import record_rollup
+from src.utils.snapshots import SNAPSHOT_COLUMNS, SNAPSHOT_VALUES, rental_details
+
+# Bulk rent/return for check-in stations (PostgreSQL). A whole batch is
+# resolved with one set-based query and applied in the caller's transaction
+# with aggregated statements over VALUES lists, instead of one transaction
+# per book. Items are refused one by one, with the error the single-item
+# endpoint would have returned, and never fail the rest of the batch.
+
+
+def _values(rows: int, template: str) -> str:
+    return ", ".join([template] * rows)
+
+
+def bulk_rent(cursor, items: List[Tuple[int, int, datetime]],
+              rental_date: datetime) -> List[Tuple[Optional[int], Optional[str]]]:
+    """
+    Rent many books at once: `items` are (user_id, book_id, due_date) with
+    distinct (user_id, book_id) pairs. Returns, per item,
+    (rental_id, None) or (None, "unavailable" | "duplicate") like
+    `conditional_rent`.
+
+    The books are locked in id order and each copy left goes to the
+    requests for it in item order; quantities drop with one UPDATE per
+    batch. A concurrent duplicate rejected by the unique index of active
+    pairs rolls back to a savepoint and the batch is resolved again.
+    """
+    if not items:
+        return []
+    params: List[Any] = []
+    for index, (user_id, book_id, due_date) in enumerate(items):
+        params.extend([index, user_id, book_id, due_date])
+    statement = f"""
+        WITH req (idx, user_id, book_id, due_date) AS (
+            VALUES {_values(len(items), "(%s::integer, %s::integer, %s::integer, %s::timestamp)")}
+        ), locked AS (
+            SELECT id, quantity FROM books
+            WHERE id IN (SELECT book_id FROM req) AND deleted_at IS NULL
+            ORDER BY id
+            FOR UPDATE
+        ), eligible AS (
+            SELECT req.*, row_number() OVER (PARTITION BY req.book_id ORDER BY req.idx) AS nth
+            FROM req JOIN users u ON u.id = req.user_id AND u.deleted_at IS NULL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM rentals r
+                WHERE r.user_id = req.user_id AND r.book_id = req.book_id AND r.is_returned = false
+            )
+        ), accepted AS (
+            SELECT e.* FROM eligible e JOIN locked l ON l.id = e.book_id
+            WHERE e.nth <= l.quantity
+        ), taken AS (
+            UPDATE books b SET quantity = b.quantity - a.copies
+            FROM (SELECT book_id, COUNT(*) AS copies FROM accepted GROUP BY book_id) a
+            WHERE b.id = a.book_id
+            RETURNING b.id
+        ), rented AS (
+            INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned, {SNAPSHOT_COLUMNS})
+            SELECT a.user_id, a.book_id, %s, a.due_date, false, {SNAPSHOT_VALUES}
+            FROM accepted a JOIN users u ON u.id = a.user_id JOIN books b ON b.id = a.book_id
+            ORDER BY a.idx
+            RETURNING id, user_id, book_id
+        )
+        SELECT req.idx, rented.id AS rental_id,
+               EXISTS (SELECT 1 FROM users WHERE id = req.user_id AND deleted_at IS NULL)
+               AND NOT EXISTS (SELECT 1 FROM eligible WHERE eligible.idx = req.idx) AS duplicate
+        FROM req LEFT JOIN rented ON rented.user_id = req.user_id AND rented.book_id = req.book_id
+        ORDER BY req.idx
+    """
+
+    for attempt in range(2):
+        cursor.execute("SAVEPOINT bulk_rent")
+        try:
+            cursor.execute(statement, [*params, rental_date])
+            rows = cursor.fetchall()
+            cursor.execute("RELEASE SAVEPOINT bulk_rent")
+            break
+        except cursor.connection.IntegrityError:
+            cursor.execute("ROLLBACK TO SAVEPOINT bulk_rent")
+            if attempt == 1:
+                raise
+
+    outcomes: List[Tuple[Optional[int], Optional[str]]] = []
+    changes = []
+    for row, (user_id, book_id, _) in zip(rows, items):
+        rental_id = row["rental_id"]
+        if rental_id is not None:
+            outcomes.append((rental_id, None))
+            changes.append({"book_id": book_id, "change": "rent", "user_id": user_id, "rental_id": rental_id})
+        else:
+            outcomes.append((None, "duplicate" if row["duplicate"] else "unavailable"))
+
+    if changes:
+        record_rollup(cursor, "rent", rental_date, "postgres", count=len(changes))
+        availability_changes(cursor, "postgres", changes)
+    return outcomes
+
+
+def bulk_return(cursor, items: List[Tuple[Optional[int], Optional[int]]],
+                return_date: datetime) -> List[Dict[str, Any]]:
+    """
+    Return many books at once: `items` are (rental_id, book_id) like
+    RentalReturn, a bare book_id meaning its most recent active rental (the
+    second bare book_id of the same book its second most recent, and so on).
+
+    Returns per item either {"status_code": 200, "rental": ..., "handed_to":
+    hold or None} or {"status_code": 4xx, "detail": ...}. Returned copies
+    go to waiting holds first (`hand_off`), the rest back on the shelf with
+    one quantity UPDATE for the whole batch.
+    """
+    if not items:
+        return []
+    details, joins = rental_details()
+    seen_books: Counter = Counter()
+    params: List[Any] = []
+    for index, (rental_id, book_id) in enumerate(items):
+        nth = 0
+        if rental_id is None and book_id is not None:
+            nth = seen_books[book_id]
+            seen_books[book_id] += 1
+        params.extend([index, rental_id, book_id, nth])
+
+    cursor.execute(f"""
+        SELECT v.idx, found.*
+        FROM (VALUES {_values(len(items), "(%s::integer, %s::integer, %s::integer, %s::integer)")})
+             v (idx, rental_id, book_id, nth)
+        LEFT JOIN LATERAL (
+            SELECT r.id, r.user_id, r.book_id, r.is_returned, {details}
+            FROM rentals r {joins}
+            WHERE r.id = v.rental_id
+            UNION ALL
+            (SELECT r.id, r.user_id, r.book_id, r.is_returned, {details}
+             FROM rentals r {joins}
+             WHERE v.rental_id IS NULL AND r.book_id = v.book_id AND r.is_returned = false
+             ORDER BY r.rental_date DESC, r.id DESC
+             OFFSET v.nth LIMIT 1)
+        ) found ON true
+        ORDER BY v.idx
+    """, params)
+    resolved = cursor.fetchall()
+
+    results: List[Dict[str, Any]] = []
+    claimed = set()
+    for rental in resolved:
+        if rental["id"] is None:
+            results.append({"status_code": 404, "detail": "Active rental not found"})
+        elif rental["is_returned"]:
+            results.append({"status_code": 400, "detail": "Book already returned"})
+        elif rental["id"] in claimed:
+            results.append({"status_code": 400, "detail": "Rental appears more than once in this request"})
+        else:
+            claimed.add(rental["id"])
+            results.append({"status_code": 200, "rental": rental})
+    if not claimed:
+        return results
+
+    # Only rentals still active are returned: a concurrent return of the
+    # same rental commits first and this batch then leaves it alone
+    ids = sorted(claimed)
+    cursor.execute(f"""
+        UPDATE rentals r SET return_date = %s, is_returned = true
+        FROM (VALUES {_values(len(ids), "(%s::integer)")}) v (id)
+        WHERE r.id = v.id AND r.is_returned = false
+        RETURNING r.id
+    """, [return_date, *ids])
+    returned = {row["id"] for row in cursor.fetchall()}
+
+    # Lock the books in id order, so a concurrent place_hold either shows up
+    # below or sees the new quantities (see hand_off)
+    book_ids = sorted({result["rental"]["book_id"] for result in results
+                       if result["status_code"] == 200 and result["rental"]["id"] in returned})
+    waiting = set()
+    if book_ids:
+        cursor.execute("SELECT id FROM books WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (book_ids,))
+        cursor.execute(
+            "SELECT DISTINCT book_id FROM holds WHERE book_id = ANY(%s) AND status = 'waiting'", (book_ids,)
+        )
+        waiting = {row["book_id"] for row in cursor.fetchall()}
+
+    shelved: Counter = Counter()
+    changes = []
+    for result in results:
+        if result["status_code"] != 200:
+            continue
+        rental = result.pop("rental")
+        if rental["id"] not in returned:
+            result.update(status_code=400, detail="Book already returned")
+            continue
+        handed_to = hand_off(cursor, "postgres", rental["book_id"], return_date) \
+            if rental["book_id"] in waiting else None
+        if handed_to is None:
+            shelved[rental["book_id"]] += 1
+        result.update(rental=rental, handed_to=handed_to)
+        changes.append({
+            "book_id": rental["book_id"], "change": "return",
+            "user_id": rental["user_id"], "rental_id": rental["id"],
+        })
+        if handed_to is not None:
+            changes.append({
+                "book_id": rental["book_id"], "change": "rent",
+                "user_id": handed_to["user_id"], "rental_id": handed_to["rental_id"],
+            })
+
+    if shelved:
+        cursor.execute(f"""
+            UPDATE books b SET quantity = b.quantity + v.copies
+            FROM (VALUES {_values(len(shelved), "(%s::integer, %s::integer)")}) v (id, copies)
+            WHERE b.id = v.id
+        """, [value for book_id, copies in sorted(shelved.items()) for value in (book_id, copies)])
+    if returned:
+        record_rollup(cursor, "return", return_date, "postgres", count=len(returned))
+    availability_changes(cursor, "postgres", changes)
+    return results
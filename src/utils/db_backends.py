@@ -0,0 +1,65 @@
+import os
+import sqlite3
+
+from settings import SQLITE_BUSY_TIMEOUT_MS, SQLITE_PATH
+from src.utils.deadlines import current_deadline
+from src.utils.query_stats import timed_cursor_class
+
+# Parameter placeholder of each backend's DB-API driver
+PLACEHOLDERS = {
+    "sqlite": "?",
+    "postgres": "%s",
+}
+
+
+class InstrumentedSqliteConnection(sqlite3.Connection):
+    """Connection whose cursors (conn.execute included) count their queries, see utils.query_stats"""
+
+    def cursor(self, factory=sqlite3.Cursor):
+        return super().cursor(timed_cursor_class(factory))
+
+
+# Virtual machine instructions between two deadline checks of a statement
+DEADLINE_CHECK_STEPS = 1000
+
+
+def connect_sqlite():
+    """
+    Open a connection; inside a request, lock waits and statements stop at
+    the request's deadline (the progress handler aborts a statement with
+    "interrupted") and statements are interrupted when it is cancelled
+    """
+    deadline = current_deadline.get()
+    timeout = SQLITE_BUSY_TIMEOUT_MS / 1000
+    if deadline is None:
+        return sqlite3.connect(os.path.abspath(SQLITE_PATH), timeout=timeout, factory=InstrumentedSqliteConnection)
+    conn = sqlite3.connect(
+        os.path.abspath(SQLITE_PATH), timeout=min(timeout, deadline.remaining()), factory=InstrumentedSqliteConnection,
+    )
+    conn.set_progress_handler(deadline.expired, DEADLINE_CHECK_STEPS)
+    deadline.track(conn.interrupt)
+    return conn
+
+
+def get_db_connection():
+    """SQLite connection of the /simple-* routers, rows readable by column name"""
+    conn = connect_sqlite()
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def open_connection(backend: str, read_only: bool = True):
+    """
+    Open a plain DB-API connection to one of the routers' backends.
+    Used by code that works on either backend (exports, analytics, jobs).
+    """
+    if backend == "sqlite":
+        return connect_sqlite()
+    if backend == "postgres":
+        # Imported lazily so SQLite-only deployments never load psycopg2
+        from src.utils.postgres_utils import replica_router
+
+        if read_only:
+            return replica_router.connect(read_only=True)
+        return replica_router.connect_primary()
+    raise ValueError(f"Unknown backend: {backend}")
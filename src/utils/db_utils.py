@@ -1,10 +1,17 @@
-from typing import AsyncGenerator
+from typing import TYPE_CHECKING, AsyncGenerator, Optional
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
+from settings import ORM_MAX_OVERFLOW, ORM_POOL_SIZE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_PATH
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
 Base = declarative_base()
 
+_engine: Optional["AsyncEngine"] = None
+_session_factory: Optional["async_sessionmaker"] = None
+
 
 def get_database_url() -> str:
     """
@@ -12,18 +19,48 @@ def get_database_url() -> str:
     Always use SQLite for simplicity.
     """
     # Always use SQLite for now to avoid connection issues
-    db_path = os.path.abspath("library.db")
+    db_path = os.path.abspath(SQLITE_PATH)
     return f"sqlite+aiosqlite:///{db_path}"
 
 
-# Create async engine with SQLite
-engine = create_async_engine(get_database_url(), echo=True)
-session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+def get_engine() -> "AsyncEngine":
+    """
+    Return the async engine, creating it on first use.
+    Nothing is built at import time so that importing the models
+    (CLI commands, routers of other backends) stays cheap.
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        from src.utils.query_stats import instrument_sqlalchemy
+
+        # Statements are logged by the "sqlalchemy.engine" logger when
+        # LOG_LEVELS sets it to INFO, not echoed
+        _engine = create_async_engine(
+            get_database_url(), pool_size=ORM_POOL_SIZE, max_overflow=ORM_MAX_OVERFLOW,
+            connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        )
+        instrument_sqlalchemy(_engine.sync_engine)
+        _session_factory = async_sessionmaker(bind=_engine, expire_on_commit=False)
+    return _engine
+
+
+async def dispose_engine():
+    """
+    Dispose the async engine if it was created.
+    """
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_factory = None
 
 
-async def create_database_session() -> AsyncGenerator[AsyncSession, None]:
+async def create_database_session() -> AsyncGenerator["AsyncSession", None]:
     """
     Create a new database session.
     """
-    async with session_factory() as session:
+    get_engine()
+    async with _session_factory() as session:
         yield session
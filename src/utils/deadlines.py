@@ -0,0 +1,75 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional
+
+# Per-request deadlines. DeadlineMiddleware binds a Deadline to each request;
+# the database connections opened while serving it (connect_postgres,
+# connect_sqlite) are bounded by the time left and register a way to cancel
+# the statement they run. When the deadline passes or the client disconnects
+# the middleware cancels them, so a stuck query stops holding a connection
+# and a worker thread. Work outside a request (background threads, CLI
+# commands) has no deadline.
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        # "deadline" or "disconnect" once cancelled
+        self.reason: Optional[str] = None
+        self._cancels: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.reason is not None or time.monotonic() >= self.expires_at
+
+    def track(self, cancel: Callable[[], None]):
+        """Register how to cancel a connection's running statement"""
+        with self._lock:
+            if self.reason is None:
+                self._cancels.append(cancel)
+                return
+        _call(cancel)
+
+    def cancel(self, reason: str):
+        """Cancel the statements running on every tracked connection (blocking)"""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            cancels, self._cancels = self._cancels, []
+        for cancel in cancels:
+            _call(cancel)
+
+
+def _call(cancel: Callable[[], None]):
+    try:
+        cancel()
+    except Exception:
+        # Already closed, or the statement finished meanwhile
+        pass
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def detached_deadline() -> Iterator[None]:
+    """
+    Run work shared with other requests (coalesced reads) under a copy of
+    the current deadline: still bounded by its expiry, but not cancelled
+    when this request's client disconnects or its deadline timer fires.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        yield
+        return
+    token = current_deadline.set(Deadline(deadline.remaining()))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
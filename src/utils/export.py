@@ -0,0 +1,191 @@
+import csv
+import gzip
+import io
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.utils.archive import rental_source
+from src.utils.db_backends import open_connection
+
+# Columns and ordering of every exportable table. Rentals are ordered by
+# rental_date so month partitions are written one after another.
+EXPORT_TABLES: Dict[str, Tuple[List[str], str]] = {
+    "books": (["id", "title", "author", "year", "quantity"], "id"),
+    "users": (["id", "full_name", "email", "phone"], "id"),
+    "rentals": (
+        ["id", "user_id", "book_id", "rental_date", "due_date", "return_date", "is_returned"],
+        "rental_date, id",
+    ),
+}
+# Soft-deleted books and users are left out; rentals keep all their history
+SOFT_DELETE_TABLES = {"books", "users"}
+DATETIME_COLUMNS = {"rental_date", "due_date", "return_date"}
+BOOLEAN_COLUMNS = {"is_returned"}
+
+
+def iter_row_chunks(backend: str, table: str, chunk_size: int = 5000) -> Iterator[List[tuple]]:
+    """
+    Yield the rows of `table` in chunks of at most `chunk_size`.
+    PostgreSQL uses a server-side (named) cursor, so memory stays bounded by
+    one chunk regardless of table size.
+    """
+    columns, order_by = EXPORT_TABLES[table]
+    # Rentals are exported with their archived history
+    source = f"{rental_source(include_history=True)} rentals" if table == "rentals" else table
+    where = " WHERE deleted_at IS NULL" if table in SOFT_DELETE_TABLES else ""
+    query = f"SELECT {', '.join(columns)} FROM {source}{where} ORDER BY {order_by}"
+
+    conn = open_connection(backend)
+    try:
+        if backend == "postgres":
+            cursor = conn.cursor(name=f"export_{table}")
+            cursor.itersize = chunk_size
+        else:
+            cursor = conn.cursor()
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [_normalize_row(columns, row) for row in rows]
+    finally:
+        conn.close()
+
+
+def _normalize_row(columns: List[str], row: tuple) -> tuple:
+    """SQLite stores timestamps as ISO text and booleans as 0/1"""
+    values = list(row)
+    for index, column in enumerate(columns):
+        value = values[index]
+        if column in DATETIME_COLUMNS and isinstance(value, str):
+            values[index] = datetime.fromisoformat(value)
+        elif column in BOOLEAN_COLUMNS and value is not None:
+            values[index] = bool(value)
+    return tuple(values)
+
+
+def _month(row: tuple) -> str:
+    rental_date = row[EXPORT_TABLES["rentals"][0].index("rental_date")]
+    return rental_date.strftime("%Y-%m")
+
+
+def resolve_format(fmt: str) -> str:
+    """'auto' picks Parquet when pyarrow is installed, compact CSV otherwise"""
+    if fmt == "auto":
+        try:
+            import pyarrow  # noqa: F401
+            return "parquet"
+        except ImportError:
+            return "csv"
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow); use --format csv")
+    elif fmt != "csv":
+        raise ValueError(f"Unknown export format: {fmt}")
+    return fmt
+
+
+class _PartWriter:
+    """Writes one output file chunk by chunk"""
+
+    def __init__(self, path: str, columns: List[str], fmt: str):
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, _arrow_schema(columns), compression="zstd")
+        else:
+            self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        if self.fmt == "parquet":
+            import pyarrow as pa
+
+            arrays = [list(column) for column in zip(*rows)]
+            self._writer.write_batch(pa.record_batch(arrays, schema=_arrow_schema(self.columns)))
+        else:
+            self._writer.writerows(rows)
+
+    def close(self):
+        if self.fmt == "parquet":
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+def _arrow_schema(columns: List[str]):
+    import pyarrow as pa
+
+    types = {
+        "id": pa.int64(), "user_id": pa.int64(), "book_id": pa.int64(),
+        "year": pa.int32(), "quantity": pa.int32(),
+        "rental_date": pa.timestamp("us"), "due_date": pa.timestamp("us"),
+        "return_date": pa.timestamp("us"), "is_returned": pa.bool_(),
+    }
+    return pa.schema([(column, types.get(column, pa.string())) for column in columns])
+
+
+def export_table(backend: str, table: str, out_dir: str, fmt: str = "auto",
+                 chunk_size: int = 5000) -> List[str]:
+    """
+    Export one table to `out_dir/<table>/`. Rentals are partitioned by the
+    month of rental_date (`rentals/month=YYYY-MM/`). Returns written files.
+    """
+    fmt = resolve_format(fmt)
+    extension = "parquet" if fmt == "parquet" else "csv.gz"
+    columns = EXPORT_TABLES[table][0]
+    files = []
+    writer: Optional[_PartWriter] = None
+    partition = None
+
+    try:
+        for chunk in iter_row_chunks(backend, table, chunk_size):
+            if table != "rentals":
+                if writer is None:
+                    writer = _PartWriter(os.path.join(out_dir, table, f"part-0.{extension}"), columns, fmt)
+                    files.append(writer.path)
+                writer.write(chunk)
+                continue
+
+            # Chunks are ordered by rental_date, so split each chunk at month boundaries
+            start = 0
+            for index in range(1, len(chunk) + 1):
+                if index < len(chunk) and _month(chunk[index]) == _month(chunk[start]):
+                    continue
+                month = _month(chunk[start])
+                if month != partition:
+                    if writer is not None:
+                        writer.close()
+                    partition = month
+                    path = os.path.join(out_dir, table, f"month={month}", f"part-0.{extension}")
+                    writer = _PartWriter(path, columns, fmt)
+                    files.append(path)
+                writer.write(chunk[start:index])
+                start = index
+    finally:
+        if writer is not None:
+            writer.close()
+    return files
+
+
+def stream_csv(backend: str, table: str, chunk_size: int = 5000) -> Iterator[bytes]:
+    """CSV body for a streaming response, encoded one chunk at a time"""
+    columns = EXPORT_TABLES[table][0]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in iter_row_chunks(backend, table, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,249 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from src.utils.broker import broker
+from src.utils.db_backends import PLACEHOLDERS
+from src.utils.rollups import record_rollup
+from src.utils.snapshots import SNAPSHOT_COLUMNS, SNAPSHOT_VALUES
+
+# Hold lifecycle: waiting -> fulfilled (a returned copy was rented to the
+# holder) or cancelled. Waiting holds of a book are served in FIFO order.
+FINAL_STATUSES = ("fulfilled", "cancelled")
+
+
+def _fetch_dict(cursor) -> Optional[Dict[str, Any]]:
+    """fetchone() as a dict for plain, RealDict and sqlite3.Row cursors"""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    if isinstance(row, tuple):
+        return dict(zip([column[0] for column in cursor.description], row))
+    return dict(row)
+
+
+def _timestamp(value: datetime, backend: str):
+    return value.isoformat() if backend == "sqlite" else value
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def hold_topic(hold_id: int) -> str:
+    return f"hold:{hold_id}"
+
+
+def publish_hold(hold: Dict[str, Any]):
+    """Wake long-polls and event streams waiting on this hold (call after commit)"""
+    broker.publish(hold_topic(hold["hold_id"]), dict(hold, type="hold"))
+
+
+def place_hold(cursor, backend: str, user_id: int, book_id: int, days_to_return: int) -> Dict[str, Any]:
+    """Queue `user_id` for the next returned copy of `book_id`"""
+    p = PLACEHOLDERS[backend]
+    cursor.execute(f"SELECT id FROM users WHERE id = {p} AND deleted_at IS NULL", (user_id,))
+    if _fetch_dict(cursor) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Lock the book row so a concurrent return either sees this hold or
+    # commits its quantity + 1 before the availability check below.
+    lock = " FOR UPDATE" if backend == "postgres" else ""
+    cursor.execute(f"SELECT id, quantity FROM books WHERE id = {p} AND deleted_at IS NULL{lock}", (book_id,))
+    book = _fetch_dict(cursor)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    if book["quantity"] > 0:
+        raise HTTPException(status_code=400, detail="Book is available; rent it instead")
+
+    active = "false" if backend == "postgres" else "0"
+    cursor.execute(f"""
+        SELECT id FROM rentals WHERE user_id = {p} AND book_id = {p} AND is_returned = {active}
+    """, (user_id, book_id))
+    if _fetch_dict(cursor) is not None:
+        raise HTTPException(status_code=400, detail="User already has this book rented")
+    cursor.execute(f"""
+        SELECT id FROM holds WHERE user_id = {p} AND book_id = {p} AND status = 'waiting'
+    """, (user_id, book_id))
+    if _fetch_dict(cursor) is not None:
+        raise HTTPException(status_code=400, detail="User already has a hold on this book")
+
+    created_at = datetime.now()
+    returning = " RETURNING id" if backend == "postgres" else ""
+    cursor.execute(f"""
+        INSERT INTO holds (user_id, book_id, days_to_return, status, created_at)
+        VALUES ({p}, {p}, {p}, 'waiting', {p}){returning}
+    """, (user_id, book_id, days_to_return, _timestamp(created_at, backend)))
+    hold_id = _fetch_dict(cursor)["id"] if backend == "postgres" else cursor.lastrowid
+    return get_hold(cursor, backend, hold_id)
+
+
+def get_hold(cursor, backend: str, hold_id: int) -> Dict[str, Any]:
+    """Hold status with its 1-based position in the book's queue while waiting"""
+    p = PLACEHOLDERS[backend]
+    cursor.execute(f"""
+        SELECT h.id, h.user_id, h.book_id, h.days_to_return, h.status, h.created_at,
+               h.fulfilled_at, h.rental_id,
+               (SELECT COUNT(*) FROM holds q
+                WHERE q.book_id = h.book_id AND q.status = 'waiting'
+                  AND (q.created_at < h.created_at OR (q.created_at = h.created_at AND q.id <= h.id))) AS position
+        FROM holds h
+        WHERE h.id = {p}
+    """, (hold_id,))
+    hold = _fetch_dict(cursor)
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return {
+        "hold_id": hold["id"],
+        "user_id": hold["user_id"],
+        "book_id": hold["book_id"],
+        "days_to_return": hold["days_to_return"],
+        "status": hold["status"],
+        "position": hold["position"] if hold["status"] == "waiting" else None,
+        "created_at": _isoformat(hold["created_at"]),
+        "fulfilled_at": _isoformat(hold["fulfilled_at"]),
+        "rental_id": hold["rental_id"],
+    }
+
+
+def cancel_hold(cursor, backend: str, hold_id: int) -> Dict[str, Any]:
+    p = PLACEHOLDERS[backend]
+    cursor.execute(f"UPDATE holds SET status = 'cancelled' WHERE id = {p} AND status = 'waiting'", (hold_id,))
+    if cursor.rowcount == 0:
+        hold = get_hold(cursor, backend, hold_id)
+        raise HTTPException(status_code=400, detail=f"Hold is already {hold['status']}")
+    return get_hold(cursor, backend, hold_id)
+
+
+def cancel_holds_of(cursor, backend: str, column: str, owner_id: int) -> List[Dict[str, Any]]:
+    """
+    Cancel the waiting holds of a user (`column` "user_id") or book
+    ("book_id") being deleted, in the caller's transaction. Publish the
+    returned holds after commit.
+    """
+    p = PLACEHOLDERS[backend]
+    where = f"{column} = {p} AND status = 'waiting'"
+    if backend == "postgres":
+        cursor.execute(f"UPDATE holds SET status = 'cancelled' WHERE {where} RETURNING id", (owner_id,))
+        hold_ids = [row["id"] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+    else:
+        # Under the write lock the caller's UPDATE of the user/book already holds
+        cursor.execute(f"SELECT id FROM holds WHERE {where}", (owner_id,))
+        hold_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"UPDATE holds SET status = 'cancelled' WHERE {where}", (owner_id,))
+    return [{"hold_id": hold_id, "status": "cancelled"} for hold_id in hold_ids]
+
+
+def hand_off(cursor, backend: str, book_id: int, now: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Give a just-returned copy of `book_id` to the oldest waiting hold by
+    renting it to the holder in the caller's transaction. Returns the
+    fulfilled hold, or None when nobody is waiting (the caller then puts the
+    copy back on the shelf with quantity + 1).
+
+    On PostgreSQL the book row is locked first (see `place_hold`) and the
+    queue head is taken with SKIP LOCKED, so concurrent returns of the same
+    book serve different holders. Holds of deleted users are skipped, and one
+    whose user is deleted meanwhile is cancelled.
+    """
+    p = PLACEHOLDERS[backend]
+    if backend == "postgres":
+        cursor.execute(f"SELECT id FROM books WHERE id = {p} FOR UPDATE", (book_id,))
+    active = "false" if backend == "postgres" else "0"
+    skip_locked = " FOR UPDATE SKIP LOCKED" if backend == "postgres" else ""
+    returning = " RETURNING id" if backend == "postgres" else ""
+    while True:
+        # Holders who meanwhile rented the book another way keep their place
+        cursor.execute(f"""
+            SELECT h.id, h.user_id, h.days_to_return
+            FROM holds h
+            WHERE h.book_id = {p} AND h.status = 'waiting'
+              AND EXISTS (SELECT 1 FROM users u WHERE u.id = h.user_id AND u.deleted_at IS NULL)
+              AND NOT EXISTS (
+                  SELECT 1 FROM rentals r
+                  WHERE r.user_id = h.user_id AND r.book_id = h.book_id AND r.is_returned = {active}
+              )
+            ORDER BY h.created_at, h.id
+            LIMIT 1{skip_locked}
+        """, (book_id,))
+        hold = _fetch_dict(cursor)
+        if hold is None:
+            return None
+
+        due_date = now + timedelta(days=hold["days_to_return"])
+        cursor.execute(f"""
+            INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned, {SNAPSHOT_COLUMNS})
+            SELECT u.id, b.id, {p}, {p}, {active}, {SNAPSHOT_VALUES}
+            FROM users u, books b
+            WHERE u.id = {p} AND b.id = {p} AND u.deleted_at IS NULL{returning}
+        """, (_timestamp(now, backend), _timestamp(due_date, backend), hold["user_id"], book_id))
+        if cursor.rowcount == 1:
+            break
+        cursor.execute(f"UPDATE holds SET status = 'cancelled' WHERE id = {p}", (hold["id"],))
+    rental_id = _fetch_dict(cursor)["id"] if backend == "postgres" else cursor.lastrowid
+    cursor.execute(f"""
+        UPDATE holds SET status = 'fulfilled', fulfilled_at = {p}, rental_id = {p} WHERE id = {p}
+    """, (_timestamp(now, backend), rental_id, hold["id"]))
+    record_rollup(cursor, "rent", now, backend)
+    return {
+        "hold_id": hold["id"],
+        "user_id": hold["user_id"],
+        "book_id": book_id,
+        "status": "fulfilled",
+        "rental_id": rental_id,
+        "fulfilled_at": now.isoformat(),
+        "due_date": due_date.isoformat(),
+    }
+
+
+async def wait_for_hold(load: Callable[[], Dict[str, Any]], hold_id: int, timeout: float,
+                        heartbeat: float) -> Dict[str, Any]:
+    """
+    Long-poll: return as soon as the hold leaves "waiting", or its current
+    state after `timeout` seconds. `load` reads the hold from the database.
+    Hand-offs made by other workers are not published here: the hold is
+    re-read at least every `heartbeat` seconds to see them.
+    """
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + timeout
+    with broker.subscribe([hold_topic(hold_id)]) as subscription:
+        # Subscribed before reading, so a hand-off in between is not missed
+        hold = await run_in_threadpool(load)
+        while hold["status"] not in FINAL_STATUSES:
+            remaining = expires_at - loop.time()
+            if remaining <= 0:
+                break
+            await subscription.get(min(heartbeat, remaining))
+            hold = await run_in_threadpool(load)
+        return hold
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def hold_event_stream(load: Callable[[], Dict[str, Any]], hold_id: int, heartbeat: float,
+                            is_disconnected: Callable) -> AsyncIterator[str]:
+    """
+    Server-sent events: the current hold, then every change until it is
+    final. The hold is re-read on every heartbeat as well, for the changes
+    other workers make.
+    """
+    with broker.subscribe([hold_topic(hold_id)]) as subscription:
+        hold = await run_in_threadpool(load)
+        yield _sse("hold", hold)
+        while hold["status"] not in FINAL_STATUSES:
+            event = await subscription.get(heartbeat)
+            if await is_disconnected():
+                return
+            current = await run_in_threadpool(load)
+            if event is None and current == hold:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            hold = current
+            yield _sse("hold", hold)
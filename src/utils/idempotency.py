@@ -0,0 +1,113 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from settings import IDEMPOTENCY_TTL_HOURS
+
+# Retried POSTs carrying the same Idempotency-Key get the stored response of
+# the first attempt. The key row is inserted in the request's own transaction
+# and the response written just before commit, so a key is either unused or
+# answered: a concurrent retry blocks on the key's unique index until the
+# first attempt commits (then replays it) or rolls back (then runs itself).
+# Failed attempts (4xx/5xx) are not stored and may be retried.
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def fingerprint(route: str, payload: Any) -> str:
+    """Digest of what a request asks for; a key may only be reused for the same request"""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{route}\n{body}".encode()).hexdigest()
+
+
+def claim_key(cursor, key: str, route: str, request_fingerprint: str) -> Optional[JSONResponse]:
+    """
+    Reserve `key` for this request in the cursor's transaction.
+    Returns None when the caller should do the work (then `remember_response`
+    before commit), otherwise the response to send as is: the stored one when
+    the key was already answered, or 422 when it was used for a different
+    request.
+    """
+    now = datetime.now()
+    # An expired row is taken over as if the key were new
+    cursor.execute("""
+        INSERT INTO idempotency_keys (key, route, fingerprint, created_at, expires_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (key, route) DO UPDATE
+        SET fingerprint = excluded.fingerprint, status_code = NULL, response = NULL,
+            created_at = excluded.created_at, expires_at = excluded.expires_at
+        WHERE idempotency_keys.expires_at < excluded.created_at
+        RETURNING key
+    """, (key, route, request_fingerprint, now, now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)))
+    if cursor.fetchone() is not None:
+        return None
+
+    cursor.execute("""
+        SELECT fingerprint, status_code, response FROM idempotency_keys WHERE key = %s AND route = %s
+    """, (key, route))
+    stored = _as_tuple(cursor.fetchone())
+    if stored[0] != request_fingerprint:
+        return JSONResponse(
+            status_code=422, content={"detail": "Idempotency-Key was already used for a different request"}
+        )
+    return JSONResponse(status_code=stored[1], content=json.loads(stored[2]), headers={"Idempotent-Replayed": "true"})
+
+
+def remember_response(cursor, key: str, route: str, content: Any, status_code: int = 200):
+    """Store the response of a claimed key; call in the same transaction, before commit"""
+    cursor.execute("""
+        UPDATE idempotency_keys SET status_code = %s, response = %s WHERE key = %s AND route = %s
+    """, (status_code, json.dumps(jsonable_encoder(content), separators=(",", ":")), key, route))
+
+
+def run_idempotent(connect: Callable, key: Optional[str], route: str, request_fingerprint: str,
+                   handler: Callable[[], Tuple[int, Any]]):
+    """
+    For handlers that do not run a transaction of their own (write-behind):
+    claim the key on a fresh connection, run `handler` -> (status_code, content)
+    and store its response in one transaction.
+    """
+    if key is None:
+        status_code, content = handler()
+        return JSONResponse(status_code=status_code, content=content)
+
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        replay = claim_key(cursor, key, route, request_fingerprint)
+        if replay is not None:
+            conn.rollback()
+            return replay
+        status_code, content = handler()
+        remember_response(cursor, key, route, content, status_code)
+        conn.commit()
+        return JSONResponse(status_code=status_code, content=content)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def purge_expired_keys(cursor, batch_size: int = 10000) -> int:
+    """Delete expired keys in batches; returns the number of rows deleted"""
+    deleted = 0
+    while True:
+        cursor.execute("""
+            DELETE FROM idempotency_keys
+            WHERE ctid IN (SELECT ctid FROM idempotency_keys WHERE expires_at < %s LIMIT %s)
+        """, (datetime.now(), batch_size))
+        batch_deleted = cursor.rowcount
+        cursor.connection.commit()
+        deleted += batch_deleted
+        if batch_deleted < batch_size:
+            return deleted
+
+
+def _as_tuple(row) -> Tuple:
+    if isinstance(row, dict):
+        return row["fingerprint"], row["status_code"], row["response"]
+    return tuple(row)
@@ -0,0 +1,115 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """
+    Opaque keyset cursor pointing just after (sort_value, row_id).
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+    """
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return sort_value, int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Rental history of one book or user: the column the rentals are filtered on,
+# the table the owner lives in, and the other side of each rental shown inline
+_HISTORY_OWNERS = {
+    "book": ("book_id", "books", "users u ON r.user_id = u.id", "user", ("full_name", "email")),
+    "user": ("user_id", "users", "books b ON r.book_id = b.id", "book", ("title", "author")),
+}
+_STATUS_FILTERS = {
+    "postgres": {
+        "active": "AND r.is_returned = false",
+        "returned": "AND r.is_returned = true",
+        "overdue": "AND r.is_returned = false AND r.due_date < NOW()",
+    },
+    "sqlite": {
+        "active": "AND r.is_returned = 0",
+        "returned": "AND r.is_returned = 1",
+        "overdue": "AND r.is_returned = 0 AND date(r.due_date) < date('now')",
+    },
+}
+
+
+def _iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def rental_history_page(db_cursor, backend: str, owner: str, owner_id: int, status: Optional[str],
+                        cursor: Optional[str], limit: int, include_history: bool) -> Dict[str, Any]:
+    """
+    One page of a book's or user's rentals, newest first, as
+    {"items", "next_cursor"}. `owner` is "book" or "user"; 404 when it
+    does not exist (or is deleted) and has no rentals to show.
+    """
+    from src.utils.archive import rental_source
+    from src.utils.db_backends import PLACEHOLDERS
+
+    p = PLACEHOLDERS[backend]
+    column, owner_table, join, other, other_fields = _HISTORY_OWNERS[owner]
+    alias = join.split()[1]
+    params: List[Any] = [owner_id]
+    after_clause = ""
+    if cursor:
+        after_clause = f"AND (r.rental_date, r.id) < ({p}, {p})"
+        params.extend(decode_cursor(cursor))
+    params.append(limit + 1)
+
+    # Served by the (owner, rental_date, id) index: no sort, no scan of other
+    # owners (with history, merged with the same index of rentals_archive)
+    db_cursor.execute(f"""
+        SELECT
+            r.id, r.user_id, r.book_id,
+            r.rental_date, r.due_date, r.return_date, r.is_returned,
+            {", ".join(f"{alias}.{field}" for field in other_fields)}
+        FROM {rental_source(include_history)} r
+        JOIN {join}
+        WHERE r.{column} = {p} {_STATUS_FILTERS[backend].get(status, "")} {after_clause}
+        ORDER BY r.rental_date DESC, r.id DESC
+        LIMIT {p}
+    """, params)
+    rentals = db_cursor.fetchall()
+
+    if not rentals:
+        db_cursor.execute(f"SELECT id FROM {owner_table} WHERE id = {p} AND deleted_at IS NULL", (owner_id,))
+        if not db_cursor.fetchone():
+            raise HTTPException(status_code=404, detail=f"{owner.capitalize()} not found")
+
+    next_cursor = None
+    if len(rentals) > limit:
+        rentals = rentals[:limit]
+        next_cursor = encode_cursor(rentals[-1]["rental_date"], rentals[-1]["id"])
+
+    items = [
+        {
+            "id": rental["id"],
+            "user_id": rental["user_id"],
+            "book_id": rental["book_id"],
+            "rental_date": _iso(rental["rental_date"]),
+            "due_date": _iso(rental["due_date"]),
+            "return_date": _iso(rental["return_date"]),
+            "is_returned": bool(rental["is_returned"]),
+            other: {field: rental[field] for field in other_fields},
+        }
+        for rental in rentals
+    ]
+    return {"items": items, "next_cursor": next_cursor}
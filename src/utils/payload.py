@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Optional, Union
+
+from fastapi import HTTPException
+
+# Nested objects of rental rows and the row key holding their id
+RENTAL_REFERENCES = {"user": "user_id", "book": "book_id"}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """`?fields=id,title,user.full_name` -> ["id", "title", "user.full_name"]"""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+def _project(item: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keep `fields` of `item`; "parent.child" selects inside a nested object"""
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        name, _, child = field.partition(".")
+        if name not in item:
+            continue
+        if child:
+            nested = item[name]
+            if isinstance(nested, dict) and child in nested:
+                projected.setdefault(name, {})[child] = nested[child]
+        else:
+            projected[name] = item[name]
+    return projected
+
+
+def _check_fields(sample: Dict[str, Any], fields: List[str]):
+    available = set()
+    for name, value in sample.items():
+        available.add(name)
+        if isinstance(value, dict):
+            available.update(f"{name}.{child}" for child in value)
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(sorted(available))}"
+        )
+
+
+def shape_list(
+    items: List[Dict[str, Any]],
+    fields: Optional[str] = None,
+    shape: str = "nested",
+    references: Optional[Dict[str, str]] = None,
+) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Apply `?fields=` and `?shape=` to a list endpoint's rows.
+
+    "nested" keeps one object per row. "normalized" replaces each referenced
+    object (e.g. `user`) by its id and lists every distinct one once:
+    {"items": [...], "users": {"<id>": {...}}, "books": {...}}.
+    """
+    selected = parse_fields(fields)
+    if selected and items:
+        _check_fields(items[0], selected)
+
+    if shape != "normalized" or not references:
+        if not selected:
+            return items
+        return [_project(item, selected) for item in items]
+
+    # Side tables for the references that were asked for (all of them by default)
+    children: Dict[str, List[str]] = {}
+    for name in references:
+        if not selected or name in selected:
+            children[name] = []
+        elif any(field.startswith(f"{name}.") for field in selected):
+            children[name] = [field.partition(".")[2] for field in selected if field.startswith(f"{name}.")]
+    tables: Dict[str, Dict[str, Any]] = {f"{name}s": {} for name in children}
+
+    rows = []
+    for item in items:
+        row = dict(item)
+        for name in references:
+            nested = row.pop(name, None)
+            if nested is None or name not in children:
+                continue
+            table = tables[f"{name}s"]
+            key = str(row[references[name]])
+            if key not in table:
+                wanted = children[name]
+                table[key] = {child: nested[child] for child in wanted if child in nested} if wanted else nested
+        if selected:
+            # Ids are always kept: they link rows to the side tables
+            row = _project(row, [field for field in selected if "." not in field and field not in references]
+                           + [id_key for id_key in references.values() if id_key not in selected])
+        rows.append(row)
+    return {"items": rows, **tables}
@@ -0,0 +1,196 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extensions import make_dsn, parse_dsn
+from fastapi import HTTPException
+
+from settings import (
+    POSTGRES_PRIMARY_DSN,
+    POSTGRES_REPLICA_DSNS,
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS,
+    REPLICA_MAX_LAG_SECONDS,
+    READ_YOUR_WRITES_SECONDS,
+)
+from src.middleware.request_context import get_client_key
+from src.utils.deadlines import current_deadline
+from src.utils.query_stats import timed_cursor_class
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (any cursor_factory) count their queries, see utils.query_stats"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=timed_cursor_class(base), **kwargs)
+
+
+def connect_postgres(dsn: str):
+    """
+    Open a connection; inside a request its statements are bounded by the
+    time left before the request's deadline and cancelled with it
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return psycopg2.connect(dsn, connection_factory=InstrumentedConnection)
+    # Sent with the startup packet: no extra round trip per connection
+    timeout_ms = max(1, int(deadline.remaining() * 1000))
+    options = f"{parse_dsn(dsn).get('options', '')} -c statement_timeout={timeout_ms}".strip()
+    conn = psycopg2.connect(make_dsn(dsn, options=options), connection_factory=InstrumentedConnection)
+    deadline.track(conn.cancel)
+    return conn
+
+
+def postgres_replica_lag(conn) -> float:
+    """Replication lag of a PostgreSQL standby in seconds (0 on a primary)"""
+    cursor = conn.cursor()
+    cursor.execute(REPLICA_LAG_SQL)
+    lag = float(cursor.fetchone()[0])
+    conn.rollback()
+    return lag
+
+
+class _Replica:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.down_until = 0.0
+        self.lag = 0.0
+        self.lag_checked_at = 0.0
+
+
+class ReplicaRouter:
+    """
+    Route connections between a primary and read replicas.
+
+    Writes always go to the primary. Reads are spread round-robin over the
+    replicas, skipping replicas that are unreachable or lag more than
+    `max_lag` seconds; if no replica qualifies the primary serves the read.
+    A client that opened a write connection reads from the primary for the
+    next `sticky_seconds` so it always sees its own writes.
+    """
+
+    def __init__(
+        self,
+        primary_dsn: str,
+        replica_dsns: List[str],
+        max_lag: float = REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = REPLICA_LAG_CHECK_INTERVAL_SECONDS,
+        sticky_seconds: float = READ_YOUR_WRITES_SECONDS,
+        connect: Callable = connect_postgres,
+        lag_probe: Callable = postgres_replica_lag,
+    ):
+        self.primary_dsn = primary_dsn
+        self.replicas = [_Replica(dsn) for dsn in replica_dsns]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self._connect = connect
+        self._lag_probe = lag_probe
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        # Oldest write first, so expired windows are dropped from the front
+        self._last_write: "OrderedDict[str, float]" = OrderedDict()
+
+    def prefers_primary(self, client_key: Optional[str] = None) -> bool:
+        """True while the client is inside its read-your-writes window"""
+        client_key = client_key or get_client_key()
+        if not self.replicas or client_key is None:
+            return False
+        with self._lock:
+            last_write = self._last_write.get(client_key)
+            if last_write is None:
+                return False
+            if time.monotonic() - last_write < self.sticky_seconds:
+                return True
+            del self._last_write[client_key]
+            return False
+
+    def record_write(self, client_key: Optional[str] = None):
+        client_key = client_key or get_client_key()
+        if self.replicas and client_key is not None:
+            now = time.monotonic()
+            with self._lock:
+                self._last_write[client_key] = now
+                self._last_write.move_to_end(client_key)
+                # Clients that wrote once and never read again would stay forever
+                while True:
+                    oldest_key, oldest = next(iter(self._last_write.items()))
+                    if now - oldest < self.sticky_seconds:
+                        break
+                    del self._last_write[oldest_key]
+
+    def connect_primary(self):
+        """Primary connection for background work (no client stickiness)"""
+        return self._connect(self.primary_dsn)
+
+    def connect(self, read_only: bool = False):
+        if not read_only:
+            self.record_write()
+            return self._connect(self.primary_dsn)
+
+        if self.replicas and not self.prefers_primary():
+            start = next(self._next)
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(start + offset) % len(self.replicas)]
+                conn = self._connect_replica(replica)
+                if conn is not None:
+                    return conn
+
+        return self._connect(self.primary_dsn)
+
+    def _connect_replica(self, replica: _Replica):
+        now = time.monotonic()
+        if replica.down_until > now:
+            return None
+        if now - replica.lag_checked_at < self.check_interval and replica.lag > self.max_lag:
+            return None
+
+        try:
+            conn = self._connect(replica.dsn)
+        except Exception:
+            replica.down_until = now + self.check_interval
+            return None
+
+        if now - replica.lag_checked_at >= self.check_interval:
+            try:
+                replica.lag = self._lag_probe(conn)
+            except Exception:
+                conn.close()
+                replica.down_until = now + self.check_interval
+                return None
+            replica.lag_checked_at = now
+            if replica.lag > self.max_lag:
+                conn.close()
+                return None
+
+        return conn
+
+
+replica_router = ReplicaRouter(POSTGRES_PRIMARY_DSN, POSTGRES_REPLICA_DSNS)
+
+
+def prefers_primary() -> bool:
+    return replica_router.prefers_primary()
+
+
+def get_postgres_connection(read_only: bool = False):
+    """
+    Get PostgreSQL database connection.
+    Read-only handlers pass `read_only=True` to be served by a replica.
+    """
+    try:
+        return replica_router.connect(read_only=read_only)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
@@ -0,0 +1,203 @@
+import inspect
+import linecache
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import fastapi.routing
+
+# On-demand sampling profiler for a live worker (POST /metrics/profile,
+# `python cli.py profile`). A thread snapshots every other thread's stack
+# each interval and charges it:
+#   - wall mode: the time elapsed since the previous snapshot;
+#   - cpu mode: the CPU time the thread used since then (threads that only
+#     wait are charged nothing).
+# Each sample is attributed to the route being served (by the endpoint on
+# the stack, or the request FastAPI is validating/serializing) and to a
+# category: db, validation, serialization or app. Weights are microseconds,
+# so the collapsed output feeds flamegraph.pl, speedscope or inferno as is.
+MODES = ("wall", "cpu")
+CATEGORIES = ("db", "validation", "serialization", "app")
+NO_ROUTE = "(no request)"
+
+# Matched against the path of a frame's file
+_CATEGORY_PATHS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("db", (f"{os.sep}psycopg2{os.sep}", f"{os.sep}sqlite3{os.sep}", f"{os.sep}sqlalchemy{os.sep}")),
+    ("validation", (f"{os.sep}pydantic{os.sep}", f"fastapi{os.sep}dependencies{os.sep}", f"fastapi{os.sep}_compat")),
+    ("serialization", (f"fastapi{os.sep}encoders.py", f"{os.sep}json{os.sep}", f"starlette{os.sep}responses.py")),
+]
+# FastAPI request handler steps that call straight into pydantic-core
+_CATEGORY_FUNCTIONS = {
+    "serialize_response": "serialization",
+    "request_body_to_args": "validation",
+    "solve_dependencies": "validation",
+}
+# Driver calls are C functions and never show up as frames: a frame whose
+# current line makes one of these calls is waiting on the database
+_DB_CALL = re.compile(r"\.(execute|executemany|fetchone|fetchall|fetchmany|commit|rollback|copy_expert)\(|connect\(")
+_FASTAPI_ROUTING = fastapi.routing.__file__
+
+# One profile at a time per worker
+profile_lock = threading.Lock()
+
+
+def _walk_routes(routes: Iterable, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+    for route in routes:
+        # Newer FastAPI keeps included routers as nodes of the route tree
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            context = getattr(route, "include_context", None)
+            yield from _walk_routes(included.routes, prefix + getattr(context, "prefix", ""))
+        else:
+            yield prefix, route
+
+
+class RouteIndex:
+    """Endpoint functions (and their code) of an app, by "METHOD path" """
+
+    def __init__(self, routes: Iterable):
+        self.by_code: Dict[Any, str] = {}
+        self.by_endpoint: Dict[int, str] = {}
+        for prefix, route in _walk_routes(routes):
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is None or not getattr(route, "methods", None):
+                continue
+            name = f"{','.join(sorted(route.methods))} {prefix}{route.path}"
+            self.by_endpoint[id(endpoint)] = name
+            # Decorated endpoints (e.g. @coalesced) share the wrapper's code
+            code = getattr(inspect.unwrap(endpoint), "__code__", None)
+            if code is not None:
+                self.by_code[code] = name
+
+    def route_of(self, frames: List[Any]) -> str:
+        for frame in frames:
+            route = self.by_code.get(frame.f_code)
+            if route is not None:
+                return route
+            # Request validation, response serialization and sending run in
+            # FastAPI's request handling, outside the endpoint: read the
+            # endpoint Starlette matched from the ASGI scope
+            code = frame.f_code
+            if code.co_filename == _FASTAPI_ROUTING and ("scope" in code.co_varnames or "request" in code.co_varnames):
+                local = frame.f_locals
+                scope = local.get("scope") or getattr(local.get("request"), "scope", None)
+                if isinstance(scope, dict) and "endpoint" in scope:
+                    return self.by_endpoint.get(id(scope["endpoint"]), NO_ROUTE)
+        return NO_ROUTE
+
+
+def _category(frames: List[Any]) -> str:
+    """`frames` innermost first"""
+    for frame in frames:
+        filename = frame.f_code.co_filename
+        for category, paths in _CATEGORY_PATHS:
+            if any(path in filename for path in paths):
+                return category
+        if frame.f_code.co_name in _CATEGORY_FUNCTIONS and filename.startswith(os.path.dirname(_FASTAPI_ROUTING)):
+            return _CATEGORY_FUNCTIONS[frame.f_code.co_name]
+    innermost = frames[0]
+    if _DB_CALL.search(linecache.getline(innermost.f_code.co_filename, innermost.f_lineno or 0)):
+        return "db"
+    return "app"
+
+
+def _label(frame, root: str) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    else:
+        filename = os.sep.join(filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _thread_cpu_time(ident: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+class Profile:
+    def __init__(self, mode: str, interval: float):
+        self.mode = mode
+        self.interval = interval
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.routes: Dict[str, Counter] = defaultdict(Counter)
+
+    def add(self, route: str, category: str, stack: Tuple[str, ...], weight_us: int):
+        self.samples += 1
+        self.stacks[(route, category) + stack] += weight_us
+        self.routes[route][category] += weight_us
+
+    def collapsed(self) -> str:
+        """One "frame;frame;... weight" line per stack, route and category first"""
+        return "".join(f"{';'.join(stack)} {weight}\n" for stack, weight in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        routes = {}
+        for route, by_category in sorted(self.routes.items(), key=lambda item: -sum(item[1].values())):
+            routes[route] = {
+                "seconds": round(sum(by_category.values()) / 1e6, 6),
+                **{category: round(by_category[category] / 1e6, 6) for category in CATEGORIES},
+            }
+        return {
+            "mode": self.mode,
+            "duration_seconds": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "routes": routes,
+        }
+
+
+def sample(seconds: float, interval: float, mode: str, routes: RouteIndex,
+           include_idle: bool = False) -> Profile:
+    """
+    Sample every other thread for `seconds`, blocking the calling thread.
+    Samples outside any request are dropped unless `include_idle`.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if mode == "cpu" and _thread_cpu_time(threading.get_ident()) is None:
+        raise ValueError("Per-thread CPU clocks are not available on this platform")
+
+    profile = Profile(mode, interval)
+    root = os.getcwd()
+    own = threading.get_ident()
+    cpu_seen: Dict[int, float] = {}
+    started = last = time.monotonic()
+    deadline = started + seconds
+    while last < deadline:
+        time.sleep(interval)
+        now = time.monotonic()
+        elapsed, last = now - last, now
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if mode == "cpu":
+                cpu = _thread_cpu_time(ident)
+                if cpu is None:
+                    continue
+                weight, cpu_seen[ident] = cpu - cpu_seen.get(ident, cpu), cpu
+            else:
+                weight = elapsed
+            if weight <= 0:
+                continue
+
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            route = routes.route_of(frames)
+            if route == NO_ROUTE and not include_idle:
+                continue
+            stack = tuple(_label(frame, root) for frame in reversed(frames))
+            profile.add(route, _category(frames), stack, int(weight * 1e6))
+    profile.duration = time.monotonic() - started
+    return profile
@@ -0,0 +1,118 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Per-request query counting. QueryBudgetMiddleware binds a QueryStats to
+# each request; the instrumented connections of every database path
+# (sqlite3 and psycopg2 cursors, the SQLAlchemy engine) add each statement
+# and its duration to it. Threadpool handlers share the request's context,
+# so their queries are counted too. Work outside a request is not counted.
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries"'
+
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# Called with (method, path, stats) when a request finishes, see assert_max_queries
+_observers: List[Callable[[str, str, QueryStats], None]] = []
+
+
+def record_query(seconds: float):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+
+
+def request_finished(method: str, path: str, stats: QueryStats):
+    for observer in list(_observers):
+        observer(method, path, stats)
+
+
+_TIMED_METHODS = ("execute", "executemany", "executescript", "copy_expert")
+_timed_classes: Dict[type, type] = {}
+_timed_classes_lock = threading.Lock()
+
+
+def _timed(method: Callable) -> Callable:
+    def timed(self, *args, **kwargs):
+        if current_stats.get() is None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    timed.__name__ = method.__name__
+    return timed
+
+
+def timed_cursor_class(base: type) -> type:
+    """Subclass of DB-API cursor class `base` whose statements are counted"""
+    timed = _timed_classes.get(base)
+    if timed is None:
+        with _timed_classes_lock:
+            timed = _timed_classes.get(base)
+            if timed is None:
+                methods = {name: _timed(getattr(base, name)) for name in _TIMED_METHODS if hasattr(base, name)}
+                timed = type(f"Timed{base.__name__}", (base,), methods)
+                _timed_classes[base] = timed
+    return timed
+
+
+def instrument_sqlalchemy(engine):
+    """Count the statements of a (sync) SQLAlchemy engine; pass `async_engine.sync_engine`"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query(time.perf_counter() - conn.info["query_started"].pop())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, path: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Fail if a request finished inside the block (optionally only requests
+    to `path`) ran more than `max_queries` statements. Yields the list of
+    requests seen, as {"method", "path", "queries", "db_seconds"}.
+
+        with TestClient(app) as client, assert_max_queries(4, "/postgres-rentals/rent"):
+            client.post("/postgres-rentals/rent", json={"user_id": 1, "book_id": 2})
+    """
+    seen: List[Dict[str, Any]] = []
+
+    def observe(method: str, request_path: str, stats: QueryStats):
+        if path is None or request_path == path:
+            seen.append({"method": method, "path": request_path, "queries": stats.count, "db_seconds": stats.seconds})
+
+    _observers.append(observe)
+    try:
+        yield seen
+    finally:
+        _observers.remove(observe)
+    over = [request for request in seen if request["queries"] > max_queries]
+    if over:
+        raise QueryBudgetExceeded(
+            f"Query budget of {max_queries} exceeded: "
+            + ", ".join(f"{request['method']} {request['path']} ran {request['queries']}" for request in over)
+        )
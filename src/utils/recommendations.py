@@ -0,0 +1,288 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.archive import rental_source
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+# "Users who rented this also rented": books are similar when the same users
+# rented both. The sparse co-occurrence matrix is kept in book_cooccurrences
+# (its diagonal holds the number of distinct renters of each book) and the
+# top-K neighbours of every book, by cosine similarity, in book_similarities.
+
+
+def _lock(cursor, backend: str):
+    """Serialize builds/refreshes: a concurrent refresh would count new rentals twice"""
+    if backend == "postgres":
+        cursor.execute("LOCK TABLE recommendation_builds IN EXCLUSIVE MODE")
+    else:
+        cursor.execute("BEGIN IMMEDIATE")
+
+
+def _iter_pairs(conn, backend: str, watermark: int, chunk_size: int) -> Iterator[List[Tuple[int, int]]]:
+    """Distinct (user_id, book_id) of rentals up to `watermark`, ordered by user"""
+    p = PLACEHOLDERS[backend]
+    if backend == "postgres":
+        cursor = conn.cursor(name="recommendation_pairs")
+        cursor.itersize = chunk_size
+    else:
+        cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT DISTINCT user_id, book_id FROM {rental_source(include_history=True)} r
+        WHERE id <= {p}
+        ORDER BY user_id, book_id
+    """, (watermark,))
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+    cursor.close()
+
+
+def _basket_pairs(users: np.ndarray, books: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count every ordered (book, book) pair rented by the same user, diagonal
+    included. `users` must be grouped; keys are encoded as a * width + b.
+    """
+    boundaries = np.flatnonzero(np.diff(users)) + 1
+    starts = np.concatenate(([0], boundaries))
+    sizes = np.diff(np.concatenate((starts, [len(users)])))
+
+    group_of = np.repeat(np.arange(len(starts)), sizes)
+    repeats = sizes[group_of]
+    left = np.repeat(books, repeats)
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = books[np.repeat(starts[group_of], repeats) + offsets]
+    return np.unique(left * width + right, return_counts=True)
+
+
+def _merge(keys: np.ndarray, counts: np.ndarray, new_keys: np.ndarray, new_counts: np.ndarray):
+    merged, inverse = np.unique(np.concatenate((keys, new_keys)), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate((counts, new_counts)), minlength=len(merged))
+    return merged, totals.astype(np.int64)
+
+
+def cooccurrence_matrix(conn, backend: str, watermark: int, width: int,
+                        chunk_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sparse co-occurrence counts over rentals up to `watermark`, built one
+    chunk of users at a time so memory is bounded by the chunk plus the
+    non-zero entries of the matrix.
+    """
+    keys = np.array([], dtype=np.int64)
+    counts = np.array([], dtype=np.int64)
+    carry: List[Tuple[int, int]] = []
+    for rows in _iter_pairs(conn, backend, watermark, chunk_size):
+        rows = carry + rows
+        # The last user may continue in the next chunk
+        last_user = rows[-1][0]
+        split = len(rows)
+        while split > 0 and rows[split - 1][0] == last_user:
+            split -= 1
+        rows, carry = rows[:split], rows[split:]
+        if rows:
+            pairs = np.array(rows, dtype=np.int64)
+            keys, counts = _merge(keys, counts, *_basket_pairs(pairs[:, 0], pairs[:, 1], width))
+    if carry:
+        pairs = np.array(carry, dtype=np.int64)
+        keys, counts = _merge(keys, counts, *_basket_pairs(pairs[:, 0], pairs[:, 1], width))
+    return keys, counts
+
+
+def top_neighbours(book_ids: np.ndarray, other_ids: np.ndarray, co_rentals: np.ndarray,
+                   renters: Dict[int, int], top_k: int) -> List[tuple]:
+    """
+    (book_id, rank, similar_book_id, score, co_rentals) rows: for every book,
+    the `top_k` other books with the highest co_rentals / sqrt(renters(a) * renters(b)).
+    """
+    off_diagonal = book_ids != other_ids
+    book_ids, other_ids, co_rentals = book_ids[off_diagonal], other_ids[off_diagonal], co_rentals[off_diagonal]
+    if len(book_ids) == 0:
+        return []
+
+    known = np.array(sorted(renters), dtype=np.int64)
+    known_counts = np.array([renters[book_id] for book_id in known.tolist()], dtype=np.int64)
+
+    def lookup(values: np.ndarray) -> np.ndarray:
+        positions = np.minimum(np.searchsorted(known, values), len(known) - 1)
+        return np.where(known[positions] == values, known_counts[positions], 0)
+
+    norms = np.sqrt(lookup(book_ids) * lookup(other_ids))
+    scores = np.divide(co_rentals, norms, out=np.zeros(len(co_rentals)), where=norms > 0)
+
+    order = np.lexsort((other_ids, -scores, book_ids))
+    book_ids, other_ids, co_rentals, scores = book_ids[order], other_ids[order], co_rentals[order], scores[order]
+    starts = np.flatnonzero(np.concatenate(([True], book_ids[1:] != book_ids[:-1])))
+    ranks = np.arange(len(book_ids)) - np.repeat(starts, np.diff(np.concatenate((starts, [len(book_ids)]))))
+    keep = ranks < top_k
+    return [
+        (int(book_id), int(rank) + 1, int(other_id), round(float(score), 6), int(count))
+        for book_id, rank, other_id, score, count in zip(
+            book_ids[keep], ranks[keep], other_ids[keep], scores[keep], co_rentals[keep]
+        )
+    ]
+
+
+def _insert_rows(cursor, backend: str, table: str, columns: List[str], rows: List[tuple],
+                 batch_size: int = 5000):
+    if not rows:
+        return
+    if backend == "postgres":
+        from psycopg2.extras import execute_values
+
+        execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows,
+                       page_size=batch_size)
+    else:
+        placeholders = ", ".join("?" for _ in columns)
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+
+def _record_build(cursor, backend: str, watermark: int, mode: str):
+    p = PLACEHOLDERS[backend]
+    built_at = datetime.now()
+    cursor.execute(
+        f"INSERT INTO recommendation_builds (last_rental_id, built_at, mode) VALUES ({p}, {p}, {p})",
+        (watermark, built_at.isoformat() if backend == "sqlite" else built_at, mode)
+    )
+
+
+def _chunks(values: List[int], size: int = 500) -> Iterable[List[int]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def build_similarities(backend: str, top_k: int, chunk_size: int = 50000) -> Dict[str, int]:
+    """Rebuild the co-occurrence matrix and every book's top-K from all rentals"""
+    conn = open_connection(backend, read_only=False)
+    try:
+        cursor = conn.cursor()
+        _lock(cursor, backend)
+        cursor.execute(
+            f"SELECT COALESCE(MAX(id), 0), COALESCE(MAX(book_id), 0) FROM {rental_source(include_history=True)} r"
+        )
+        watermark, max_book_id = cursor.fetchone()
+        width = max_book_id + 1
+
+        keys, counts = cooccurrence_matrix(conn, backend, watermark, width, chunk_size)
+        book_ids, other_ids = np.divmod(keys, width)
+        diagonal = book_ids == other_ids
+        renters = dict(zip(book_ids[diagonal].tolist(), counts[diagonal].tolist()))
+        neighbours = top_neighbours(book_ids, other_ids, counts, renters, top_k)
+
+        cursor.execute("DELETE FROM book_cooccurrences")
+        _insert_rows(cursor, backend, "book_cooccurrences", ["book_id", "other_book_id", "co_rentals"],
+                     list(zip(book_ids.tolist(), other_ids.tolist(), counts.tolist())))
+        cursor.execute("DELETE FROM book_similarities")
+        _insert_rows(cursor, backend, "book_similarities",
+                     ["book_id", "rank", "similar_book_id", "score", "co_rentals"], neighbours)
+        _record_build(cursor, backend, watermark, "full")
+        conn.commit()
+        return {"last_rental_id": watermark, "pairs": len(keys), "books": len(renters),
+                "similarities": len(neighbours)}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def refresh_similarities(backend: str, top_k: int) -> Optional[Dict[str, int]]:
+    """
+    Fold rentals created since the last build into the co-occurrence matrix
+    and recompute the top-K of the books whose counts changed, and of the
+    books co-rented with a book that gained renters.
+    Returns None when there has never been a full build.
+    """
+    p = PLACEHOLDERS[backend]
+    conn = open_connection(backend, read_only=False)
+    try:
+        cursor = conn.cursor()
+        _lock(cursor, backend)
+        cursor.execute("SELECT MAX(last_rental_id) FROM recommendation_builds")
+        watermark = cursor.fetchone()[0]
+        if watermark is None:
+            conn.rollback()
+            return None
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {rental_source(include_history=True)} r")
+        new_watermark = cursor.fetchone()[0]
+
+        cursor.execute(f"""
+            SELECT DISTINCT user_id, book_id FROM {rental_source(include_history=True)} r
+            WHERE id > {p} AND id <= {p}
+        """, (watermark, new_watermark))
+        new_pairs = cursor.fetchall()
+
+        baskets: Dict[int, set] = {}
+        users = sorted({user_id for user_id, _ in new_pairs})
+        for chunk in _chunks(users):
+            cursor.execute(f"""
+                SELECT DISTINCT user_id, book_id FROM {rental_source(include_history=True)} r
+                WHERE id <= {p} AND user_id IN ({", ".join(p for _ in chunk)})
+            """, [watermark] + chunk)
+            for user_id, book_id in cursor.fetchall():
+                baskets.setdefault(user_id, set()).add(book_id)
+
+        # A book is new to a user only if they never rented it before the watermark
+        deltas: Counter = Counter()
+        added: Dict[int, set] = {}
+        for user_id, book_id in new_pairs:
+            if book_id not in baskets.get(user_id, ()):
+                added.setdefault(user_id, set()).add(book_id)
+        for user_id, new_books in added.items():
+            basket = baskets.get(user_id, set()) | new_books
+            for book_id in basket:
+                for other_id in basket:
+                    if book_id in new_books or other_id in new_books:
+                        deltas[(book_id, other_id)] += 1
+
+        if deltas:
+            rows = [(book_id, other_id, count) for (book_id, other_id), count in deltas.items()]
+            cursor.executemany(f"""
+                INSERT INTO book_cooccurrences (book_id, other_book_id, co_rentals)
+                VALUES ({p}, {p}, {p})
+                ON CONFLICT (book_id, other_book_id) DO UPDATE
+                SET co_rentals = book_cooccurrences.co_rentals + excluded.co_rentals
+            """, rows)
+
+        # A book's renter count is the norm of every score it appears in: the
+        # books co-rented with it need their top-K recomputed as well
+        affected_set = {book_id for book_id, _ in deltas}
+        renters_changed = sorted(book_id for book_id, other_id in deltas if book_id == other_id)
+        for chunk in _chunks(renters_changed):
+            cursor.execute(f"""
+                SELECT DISTINCT other_book_id FROM book_cooccurrences
+                WHERE book_id IN ({", ".join(p for _ in chunk)})
+            """, chunk)
+            affected_set.update(other_id for (other_id,) in cursor.fetchall())
+        affected = sorted(affected_set)
+        neighbours: List[tuple] = []
+        for chunk in _chunks(affected):
+            in_list = ", ".join(p for _ in chunk)
+            cursor.execute(f"""
+                SELECT c.book_id, c.other_book_id, c.co_rentals, r.co_rentals
+                FROM book_cooccurrences c
+                JOIN book_cooccurrences r ON r.book_id = c.other_book_id AND r.other_book_id = c.other_book_id
+                WHERE c.book_id IN ({in_list})
+            """, chunk)
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            book_ids, other_ids, co_rentals, other_renters = (np.array(column, dtype=np.int64) for column in zip(*rows))
+            renters = dict(zip(other_ids.tolist(), other_renters.tolist()))
+            neighbours.extend(top_neighbours(book_ids, other_ids, co_rentals, renters, top_k))
+            cursor.execute(f"DELETE FROM book_similarities WHERE book_id IN ({in_list})", chunk)
+        _insert_rows(cursor, backend, "book_similarities",
+                     ["book_id", "rank", "similar_book_id", "score", "co_rentals"], neighbours)
+
+        _record_build(cursor, backend, new_watermark, "refresh")
+        conn.commit()
+        return {"last_rental_id": new_watermark, "new_pairs": sum(len(books) for books in added.values()),
+                "books": len(affected), "similarities": len(neighbours)}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
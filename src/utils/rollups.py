@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from src.utils.archive import rental_source
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+# Rollup granularities maintained on every rent/return
+GRANULARITIES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+MAX_BUCKETS = 10000
+
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def local_naive(moment: Optional[datetime]) -> Optional[datetime]:
+    """
+    Rentals are stamped with naive local time (datetime.now()): convert an
+    offset-aware query bound to it so it compares with them and with the
+    naive default bound.
+    """
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
+
+
+def _bucket_param(bucket: datetime, backend: str):
+    # SQLite stores timestamps as ISO text, like rental_date
+    return bucket.isoformat() if backend == "sqlite" else bucket
+
+
+def record_rollup(cursor, event: str, at: datetime, backend: str, count: int = 1):
+    """
+    Count `count` rentals ("rent") or returns ("return") in every rollup
+    bucket containing `at`. Runs on the caller's cursor, inside its transaction.
+    """
+    p = PLACEHOLDERS[backend]
+    rentals, returns = (count, 0) if event == "rent" else (0, count)
+    values = []
+    params: List[Any] = []
+    for granularity in GRANULARITIES:
+        values.append(f"({p}, {p}, {p}, {p})")
+        params.extend([granularity, _bucket_param(truncate(at, granularity), backend), rentals, returns])
+
+    cursor.execute(f"""
+        INSERT INTO rental_rollups (granularity, bucket_start, rentals, returns)
+        VALUES {", ".join(values)}
+        ON CONFLICT (granularity, bucket_start) DO UPDATE
+        SET rentals = rental_rollups.rentals + excluded.rentals,
+            returns = rental_rollups.returns + excluded.returns
+    """, params)
+
+
+def backfill_rollups(backend: str):
+    """Rebuild every rollup from all rentals, archived ones included, in one transaction"""
+    conn = open_connection(backend, read_only=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM rental_rollups")
+        for granularity in GRANULARITIES:
+            for column, counter in (("rental_date", "rentals"), ("return_date", "returns")):
+                if backend == "sqlite":
+                    fmt = "%Y-%m-%dT%H:00:00" if granularity == "hour" else "%Y-%m-%dT00:00:00"
+                    bucket = f"strftime('{fmt}', {column})"
+                else:
+                    bucket = f"date_trunc('{granularity}', {column})"
+                cursor.execute(f"""
+                    INSERT INTO rental_rollups (granularity, bucket_start, rentals, returns)
+                    SELECT '{granularity}', {bucket},
+                           {"COUNT(*)" if counter == "rentals" else "0"},
+                           {"COUNT(*)" if counter == "returns" else "0"}
+                    FROM {rental_source(include_history=True)} r
+                    WHERE {column} IS NOT NULL
+                    GROUP BY {bucket}
+                    ON CONFLICT (granularity, bucket_start) DO UPDATE
+                    SET {counter} = rental_rollups.{counter} + excluded.{counter}
+                """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def query_rollups(cursor, backend: str, granularity: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """
+    Rentals and returns per bucket in [start, end), zero-filled.
+    Reads at most one rollup row per bucket, independent of rental volume.
+    """
+    step = GRANULARITIES[granularity]
+    first = truncate(start, granularity)
+    if end <= first:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if (end - first) / step > MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range too large: more than {MAX_BUCKETS} {granularity} buckets")
+
+    p = PLACEHOLDERS[backend]
+    cursor.execute(f"""
+        SELECT bucket_start, rentals, returns
+        FROM rental_rollups
+        WHERE granularity = {p} AND bucket_start >= {p} AND bucket_start < {p}
+        ORDER BY bucket_start
+    """, (granularity, _bucket_param(first, backend), _bucket_param(end, backend)))
+    rows = {}
+    for bucket_start, rentals, returns in cursor.fetchall():
+        if isinstance(bucket_start, str):
+            bucket_start = datetime.fromisoformat(bucket_start)
+        rows[bucket_start] = (rentals, returns)
+
+    series = []
+    bucket = first
+    while bucket < end:
+        rentals, returns = rows.get(bucket, (0, 0))
+        series.append({"bucket": bucket.isoformat(), "rentals": rentals, "returns": returns})
+        bucket += step
+    return series
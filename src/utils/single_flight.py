@@ -0,0 +1,109 @@
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from fastapi import HTTPException
+
+from settings import COALESCE_READS
+from src.utils.deadlines import current_deadline, detached_deadline
+
+# How often a waiter re-checks whether its own request was cancelled
+WAIT_CHECK_SECONDS = 0.1
+
+
+class _Call:
+    """An in-flight call whose result is shared by every waiter."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+    Callers that arrive while a call with the same key is running block
+    until it finishes and receive the same result (or exception). Inside a
+    request they wait no longer than its deadline, then get the 504 the
+    deadline middleware answers with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def do(self, route: str, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            counters = self._stats.setdefault(route, {"executed": 0, "coalesced": 0})
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                counters["executed"] += 1
+                leader = True
+            else:
+                counters["coalesced"] += 1
+                leader = False
+
+        if not leader:
+            self._wait(call)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            # Waiters depend on this call: the leader's client going away
+            # must not cancel it
+            with detached_deadline():
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @staticmethod
+    def _wait(call: _Call):
+        deadline = current_deadline.get()
+        if deadline is None:
+            call.done.wait()
+            return
+        while not call.done.wait(min(deadline.remaining(), WAIT_CHECK_SECONDS)):
+            if deadline.expired():
+                detail = "Client disconnected" if deadline.reason == "disconnect" else "Request deadline exceeded"
+                raise HTTPException(status_code=504, detail=detail)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Executed and coalesced call counts per route"""
+        with self._lock:
+            return {route: dict(counters) for route, counters in self._stats.items()}
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(route: str, vary: Optional[Callable[[], Hashable]] = None):
+    """
+    Opt a read handler into request coalescing.
+    Concurrent calls with identical arguments share one execution. The handler
+    must be a plain `def` (FastAPI runs it in the threadpool, where waiters can
+    block on the leader) and must not mutate anything. `vary` adds a
+    per-request component to the key for requests that must not share results.
+    """
+    def decorator(func):
+        if not COALESCE_READS:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (route, args, tuple(sorted(kwargs.items())), vary() if vary else None)
+            return single_flight.do(route, key, lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
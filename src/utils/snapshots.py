@@ -0,0 +1,93 @@
+import time
+from typing import Tuple
+
+from settings import RENTAL_SNAPSHOTS_ENABLED, SNAPSHOT_REFRESH_BATCH_SIZE, SNAPSHOT_REFRESH_PAUSE_MS
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+# Every rental carries a copy of its user's full_name/email and its book's
+# title/author, written by the statement that inserts the rental (from users
+# u and books b) and refreshed by update_book. With RENTAL_SNAPSHOTS_ENABLED,
+# listings read the copies and scan rentals alone. Rows changed outside the
+# application are repaired by `python cli.py refresh_rental_snapshots`.
+SNAPSHOT_COLUMNS = "user_full_name, user_email, book_title, book_author"
+SNAPSHOT_VALUES = "u.full_name, u.email, b.title, b.author"
+SNAPSHOT_ASSIGNMENTS = (
+    "user_full_name = (SELECT full_name FROM users WHERE users.id = rentals.user_id), "
+    "user_email = (SELECT email FROM users WHERE users.id = rentals.user_id), "
+    "book_title = (SELECT title FROM books WHERE books.id = rentals.book_id), "
+    "book_author = (SELECT author FROM books WHERE books.id = rentals.book_id)"
+)
+
+
+def rental_details(snapshots: bool = RENTAL_SNAPSHOTS_ENABLED) -> Tuple[str, str]:
+    """
+    (select list, joins) giving full_name, email, title and author of the
+    rentals aliased `r`: the snapshot columns, or joins of users and books
+    """
+    if snapshots:
+        return (
+            "r.user_full_name AS full_name, r.user_email AS email, r.book_title AS title, r.book_author AS author",
+            "",
+        )
+    return "u.full_name, u.email, b.title, b.author", "JOIN users u ON r.user_id = u.id JOIN books b ON r.book_id = b.id"
+
+
+def stale_snapshot(backend: str) -> str:
+    """WHERE clause matching rentals whose copies differ from users/books"""
+    differs = "IS DISTINCT FROM" if backend == "postgres" else "IS NOT"
+    return f"""EXISTS (
+        SELECT 1 FROM users u, books b
+        WHERE u.id = rentals.user_id AND b.id = rentals.book_id
+          AND (u.full_name {differs} rentals.user_full_name OR u.email {differs} rentals.user_email
+               OR b.title {differs} rentals.book_title OR b.author {differs} rentals.book_author)
+    )"""
+
+
+def refresh_book_snapshots(cursor, backend: str, book_id: int, title: str, author: str):
+    """
+    Copy a book's new title/author onto its rentals, in the caller's
+    transaction. Rentals whose copies already match are not rewritten, so an
+    update that keeps title and author (a quantity change) writes no rentals.
+    """
+    p = PLACEHOLDERS[backend]
+    differs = "IS DISTINCT FROM" if backend == "postgres" else "IS NOT"
+    cursor.execute(
+        f"UPDATE rentals SET book_title = {p}, book_author = {p} "
+        f"WHERE book_id = {p} AND (book_title {differs} {p} OR book_author {differs} {p})",
+        (title, author, book_id, title, author),
+    )
+
+
+def refresh_snapshots(backend: str, batch_size: int = SNAPSHOT_REFRESH_BATCH_SIZE,
+                      batch_pause: float = SNAPSHOT_REFRESH_PAUSE_MS / 1000) -> int:
+    """
+    Rewrite stale copies, one id range of `batch_size` rentals per
+    transaction with a pause in between. Returns the number of rentals fixed.
+    """
+    p = PLACEHOLDERS[backend]
+    conn = open_connection(backend, read_only=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM rentals")
+        low, high = cursor.fetchone()
+        conn.commit()
+        if low is None:
+            return 0
+        updated = 0
+        for start in range(low, high + 1, batch_size):
+            cursor.execute(
+                f"UPDATE rentals SET {SNAPSHOT_ASSIGNMENTS} "
+                f"WHERE id >= {p} AND id < {p} AND {stale_snapshot(backend)}",
+                (start, start + batch_size),
+            )
+            batch_updated = max(cursor.rowcount, 0)
+            conn.commit()
+            updated += batch_updated
+            if batch_updated and batch_pause:
+                time.sleep(batch_pause)
+        return updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
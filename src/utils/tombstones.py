@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from typing import Dict
+
+from src.utils.db_backends import PLACEHOLDERS, open_connection
+
+# DELETE on books and users only sets deleted_at: one statement, no scan of
+# rental history, and rentals keep pointing at a row that still exists.
+# Every list and lookup reads live rows only (`deleted_at IS NULL`, served by
+# the idx_*_live partial indexes). Tombstones are purged later, in batches,
+# once nothing references them any more.
+TOMBSTONED_TABLES: Dict[str, str] = {
+    "books": "book_id",
+    "users": "user_id",
+}
+
+
+def compact_tombstones(backend: str, retention_days: int, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Physically delete books and users tombstoned more than `retention_days`
+    ago that no rental, archived rental or hold references, `batch_size`
+    rows per transaction. Returns rows deleted per table.
+    """
+    p = PLACEHOLDERS[backend]
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    cutoff_param = cutoff if backend == "postgres" else cutoff.isoformat()
+    skip_locked = " FOR UPDATE SKIP LOCKED" if backend == "postgres" else ""
+
+    conn = open_connection(backend, read_only=False)
+    try:
+        cursor = conn.cursor()
+        deleted = {}
+        for table, column in TOMBSTONED_TABLES.items():
+            deleted[table] = 0
+            while True:
+                cursor.execute(f"""
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT t.id FROM {table} t
+                        WHERE t.deleted_at < {p}
+                          AND NOT EXISTS (SELECT 1 FROM rentals r WHERE r.{column} = t.id)
+                          AND NOT EXISTS (SELECT 1 FROM rentals_archive a WHERE a.{column} = t.id)
+                          AND NOT EXISTS (SELECT 1 FROM holds h WHERE h.{column} = t.id)
+                        ORDER BY t.deleted_at
+                        LIMIT {p}{skip_locked}
+                    )
+                """, (cutoff_param, batch_size))
+                batch_deleted = cursor.rowcount
+                conn.commit()
+                deleted[table] += batch_deleted
+                if batch_deleted < batch_size:
+                    break
+        return deleted
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import fcntl
+import os
+import threading
+from typing import Dict, List
+
+# Some state only works in one process: the SQLite routers' availability
+# events and the write-behind availability view are never seen by other
+# workers. Settings refuse APP_WORKERS > 1 for them, but `uvicorn --workers N`
+# starts several processes without going through that check, so each of them
+# also takes an exclusive lock on a file next to the resource at startup and
+# the second process refuses to start.
+
+_held: Dict[str, List] = {}  # path -> [open file, holders in this process]
+_lock = threading.Lock()
+
+
+def acquire_worker_lock(path: str, owner: str):
+    """
+    Take the single-worker lock `path` for this process, or raise
+    RuntimeError naming `owner` when another process holds it. Holders in the
+    same process (test clients, reloads) share it.
+    """
+    path = os.path.abspath(path)
+    with _lock:
+        if path in _held:
+            _held[path][1] += 1
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file = open(path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.seek(0)
+            pid = file.read().strip()
+            file.close()
+            holder = f"pid {pid}" if pid else "another process"
+            raise RuntimeError(
+                f"{owner} needs a single worker process, but {holder} already holds {path} "
+                f"(started with uvicorn --workers > 1?)"
+            )
+        file.seek(0)
+        file.truncate()
+        file.write(str(os.getpid()))
+        file.flush()
+        _held[path] = [file, 1]
+
+
+def release_worker_lock(path: str):
+    path = os.path.abspath(path)
+    with _lock:
+        entry = _held.get(path)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _held[path]
+            # Closing releases the lock; the file stays for the next process
+            entry[0].close()
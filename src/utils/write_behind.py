@@ -0,0 +1,444 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from src.utils.availability import AvailabilityView, conditional_rent
+from src.utils.availability_events import availability_change
+from src.utils.holds import hand_off, publish_hold
+from src.utils.rollups import record_rollup
+
+logger = logging.getLogger(__name__)
+
+
+def _read_pending(file) -> "OrderedDict[str, Dict[str, Any]]":
+    events: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for line in file:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # Torn last line from a crash mid-write; it was never acknowledged
+            continue
+        if "event" in record:
+            events[record["event"]["token"]] = record["event"]
+        else:
+            for token in record["done"]:
+                events.pop(token, None)
+    return events
+
+
+class RentalJournal:
+    """
+    Append-only JSON-lines journal of acknowledged rental events.
+    An event is fsync'ed before the client is acknowledged and marked done
+    after its batch commits; on startup every event not marked done is
+    replayed.
+
+    Each worker process writes its own file, `<stem>.<pid><ext>` next to
+    `path`, and holds an exclusive lock on it while running. On startup,
+    journals whose lock is free were left by a worker that has exited: their
+    pending events are adopted into this worker's journal and the files
+    removed, so every event is replayed by exactly one worker.
+    """
+
+    def __init__(self, path: str, compact_bytes: int = 1024 * 1024):
+        stem, ext = os.path.splitext(path)
+        self.base_path = path
+        self.path = f"{stem}.{os.getpid()}{ext}"
+        self._sibling = re.compile(re.escape(os.path.basename(stem)) + r"\.\d+" + re.escape(ext) + "$")
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._outstanding = set()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if self._file.tell() > 0:
+            # Terminate a line torn by a crash so the next record starts cleanly
+            with open(self.path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    self._write_line("")
+
+    def _write_line(self, line: str):
+        self._file.write(line + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write(self, record: Dict[str, Any]):
+        self._write_line(json.dumps(record))
+
+    def append(self, event: Dict[str, Any]):
+        with self._lock:
+            self._write({"event": event})
+            self._outstanding.add(event["token"])
+
+    def mark_done(self, tokens: List[str]):
+        with self._lock:
+            self._write({"done": tokens})
+            self._outstanding.difference_update(tokens)
+            # Empty the file once it has grown and holds nothing pending
+            # (in place: reopening it would release the lock meanwhile)
+            if not self._outstanding and self._file.tell() > self.compact_bytes:
+                self._file.seek(0)
+                self._file.truncate()
+
+    def _orphans(self) -> List[str]:
+        """Journals of exited workers (and the single journal of older versions)"""
+        directory = os.path.dirname(os.path.abspath(self.base_path))
+        paths = [
+            path for path in glob.glob(os.path.join(directory, "*"))
+            if self._sibling.match(os.path.basename(path)) and os.path.abspath(path) != os.path.abspath(self.path)
+        ]
+        if os.path.exists(self.base_path):
+            paths.append(self.base_path)
+        return paths
+
+    def _adopt(self, path: str):
+        try:
+            file = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            # Adopted by another worker meanwhile
+            return
+        with file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Its worker is alive, or another worker is adopting it
+                return
+            if not os.path.exists(path):
+                return
+            events = _read_pending(file)
+            for event in events.values():
+                self._write({"event": event})
+            os.unlink(path)
+        if events:
+            logger.info("Adopted %d pending rental event(s) from %s", len(events), path)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Events that were acknowledged but never marked done, adopted ones included"""
+        with self._lock:
+            for path in self._orphans():
+                self._adopt(path)
+            with open(self.path, "r", encoding="utf-8") as file:
+                events = _read_pending(file)
+            self._outstanding.update(events)
+        return list(events.values())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RentalWriteBehind:
+    """
+    Acknowledge rent/return requests immediately and persist them in batches.
+
+    Requests are validated against an AvailabilityView, journaled, and
+    answered with a reservation token. A background thread groups queued
+    events into one transaction (one savepoint per event, so a single
+    rejected event does not roll back its batch).
+
+    Each event's outcome is recorded in rental_write_behind_events by the
+    transaction that applies it. An event found there was committed before
+    a crash and is answered from the record instead of applied again; records
+    are deleted by the next batch once the journal has marked them done.
+    """
+
+    def __init__(
+        self,
+        view: AvailabilityView,
+        journal: RentalJournal,
+        connect: Callable,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_statuses: int = 10000,
+    ):
+        self.view = view
+        self.journal = journal
+        self._connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_statuses = max_statuses
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._statuses: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._statuses_lock = threading.Lock()
+        # Tokens marked done in the journal whose records can go
+        self._settled: List[str] = []
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Replay the journal, load the availability view and start the writer"""
+        pending = self.journal.pending()
+        if pending:
+            # Persist leftovers first so the view loaded below already reflects them
+            self._flush(pending)
+        self.view.load()
+        self._thread = threading.Thread(target=self._run, name="rental-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything queued, then stop the writer thread"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._settled:
+            self._forget_settled()
+        self.journal.close()
+
+    def _forget_settled(self):
+        """Delete the records of the last batches, which no later batch will"""
+        conn = self._connect()
+        try:
+            conn.cursor().execute("DELETE FROM rental_write_behind_events WHERE token = ANY(%s)", (self._settled,))
+            conn.commit()
+            self._settled = []
+        except Exception:
+            # Harmless leftovers: their events are marked done and never replayed
+            conn.rollback()
+            logger.warning("Could not delete %d write-behind event record(s)", len(self._settled), exc_info=True)
+        finally:
+            conn.close()
+
+    def _set_status(self, token: str, status: Dict[str, Any]):
+        with self._statuses_lock:
+            self._statuses[token] = status
+            self._statuses.move_to_end(token)
+            while len(self._statuses) > self.max_statuses:
+                self._statuses.popitem(last=False)
+
+    def status(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._statuses_lock:
+            status = self._statuses.get(token)
+            return dict(status) if status else None
+
+    def submit_rent(self, user_id: int, book_id: int, days_to_return: int) -> Dict[str, Any]:
+        user_name, book_title = self.view.reserve_rent(user_id, book_id)
+        rental_date = datetime.now()
+        due_date = rental_date + timedelta(days=days_to_return)
+        event = {
+            "token": uuid.uuid4().hex,
+            "type": "rent",
+            "user_id": user_id,
+            "book_id": book_id,
+            "rental_date": rental_date.isoformat(),
+            "due_date": due_date.isoformat(),
+        }
+        self._enqueue(event, on_error=lambda: self.view.release_rent(user_id, book_id))
+        return {
+            "reservation_token": event["token"],
+            "status": "pending",
+            "user_id": user_id,
+            "book_id": book_id,
+            "rental_date": event["rental_date"],
+            "due_date": event["due_date"],
+            "is_returned": False,
+            "user_name": user_name,
+            "book_title": book_title,
+            "message": f"Book '{book_title}' reserved for {user_name} until {due_date.strftime('%Y-%m-%d')}"
+        }
+
+    def submit_return(self, rental_id: Optional[int], book_id: Optional[int]) -> Dict[str, Any]:
+        rental_id, user_id, book_id = self.view.reserve_return(rental_id, book_id)
+        return_date = datetime.now()
+        event = {
+            "token": uuid.uuid4().hex,
+            "type": "return",
+            "rental_id": rental_id,
+            "user_id": user_id,
+            "book_id": book_id,
+            "return_date": return_date.isoformat(),
+        }
+        self._enqueue(event, on_error=lambda: self.view.release_return(rental_id, user_id, book_id))
+        user_name, book_title = self.view.describe(user_id, book_id)
+        return {
+            "reservation_token": event["token"],
+            "status": "pending",
+            "rental_id": rental_id,
+            "user_id": user_id,
+            "book_id": book_id,
+            "return_date": event["return_date"],
+            "user_name": user_name,
+            "book_title": book_title,
+            "message": f"Book '{book_title}' return by {user_name} accepted"
+        }
+
+    def _enqueue(self, event: Dict[str, Any], on_error: Callable):
+        try:
+            self.journal.append(event)
+        except Exception as e:
+            on_error()
+            raise HTTPException(status_code=503, detail=f"Rental journal unavailable: {str(e)}")
+        self._set_status(event["token"], {"status": "pending", "type": event["type"]})
+        self._queue.put(event)
+
+    def _run(self):
+        backoff = self.flush_interval
+        batch: List[Dict[str, Any]] = []
+        while True:
+            if not batch:
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    if self._stopping.is_set():
+                        break
+                    continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._flush(batch)
+            except Exception:
+                # Database unavailable: keep the batch (it is journaled) and retry
+                logger.exception("Rental write-behind flush failed; retrying in %.2fs", backoff)
+                if self._stopping.is_set():
+                    break
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 5.0)
+                continue
+
+            backoff = self.flush_interval
+            batch = []
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        from psycopg2.extras import execute_values
+
+        settled = list(self._settled)
+        conn = self._connect()
+        outcomes = []
+        try:
+            cursor = conn.cursor()
+            if settled:
+                cursor.execute("DELETE FROM rental_write_behind_events WHERE token = ANY(%s)", (settled,))
+            cursor.execute(
+                "SELECT token, status, rental_id, detail FROM rental_write_behind_events WHERE token = ANY(%s)",
+                ([event["token"] for event in batch],),
+            )
+            recorded = {row[0]: row[1:] for row in cursor.fetchall()}
+            records = []
+            for event in batch:
+                if event["token"] in recorded:
+                    # Committed before a crash, journal not marked done yet
+                    status, rental_id, detail = recorded[event["token"]]
+                    outcome = {"status": status, "rental_id": rental_id}
+                    if status != "persisted":
+                        outcome["detail"] = detail
+                    elif event["type"] == "return":
+                        outcome["handed_to_hold"] = None
+                    outcomes.append((event, outcome))
+                    continue
+                cursor.execute("SAVEPOINT rental_event")
+                if event["type"] == "rent":
+                    outcome = self._persist_rent(cursor, event)
+                else:
+                    outcome = self._persist_return(cursor, event)
+                if outcome["status"] == "persisted":
+                    cursor.execute("RELEASE SAVEPOINT rental_event")
+                else:
+                    cursor.execute("ROLLBACK TO SAVEPOINT rental_event")
+                outcomes.append((event, outcome))
+                records.append((event["token"], outcome["status"], outcome.get("rental_id"),
+                                outcome.get("detail"), datetime.now()))
+            if records:
+                execute_values(cursor, """
+                    INSERT INTO rental_write_behind_events (token, status, rental_id, detail, processed_at)
+                    VALUES %s
+                """, records)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        del self._settled[:len(settled)]
+
+        for event, outcome in outcomes:
+            if event["type"] == "rent":
+                if outcome["status"] == "persisted":
+                    self.view.confirm_rent(outcome["rental_id"], event["user_id"], event["book_id"])
+                else:
+                    self.view.release_rent(event["user_id"], event["book_id"])
+            elif outcome["status"] != "persisted":
+                self.view.release_return(event["rental_id"], event["user_id"], event["book_id"])
+            elif outcome["handed_to_hold"] is not None:
+                handed_to = outcome["handed_to_hold"]
+                self.view.hand_off(handed_to["rental_id"], handed_to["user_id"], handed_to["book_id"])
+                publish_hold(handed_to)
+            self._set_status(event["token"], dict(outcome, type=event["type"]))
+        tokens = [event["token"] for event in batch]
+        self.journal.mark_done(tokens)
+        self._settled.extend(tokens)
+
+    @staticmethod
+    def _persist_rent(cursor, event: Dict[str, Any]) -> Dict[str, Any]:
+        rental_date = datetime.fromisoformat(event["rental_date"])
+        # The same conditional write as the synchronous path: the user or the
+        # book may have been deleted since the event was accepted
+        rental_id, refused = conditional_rent(
+            cursor, "postgres", event["user_id"], event["book_id"],
+            rental_date, datetime.fromisoformat(event["due_date"]),
+        )
+        if refused == "duplicate":
+            return {"status": "rejected", "detail": "User already has this book rented"}
+        if refused is not None:
+            cursor.execute("""
+                SELECT EXISTS (SELECT 1 FROM users WHERE id = %s AND deleted_at IS NULL),
+                       EXISTS (SELECT 1 FROM books WHERE id = %s AND deleted_at IS NULL)
+            """, (event["user_id"], event["book_id"]))
+            user_exists, book_exists = cursor.fetchone()
+            if not user_exists:
+                return {"status": "rejected", "detail": "User not found"}
+            if not book_exists:
+                return {"status": "rejected", "detail": "Book not found"}
+            return {"status": "rejected", "detail": "Book not available"}
+
+        record_rollup(cursor, "rent", rental_date, "postgres")
+        availability_change(
+            cursor, "postgres", event["book_id"], "rent", user_id=event["user_id"], rental_id=rental_id
+        )
+        return {"status": "persisted", "rental_id": rental_id}
+
+    @staticmethod
+    def _persist_return(cursor, event: Dict[str, Any]) -> Dict[str, Any]:
+        cursor.execute("""
+            UPDATE rentals
+            SET return_date = %s, is_returned = true
+            WHERE id = %s AND is_returned = false
+        """, (event["return_date"], event["rental_id"]))
+        if cursor.rowcount == 0:
+            return {"status": "rejected", "detail": "Book already returned"}
+
+        return_date = datetime.fromisoformat(event["return_date"])
+        handed_to = hand_off(cursor, "postgres", event["book_id"], return_date)
+        if handed_to is None:
+            cursor.execute("UPDATE books SET quantity = quantity + 1 WHERE id = %s", (event["book_id"],))
+        record_rollup(cursor, "return", return_date, "postgres")
+        availability_change(
+            cursor, "postgres", event["book_id"], "return", user_id=event["user_id"], rental_id=event["rental_id"]
+        )
+        if handed_to is not None:
+            availability_change(
+                cursor, "postgres", event["book_id"], "rent",
+                user_id=handed_to["user_id"], rental_id=handed_to["rental_id"]
+            )
+        return {"status": "persisted", "rental_id": event["rental_id"], "handed_to_hold": handed_to}
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# The suite runs on SQLite alone (no PostgreSQL server needed) and without the
+# per-client rate limits, which repeated list calls would trip. Settings read
+# the environment once, at first import, so this has to happen here.
+os.environ.setdefault("ENABLED_BACKENDS", "sqlite")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+# PostgreSQL-only features are tested on a scratch database, never on the
+# configured one: the tests truncate its tables
+TEST_POSTGRES_DSN = os.environ.get("TEST_POSTGRES_DSN")
+if TEST_POSTGRES_DSN:
+    os.environ["POSTGRES_PRIMARY_DSN"] = TEST_POSTGRES_DSN
+    os.environ["POSTGRES_REPLICA_DSNS"] = ""
+
+
+def seed_library(path: str = "library.db", books: int = 20, users: int = 10):
+    """`books` single-copy books and `users` users, ids counting from 1"""
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO books (title, author, year, quantity) VALUES (?, ?, ?, ?)",
+        [(f"Book {i}", f"Author {i}", 2000 + i, 1) for i in range(1, books + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO users (full_name, email) VALUES (?, ?)",
+        [(f"User {i}", f"user{i}@example.com") for i in range(1, users + 1)],
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def sqlite_dir(tmp_path_factory):
+    """A fresh, migrated SQLite database as the working directory (SQLITE_PATH is relative to it)"""
+    from src.migrations.runner import migrate
+
+    previous = os.getcwd()
+    path = tmp_path_factory.mktemp("sqlite")
+    os.chdir(path)
+    try:
+        migrate("sqlite")
+        yield path
+    finally:
+        os.chdir(previous)
+
+
+@pytest.fixture(scope="module")
+def client(sqlite_dir):
+    """The app on a seeded SQLite database"""
+    seed_library()
+
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="module")
+def postgres_client():
+    """
+    The postgres-rentals router alone on TEST_POSTGRES_DSN, migrated and
+    emptied, with the same books and users as `seed_library`
+    """
+    if not TEST_POSTGRES_DSN:
+        pytest.skip("set TEST_POSTGRES_DSN to a scratch PostgreSQL database")
+
+    from src.api.postgres_rentals import main as postgres_rentals
+    from src.migrations.runner import migrate
+    from src.utils.postgres_utils import replica_router
+
+    migrate("postgres")
+    conn = replica_router.connect_primary()
+    cursor = conn.cursor()
+    cursor.execute(
+        "TRUNCATE holds, rentals, rentals_archive, idempotency_keys, books, users RESTART IDENTITY CASCADE"
+    )
+    cursor.executemany(
+        "INSERT INTO books (title, author, year, quantity) VALUES (%s, %s, %s, %s)",
+        [(f"Book {i}", f"Author {i}", 2000 + i, 1) for i in range(1, 21)],
+    )
+    cursor.executemany(
+        "INSERT INTO users (full_name, email) VALUES (%s, %s)",
+        [(f"User {i}", f"user{i}@example.com") for i in range(1, 11)],
+    )
+    conn.commit()
+    conn.close()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await postgres_rentals.startup()
+        yield
+        await postgres_rentals.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(postgres_rentals.router)
+    with TestClient(app) as test_client:
+        yield test_client
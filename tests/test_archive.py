@@ -0,0 +1,52 @@
+import sqlite3
+from datetime import datetime
+
+from src.utils.archive import archive_cutoff, archive_rentals
+
+OLD = "2020-03-01T10:00:00"
+OLD_RETURN = "2020-03-10T10:00:00"
+
+
+def test_old_returned_rentals_move_to_the_archive(client):
+    conn = sqlite3.connect("library.db")
+    conn.executemany(
+        "INSERT INTO rentals (id, user_id, book_id, rental_date, due_date, return_date, is_returned) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (1, 1, 1, OLD, OLD_RETURN, OLD_RETURN, 1),
+            (2, 2, 2, OLD, OLD_RETURN, OLD_RETURN, 1),
+            (3, 3, 3, OLD, OLD_RETURN, OLD_RETURN, 1),
+            # A hold points to it
+            (4, 4, 4, OLD, OLD_RETURN, OLD_RETURN, 1),
+            # Still rented
+            (5, 5, 5, OLD, OLD_RETURN, None, 0),
+            # Newest: its id must not be handed out again
+            (6, 6, 6, OLD, OLD_RETURN, OLD_RETURN, 1),
+        ],
+    )
+    conn.execute(
+        "INSERT INTO holds (user_id, book_id, days_to_return, status, created_at, fulfilled_at, rental_id) "
+        "VALUES (4, 4, 14, 'fulfilled', ?, ?, 4)",
+        (OLD, OLD),
+    )
+    conn.commit()
+    conn.close()
+
+    assert archive_rentals("sqlite", months=12, batch_size=2, batch_pause=0) == {
+        "archived": 3, "partitions_created": 0,
+    }
+
+    hot = client.get("/simple-rentals/", params={"fields": "id"}).json()
+    assert sorted(rental["id"] for rental in hot) == [4, 5, 6]
+    history = client.get("/simple-rentals/", params={"fields": "id,user.full_name", "include_history": True}).json()
+    assert sorted(rental["id"] for rental in history) == [1, 2, 3, 4, 5, 6]
+    assert {"id": 1, "user": {"full_name": "User 1"}} in history
+
+    # Nothing left to move; new rentals carry on after the newest id
+    assert archive_rentals("sqlite", months=12, batch_pause=0)["archived"] == 0
+    assert client.post("/simple-rentals/rent", json={"user_id": 7, "book_id": 7}).json()["id"] == 7
+
+
+def test_cutoff_is_the_start_of_a_month():
+    assert archive_cutoff(12, now=datetime(2026, 10, 19, 15, 30)) == datetime(2025, 10, 1)
+    assert archive_cutoff(1, now=datetime(2026, 1, 5)) == datetime(2025, 12, 1)
@@ -0,0 +1,72 @@
+# PostgreSQL only: run with TEST_POSTGRES_DSN set to a scratch database
+
+
+def outcomes(response):
+    return [(item["index"], item["status_code"], item.get("detail")) for item in response.json()["items"]]
+
+
+def test_bulk_rent_reports_each_item(postgres_client):
+    response = postgres_client.post("/postgres-rentals/bulk/rent", json={"items": [
+        {"user_id": 1, "book_id": 1},
+        {"user_id": 2, "book_id": 1},
+        {"user_id": 1, "book_id": 999},
+        {"user_id": 999, "book_id": 2},
+        {"user_id": 3, "book_id": 2},
+        {"user_id": 3, "book_id": 2},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (2, 4)
+    assert outcomes(response) == [
+        (0, 200, None),
+        (1, 400, "Book not available"),
+        (2, 404, "Book not found"),
+        (3, 404, "User not found"),
+        (4, 200, None),
+        # Its only copy went to item 4, as with two POST /rent
+        (5, 400, "Book not available"),
+    ]
+    assert body["items"][0]["book_title"] == "Book 1"
+
+    active = postgres_client.get("/postgres-rentals/active", params={"fields": "user_id,book_id"}).json()
+    assert sorted((rental["user_id"], rental["book_id"]) for rental in active) == [(1, 1), (3, 2)]
+
+
+def test_bulk_return_reports_each_item(postgres_client):
+    active = postgres_client.get("/postgres-rentals/active", params={"fields": "id,book_id"}).json()
+    by_book = {rental["book_id"]: rental["id"] for rental in active}
+
+    response = postgres_client.post("/postgres-rentals/bulk/return", json={"items": [
+        {"rental_id": by_book[1]},
+        {"rental_id": by_book[1]},
+        {"book_id": 2},
+        {"rental_id": 99999},
+    ]})
+    assert response.status_code == 200
+    assert outcomes(response) == [
+        (0, 200, None),
+        (1, 400, "Rental appears more than once in this request"),
+        (2, 200, None),
+        (3, 404, "Active rental not found"),
+    ]
+
+    again = postgres_client.post("/postgres-rentals/bulk/return", json={"items": [{"rental_id": by_book[1]}]})
+    assert outcomes(again) == [(0, 400, "Book already returned")]
+    assert postgres_client.get("/postgres-rentals/active").json() == []
+
+
+def test_bulk_request_replays_with_its_idempotency_key(postgres_client):
+    request = {"items": [{"user_id": 4, "book_id": 4}, {"user_id": 5, "book_id": 4}]}
+    headers = {"Idempotency-Key": "bulk-1"}
+    first = postgres_client.post("/postgres-rentals/bulk/rent", json=request, headers=headers)
+    retry = postgres_client.post("/postgres-rentals/bulk/rent", json=request, headers=headers)
+
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+    assert outcomes(first) == [(0, 200, None), (1, 400, "Book not available")]
+
+
+def test_empty_and_oversized_batches_are_rejected(postgres_client):
+    assert postgres_client.post("/postgres-rentals/bulk/rent", json={"items": []}).status_code == 422
+    items = [{"rental_id": i} for i in range(1, 10000)]
+    assert postgres_client.post("/postgres-rentals/bulk/return", json={"items": items}).status_code == 422
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from src.middleware.deadline import DeadlineMiddleware
+from src.utils.db_backends import connect_sqlite
+
+TIMEOUT = 0.2
+# Counts far beyond what finishes in TIMEOUT
+SLOW_QUERY = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+    SELECT COUNT(*) FROM n
+"""
+
+
+def count_to(limit: int) -> int:
+    try:
+        conn = connect_sqlite()
+        count = conn.execute(SLOW_QUERY, (limit,)).fetchone()[0]
+        conn.close()
+        return count
+    except Exception as e:
+        if 'conn' in locals():
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@pytest.fixture(scope="module")
+def deadline_client(sqlite_dir):
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware, timeout=TIMEOUT, report_timeout=TIMEOUT * 10)
+
+    @app.get("/count/{limit}")
+    def count(limit: int):
+        return {"count": count_to(limit)}
+
+    @app.get("/stats/count/{limit}")
+    def report(limit: int):
+        return {"count": count_to(limit)}
+
+    @app.get("/broken")
+    def broken():
+        raise HTTPException(status_code=500, detail="Database error: disk I/O error")
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_query_within_the_deadline_answers(deadline_client):
+    assert deadline_client.get("/count/1000").json() == {"count": 1000}
+
+
+def test_query_past_the_deadline_is_interrupted_with_504(deadline_client):
+    began = time.monotonic()
+    response = deadline_client.get("/count/1000000000")
+    elapsed = time.monotonic() - began
+
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Request deadline exceeded"}
+    assert elapsed < TIMEOUT + 1
+
+
+def test_reports_get_the_longer_timeout(deadline_client):
+    # Cut off at the report timeout, not the request timeout
+    began = time.monotonic()
+    assert deadline_client.get("/stats/count/1000").status_code == 200
+    assert deadline_client.get("/stats/count/1000000000").status_code == 504
+    assert time.monotonic() - began >= TIMEOUT * 10
+
+
+def test_errors_before_the_deadline_stay_500(deadline_client):
+    response = deadline_client.get("/broken")
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Database error: disk I/O error"}
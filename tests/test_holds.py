@@ -0,0 +1,72 @@
+def rent(client, user_id, book_id):
+    return client.post("/simple-rentals/rent", json={"user_id": user_id, "book_id": book_id})
+
+
+def place_hold(client, user_id, book_id):
+    return client.post("/simple-rentals/holds", json={"user_id": user_id, "book_id": book_id, "days_to_return": 7})
+
+
+def test_returned_copies_go_to_holds_in_fifo_order(client):
+    first = rent(client, 1, 1).json()
+    holds = [place_hold(client, user_id, 1).json() for user_id in (2, 3)]
+    assert [hold["position"] for hold in holds] == [1, 2]
+
+    returned = client.post("/simple-rentals/return", json={"rental_id": first["id"]}).json()
+    handed = returned["handed_to_hold"]
+    assert (handed["hold_id"], handed["user_id"], handed["status"]) == (holds[0]["hold_id"], 2, "fulfilled")
+
+    fulfilled = client.get(f"/simple-rentals/holds/{holds[0]['hold_id']}").json()
+    assert fulfilled["status"] == "fulfilled"
+    assert fulfilled["position"] is None
+    assert fulfilled["rental_id"] == handed["rental_id"]
+    assert client.get(f"/simple-rentals/holds/{holds[1]['hold_id']}").json()["position"] == 1
+
+    # The copy went to the holder, not back on the shelf
+    assert rent(client, 4, 1).status_code == 400
+    returned = client.post("/simple-rentals/return", json={"book_id": 1}).json()
+    assert returned["handed_to_hold"]["user_id"] == 3
+
+    returned = client.post("/simple-rentals/return", json={"book_id": 1}).json()
+    assert returned["handed_to_hold"] is None
+    assert rent(client, 4, 1).status_code == 200
+
+
+def test_hold_is_refused_while_a_copy_is_on_the_shelf(client):
+    response = place_hold(client, 1, 2)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Book is available; rent it instead"
+
+
+def test_one_waiting_hold_per_user_and_book(client):
+    rent(client, 1, 3)
+    assert place_hold(client, 2, 3).status_code == 200
+    response = place_hold(client, 2, 3)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "User already has a hold on this book"
+
+
+def test_cancelled_and_deleted_users_holds_are_skipped(client):
+    rental = rent(client, 1, 4).json()
+    cancelled = place_hold(client, 2, 4).json()
+    deleted = place_hold(client, 5, 4).json()
+    waiting = place_hold(client, 6, 4).json()
+
+    assert client.delete(f"/simple-rentals/holds/{cancelled['hold_id']}").json()["status"] == "cancelled"
+    assert client.delete(f"/simple-rentals/holds/{cancelled['hold_id']}").status_code == 400
+    assert client.delete("/simple-users/5").status_code == 200
+    assert client.get(f"/simple-rentals/holds/{deleted['hold_id']}").json()["status"] == "cancelled"
+
+    returned = client.post("/simple-rentals/return", json={"rental_id": rental["id"]}).json()
+    assert returned["handed_to_hold"]["hold_id"] == waiting["hold_id"]
+
+
+def test_wait_answers_once_the_hold_is_fulfilled(client):
+    rental = rent(client, 7, 5).json()
+    hold = place_hold(client, 8, 5).json()
+
+    pending = client.get(f"/simple-rentals/holds/{hold['hold_id']}/wait", params={"timeout": 0.1}).json()
+    assert pending["status"] == "waiting"
+
+    client.post("/simple-rentals/return", json={"rental_id": rental["id"]})
+    done = client.get(f"/simple-rentals/holds/{hold['hold_id']}/wait", params={"timeout": 5}).json()
+    assert done["status"] == "fulfilled"
@@ -0,0 +1,46 @@
+from src.utils.idempotency import fingerprint
+
+# PostgreSQL only: run with TEST_POSTGRES_DSN set to a scratch database
+
+
+def rent(client, key, user_id, book_id):
+    return client.post(
+        "/postgres-rentals/rent", json={"user_id": user_id, "book_id": book_id}, headers={"Idempotency-Key": key}
+    )
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint("rent", {"user_id": 1, "book_id": 2}) == fingerprint("rent", {"book_id": 2, "user_id": 1})
+    assert fingerprint("rent", {"user_id": 1}) != fingerprint("return", {"user_id": 1})
+
+
+def test_retry_replays_the_first_response(postgres_client):
+    first = rent(postgres_client, "rent-1", 1, 1)
+    assert first.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+
+    retry = rent(postgres_client, "rent-1", 1, 1)
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+
+    # Without the key the same request is a new rental, refused as a duplicate
+    response = postgres_client.post("/postgres-rentals/rent", json={"user_id": 1, "book_id": 1})
+    assert response.status_code == 400
+
+
+def test_key_reused_for_another_request_is_422(postgres_client):
+    assert rent(postgres_client, "rent-2", 2, 2).status_code == 200
+    response = rent(postgres_client, "rent-2", 2, 3)
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Idempotency-Key was already used for a different request"}
+
+
+def test_failed_attempts_are_not_stored(postgres_client):
+    assert rent(postgres_client, "rent-3", 3, 999).status_code == 404
+    retry = rent(postgres_client, "rent-3", 3, 999)
+    assert retry.status_code == 404
+    assert "idempotent-replayed" not in retry.headers
+
+    # Nor do they tie the key to the failed request
+    assert rent(postgres_client, "rent-3", 3, 4).status_code == 200
@@ -0,0 +1,10 @@
+from commands.check_import_time.main import measure_import_time
+from settings import IMPORT_TIME_BUDGET_MS
+
+
+def test_import_main_within_budget():
+    total_ms, slowest = measure_import_time("main")
+    report = "\n".join(f"{cumulative_ms:9.1f} ms  {name}" for cumulative_ms, name in slowest)
+    assert total_ms <= IMPORT_TIME_BUDGET_MS, (
+        f"Importing 'main' took {total_ms:.1f} ms (budget {IMPORT_TIME_BUDGET_MS} ms); slowest imports:\n{report}"
+    )
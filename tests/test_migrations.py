@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from src.migrations.runner import load_migrations, migrate, migration_status
+
+VERSIONS = [module.VERSION for module in load_migrations()]
+
+
+@pytest.fixture
+def empty_dir(tmp_path, monkeypatch):
+    """A working directory without library.db"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def tables(path: str = "library.db"):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+
+def test_versions_are_numbered_in_order():
+    assert VERSIONS == list(range(1, len(VERSIONS) + 1))
+
+
+def test_dry_run_applies_nothing(empty_dir):
+    assert migrate("sqlite", dry_run=True) == []
+    assert "books" not in tables()
+    assert all(migration["applied_at"] is None for migration in migration_status("sqlite"))
+
+
+def test_fresh_database_gets_every_version_once(empty_dir):
+    assert migrate("sqlite") == VERSIONS
+    assert {"books", "users", "rentals", "rentals_archive", "holds", "schema_migrations"} <= tables()
+    assert all(migration["applied_at"] is not None for migration in migration_status("sqlite"))
+    assert migrate("sqlite") == []
+
+
+def test_later_versions_apply_on_top_of_existing_rows(empty_dir):
+    assert migrate("sqlite", target=4) == [1, 2, 3, 4]
+    conn = sqlite3.connect("library.db")
+    conn.execute("INSERT INTO books (title, author, year, quantity) VALUES ('Dune', 'Herbert', 1965, 1)")
+    conn.execute("INSERT INTO users (full_name, email) VALUES ('Ann', 'ann@example.com')")
+    conn.execute(
+        "INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned) "
+        "VALUES (1, 1, '2026-01-01T00:00:00', '2026-01-15T00:00:00', 0)"
+    )
+    conn.commit()
+    conn.close()
+
+    assert migration_status("sqlite")[4]["applied_at"] is None
+    assert migrate("sqlite") == VERSIONS[4:]
+
+    conn = sqlite3.connect("library.db")
+    try:
+        # m0005 backfilled the snapshots of the rental made before it
+        snapshot = conn.execute("SELECT user_full_name, user_email, book_title, book_author FROM rentals").fetchone()
+        assert snapshot == ("Ann", "ann@example.com", "Dune", "Herbert")
+        # m0002: one active rental per user and book
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute(
+                "INSERT INTO rentals (user_id, book_id, rental_date, due_date, is_returned) "
+                "VALUES (1, 1, '2026-01-02T00:00:00', '2026-01-16T00:00:00', 0)"
+            )
+    finally:
+        conn.close()
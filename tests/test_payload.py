@@ -0,0 +1,92 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.middleware.compression import CompressionMiddleware
+
+MINIMUM_SIZE = 500
+
+
+@pytest.fixture(scope="module")
+def rented(client):
+    """Users 1 and 2 rent books 1 and 2, user 1 also book 3"""
+    for user_id, book_id in ((1, 1), (2, 2), (1, 3)):
+        assert client.post("/simple-rentals/rent", json={"user_id": user_id, "book_id": book_id}).status_code == 200
+    return client
+
+
+def test_fields_keep_only_the_selected_keys(rented):
+    books = rented.get("/simple-books/", params={"fields": "id,title"}).json()
+    assert books[0] == {"id": 1, "title": "Book 1"}
+
+    rentals = rented.get("/simple-rentals/active", params={"fields": "id,user.full_name"}).json()
+    assert len(rentals) == 3
+    assert all(set(rental) == {"id", "user"} and set(rental["user"]) == {"full_name"} for rental in rentals)
+
+
+def test_unknown_field_is_rejected(rented):
+    response = rented.get("/simple-rentals/", params={"fields": "id,isbn"})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Unknown fields: isbn.")
+
+
+def test_normalized_shape_lists_each_reference_once(rented):
+    body = rented.get("/simple-rentals/active", params={"shape": "normalized"}).json()
+    assert len(body["items"]) == 3
+    assert all("user" not in item and "book" not in item for item in body["items"])
+    assert body["users"] == {
+        "1": {"full_name": "User 1", "email": "user1@example.com"},
+        "2": {"full_name": "User 2", "email": "user2@example.com"},
+    }
+    assert set(body["books"]) == {"1", "2", "3"}
+
+
+def test_normalized_shape_with_fields_keeps_ids(rented):
+    body = rented.get(
+        "/simple-rentals/active", params={"shape": "normalized", "fields": "due_date,user.full_name"}
+    ).json()
+    assert set(body) == {"items", "users"}
+    assert all(set(item) == {"due_date", "user_id", "book_id"} for item in body["items"])
+    assert body["users"]["1"] == {"full_name": "User 1"}
+
+
+@pytest.fixture(scope="module")
+def compressing_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=MINIMUM_SIZE)
+
+    @app.get("/items/{count}")
+    def get_items(count: int):
+        return [{"id": i, "title": f"Book {i}"} for i in range(count)]
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_small_response_is_sent_as_is(compressing_client):
+    response = compressing_client.get("/items/2", headers={"Accept-Encoding": "gzip"})
+    assert len(response.content) < MINIMUM_SIZE
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_large_response_is_gzipped(compressing_client):
+    response = compressing_client.get("/items/100", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(json.dumps(response.json()))
+    assert response.json()[99] == {"id": 99, "title": "Book 99"}
+
+
+def test_no_compression_without_accept_encoding(compressing_client):
+    response = compressing_client.get("/items/100", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 100
+
+
+def test_brotli_preferred_when_installed(compressing_client):
+    pytest.importorskip("brotli")
+    response = compressing_client.get("/items/100", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert len(response.json()) == 100
@@ -0,0 +1,49 @@
+import pytest
+
+from src.utils.query_stats import assert_max_queries
+
+# Statements per request on the SQLite hot paths. A change that adds a query
+# (or an N+1 loop in a listing) has to raise the budget here on purpose.
+RENT_BUDGET = 4
+RETURN_BUDGET = 6
+RETURN_TO_HOLD_BUDGET = 9
+LIST_BUDGET = 1
+LIST_ROUTES = [
+    "/simple-books/",
+    "/simple-users/",
+    "/simple-rentals/",
+    "/simple-rentals/active",
+    "/simple-books/1/rentals",
+    "/simple-users/1/rentals",
+]
+
+
+def test_rent_and_return_within_budget(client):
+    with assert_max_queries(RENT_BUDGET, "/simple-rentals/rent"):
+        rental = client.post("/simple-rentals/rent", json={"user_id": 1, "book_id": 1})
+        client.post("/simple-rentals/rent", json={"user_id": 2, "book_id": 2})
+    assert rental.status_code == 200
+
+    with assert_max_queries(RETURN_BUDGET, "/simple-rentals/return") as seen:
+        assert client.post("/simple-rentals/return", json={"rental_id": rental.json()["id"]}).status_code == 200
+        assert client.post("/simple-rentals/return", json={"book_id": 2}).status_code == 200
+    assert len(seen) == 2
+
+
+def test_return_handed_to_hold_within_budget(client):
+    rental = client.post("/simple-rentals/rent", json={"user_id": 3, "book_id": 3}).json()
+    hold = client.post("/simple-rentals/holds", json={"user_id": 4, "book_id": 3, "days_to_return": 7}).json()
+
+    with assert_max_queries(RETURN_TO_HOLD_BUDGET, "/simple-rentals/return"):
+        returned = client.post("/simple-rentals/return", json={"rental_id": rental["id"]}).json()
+    assert returned["handed_to_hold"]["hold_id"] == hold["hold_id"]
+
+
+@pytest.mark.parametrize("path", LIST_ROUTES)
+def test_lists_within_budget_whatever_the_rows(client, path):
+    for user_id, book_id in ((5, 5), (6, 6), (7, 1), (1, 7)):
+        client.post("/simple-rentals/rent", json={"user_id": user_id, "book_id": book_id})
+
+    with assert_max_queries(LIST_BUDGET, path) as seen:
+        assert client.get(path).status_code == 200
+    assert len(seen) == 1
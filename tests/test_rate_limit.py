@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.middleware.admission import AdmissionController, AdmissionMiddleware
+from src.middleware.rate_limit import MemoryBucketStore, RateLimitMiddleware
+from src.middleware.request_context import RequestContextMiddleware
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/books/")
+    def get_books():
+        return []
+
+    @app.get("/hello")
+    def hello():
+        return {"message": "hello"}
+
+    @app.get("/metrics/admission")
+    def metrics():
+        return {}
+
+    return app
+
+
+def test_expensive_routes_get_their_own_small_bucket():
+    app = make_app()
+    app.add_middleware(
+        RateLimitMiddleware, store=MemoryBucketStore(),
+        expensive_rate=0.01, expensive_burst=2, default_rate=0.01, default_burst=5,
+    )
+    app.add_middleware(RequestContextMiddleware)
+
+    with TestClient(app) as client:
+        assert [client.get("/books/").status_code for _ in range(2)] == [200, 200]
+        limited = client.get("/books/")
+        assert limited.status_code == 429
+        assert limited.json() == {"detail": "Too many requests"}
+        assert int(limited.headers["retry-after"]) >= 1
+
+        # Cheap routes draw from the client's default bucket
+        assert client.get("/hello").status_code == 200
+        # Metrics are never limited
+        assert all(client.get("/metrics/admission").status_code == 200 for _ in range(10))
+
+
+def test_buckets_refill_at_the_rate():
+    store = MemoryBucketStore()
+    assert store.take("client|*", rate=20, burst=1) == (True, 0.0)
+    allowed, retry_after = store.take("client|*", rate=20, burst=1)
+    assert not allowed and 0 < retry_after <= 0.05
+    time.sleep(retry_after + 0.01)
+    assert store.take("client|*", rate=20, burst=1)[0]
+
+
+def test_admission_sheds_reads_but_keeps_a_slot_for_rentals():
+    release = threading.Event()
+    started = threading.Event()
+    app = make_app()
+
+    @app.get("/slow")
+    def slow():
+        started.set()
+        release.wait(5)
+        return {}
+
+    @app.post("/rentals/rent")
+    def rent():
+        return {"id": 1}
+
+    controller = AdmissionController(max_concurrent=2, reserved_priority=1, max_wait=0.05)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    with TestClient(app) as client, ThreadPoolExecutor(1) as pool:
+        busy = pool.submit(client.get, "/slow")
+        started.wait(5)
+
+        shed = client.get("/hello")
+        assert shed.status_code == 503
+        assert shed.json() == {"detail": "Server is overloaded, retry later"}
+        assert "retry-after" in shed.headers
+        assert client.post("/rentals/rent").status_code == 200
+
+        release.set()
+        assert busy.result().status_code == 200
+        assert client.get("/hello").status_code == 200
+
+    assert controller.stats()["shed"] == 1
+    assert controller.stats()["in_flight"] == 0
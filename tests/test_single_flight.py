@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.middleware.deadline import DeadlineMiddleware
+from src.utils.single_flight import SingleFlight
+
+WAITERS = 3
+
+
+def wait_until(condition, timeout: float = 5):
+    stop = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < stop, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def load():
+        executions.append(1)
+        release.wait(5)
+        return {"rows": 3}
+
+    with ThreadPoolExecutor(WAITERS + 1) as pool:
+        leader = pool.submit(flight.do, "books", "key", load)
+        wait_until(lambda: executions)
+        waiters = [pool.submit(flight.do, "books", "key", load) for _ in range(WAITERS)]
+        wait_until(lambda: flight.stats()["books"]["coalesced"] == WAITERS)
+        release.set()
+        results = [leader.result()] + [waiter.result() for waiter in waiters]
+
+    assert len(executions) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"books": {"executed": 1, "coalesced": WAITERS}}
+
+
+def test_waiters_get_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def load():
+        started.set()
+        release.wait(5)
+        raise ValueError("database went away")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "books", "key", load)
+        started.wait(5)
+        waiter = pool.submit(flight.do, "books", "key", load)
+        wait_until(lambda: flight.stats()["books"]["coalesced"] == 1)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(ValueError, match="database went away"):
+                future.result()
+
+
+def test_waiter_answers_504_at_its_own_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def load():
+        started.set()
+        release.wait(5)
+        return {"rows": 3}
+
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware, timeout=0.3, report_timeout=0)
+
+    @app.get("/books")
+    def get_books():
+        return flight.do("books", "key", load)
+
+    with TestClient(app) as client, ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(client.get, "/books")
+        started.wait(5)
+        began = time.monotonic()
+        waited = client.get("/books")
+        elapsed = time.monotonic() - began
+        release.set()
+
+        assert waited.status_code == 504
+        assert waited.json() == {"detail": "Request deadline exceeded"}
+        # Bounded by the waiter's deadline, not by the leader still running
+        assert elapsed < 2
+        assert leader.result().json() == {"rows": 3}
@@ -0,0 +1,47 @@
+import csv
+import io
+import sqlite3
+from datetime import datetime
+
+from src.utils.tombstones import compact_tombstones
+
+
+def export_ids(client, table):
+    response = client.get(f"/exports/{table}.csv", params={"backend": "sqlite"})
+    assert response.status_code == 200
+    return {int(row["id"]) for row in csv.DictReader(io.StringIO(response.text))}
+
+
+def test_deleted_users_and_books_disappear_from_reads(client):
+    rental = client.post("/simple-rentals/rent", json={"user_id": 1, "book_id": 1}).json()
+    assert client.delete("/simple-users/1").status_code == 400
+    client.post("/simple-rentals/return", json={"rental_id": rental["id"]})
+    assert client.delete("/simple-users/1").status_code == 200
+    assert client.delete("/simple-users/2").status_code == 200
+    assert client.delete("/simple-users/2").status_code == 404
+
+    conn = sqlite3.connect("library.db")
+    conn.execute("UPDATE books SET deleted_at = ? WHERE id IN (1, 2)", (datetime.now().isoformat(),))
+    conn.commit()
+    conn.close()
+
+    assert client.get("/simple-users/1").status_code == 404
+    assert {user["id"] for user in client.get("/simple-users/").json()}.isdisjoint({1, 2})
+    assert {book["id"] for book in client.get("/simple-books/").json()}.isdisjoint({1, 2})
+    assert export_ids(client, "users").isdisjoint({1, 2})
+    assert export_ids(client, "books").isdisjoint({1, 2})
+    # Their rental history stays readable
+    assert rental["id"] in export_ids(client, "rentals")
+
+
+def test_compaction_keeps_referenced_tombstones(client):
+    assert compact_tombstones("sqlite", retention_days=30) == {"books": 0, "users": 0}
+    # User 1 and book 1 still have a rental pointing at them
+    assert compact_tombstones("sqlite", retention_days=0, batch_size=1) == {"books": 1, "users": 1}
+
+    conn = sqlite3.connect("library.db")
+    try:
+        assert conn.execute("SELECT id FROM users WHERE id IN (1, 2)").fetchall() == [(1,)]
+        assert conn.execute("SELECT id FROM books WHERE id IN (1, 2)").fetchall() == [(1,)]
+    finally:
+        conn.close()